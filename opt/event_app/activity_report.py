@@ -0,0 +1,343 @@
+"""
+Отчет о деятельности: построение запроса по фильтрам и потоковая выгрузка.
+
+Выгрузка читает строки серверным курсором и отдает файл частями, поэтому
+память не растет с числом мероприятий. XLSX пишется без сторонних библиотек:
+zip-архив формируется на лету (записи с дескриптором данных), лист - со
+строками inline, без таблицы общих строк.
+"""
+import csv
+import io
+import json
+import logging
+import os
+import re
+import zipfile
+from datetime import datetime
+from typing import AsyncIterator, Optional
+from xml.sax.saxutils import escape
+
+from database import acquire
+
+
+logger = logging.getLogger(__name__)
+
+REPORT_EXPORT_PREFETCH = int(os.getenv("REPORT_EXPORT_PREFETCH", "1000"))
+# Примерный размер части ответа; меньшие части - лишние системные вызовы
+REPORT_EXPORT_CHUNK_BYTES = 64 * 1024
+# Ограничение формата: 1 048 576 строк на лист, одна занята заголовком
+XLSX_MAX_ROWS = 1048575
+
+REPORT_COLUMNS = [
+    ("id", "ID"),
+    ("name", "Мероприятие"),
+    ("start_date", "Начало"),
+    ("end_date", "Окончание"),
+    ("status", "Статус"),
+    ("age_category", "Возрастная категория"),
+    ("participants", "Участников"),
+    ("event_type", "Тип"),
+    ("room", "Помещение"),
+]
+
+REPORT_QUERY = """
+    SELECT
+        e.id, e.name, e.description,
+        e.start_time, e.end_time, e.max_participants,
+        r.name as room_name, et.name as event_type_name,
+        ac.name as age_category_name, es.name as status_name
+    FROM events e
+    LEFT JOIN resource_bookings rb ON rb.event_id = e.id AND rb.resource_type = 'room'
+    LEFT JOIN rooms r ON r.id = rb.resource_id
+    LEFT JOIN event_types et ON et.id = e.event_type_id
+    LEFT JOIN age_categories ac ON ac.id = e.min_age_category_id
+    LEFT JOIN event_statuses es ON es.id = e.status_id
+    WHERE e.start_time >= $1 AND e.end_time <= $2
+"""
+
+
+def parse_report_period(start_date: str, end_date: str):
+    """Период отчета из формы; ValueError при неверном формате"""
+    if 'T' in start_date:
+        return (
+            datetime.fromisoformat(start_date.replace('T', ' ')),
+            datetime.fromisoformat(end_date.replace('T', ' '))
+        )
+    return (
+        datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S"),
+        datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
+    )
+
+
+def build_report_query(
+    start: datetime,
+    end: datetime,
+    event_id: Optional[str] = None,
+    filter_type: Optional[str] = None,
+    filter_value: Optional[str] = None
+):
+    """Запрос и параметры отчета по фильтрам room, employees, participants, age, status"""
+    query = REPORT_QUERY
+    params = [start, end]
+
+    if event_id and event_id != "all":
+        query += " AND e.id = $3"
+        params.append(int(event_id))
+
+    if filter_type and filter_value and filter_value != "all":
+        param_position = len(params) + 1
+
+        if filter_type == "room":
+            query += f" AND r.id = ${param_position}"
+            params.append(int(filter_value))
+        elif filter_type == "employees":
+            query += f"""
+                AND EXISTS (
+                    SELECT 1 FROM resource_bookings rb2
+                    WHERE rb2.event_id = e.id
+                    AND rb2.resource_type = 'employee'
+                    AND rb2.resource_id = ${param_position}
+                )
+            """
+            params.append(int(filter_value))
+        elif filter_type == "participants":
+            query += f" AND e.max_participants >= ${param_position}"
+            params.append(int(filter_value))
+        elif filter_type == "age":
+            query += f" AND e.min_age_category_id = ${param_position}"
+            params.append(int(filter_value))
+        elif filter_type == "status":
+            query += f" AND e.status_id = ${param_position}"
+            params.append(int(filter_value))
+
+    query += " ORDER BY e.start_time"
+    return query, params
+
+
+def report_row(event) -> dict:
+    """Строка отчета с датами как datetime; для JSON их переводит вызывающий код"""
+    return {
+        "id": event["id"],
+        "name": event["name"],
+        "start_date": event["start_time"],
+        "end_date": event["end_time"],
+        "status": event["status_name"],
+        "age_category": event["age_category_name"],
+        "participants": event["max_participants"],
+        "event_type": event["event_type_name"],
+        "room": event["room_name"]
+    }
+
+
+class CsvWriter:
+    media_type = "text/csv; charset=utf-8"
+    extension = "csv"
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def header(self) -> bytes:
+        # BOM, чтобы Excel открыл кириллицу без выбора кодировки
+        self._writer.writerow([title for _, title in REPORT_COLUMNS])
+        return b"\xef\xbb\xbf" + self._take()
+
+    def row(self, row: dict) -> bytes:
+        self._writer.writerow([
+            row[key].strftime("%Y-%m-%d %H:%M:%S") if isinstance(row[key], datetime) else row[key]
+            for key, _ in REPORT_COLUMNS
+        ])
+        return self._take()
+
+    def footer(self) -> bytes:
+        return b""
+
+    def _take(self) -> bytes:
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+class JsonLinesWriter:
+    media_type = "application/x-ndjson"
+    extension = "jsonl"
+
+    def header(self) -> bytes:
+        return b""
+
+    def row(self, row: dict) -> bytes:
+        return (json.dumps(row, ensure_ascii=False, default=lambda v: v.isoformat()) + "\n").encode("utf-8")
+
+    def footer(self) -> bytes:
+        return b""
+
+
+class _ChunkSink(io.RawIOBase):
+    """Приемник zip-архива без seek: накопленные байты забираются по частям"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+_XLSX_STATIC = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Отчет" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Стиль 1 - дата и время, стиль 2 - полужирный заголовок
+    "xl/styles.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="1"><numFmt numFmtId="164" formatCode="dd.mm.yyyy hh:mm"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="3">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '</cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+
+def _xlsx_cell(value, style: Optional[int] = None) -> str:
+    if value is None:
+        return "<c/>"
+    if isinstance(value, datetime):
+        serial = (value.replace(tzinfo=None) - _EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c s="1"><v>{serial:.10f}</v></c>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_XML_ILLEGAL.sub("", str(value)))
+    style_attr = f' s="{style}"' if style else ""
+    return f'<c t="inlineStr"{style_attr}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+class XlsxWriter:
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    extension = "xlsx"
+
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=zipfile.ZIP_DEFLATED)
+        self._sheet = None
+        self._rows = 0
+
+    def header(self) -> bytes:
+        for name, content in _XLSX_STATIC.items():
+            self._zip.writestr(name, content)
+        # Размер листа заранее неизвестен: zip64 на случай больших отчетов
+        self._sheet = self._zip.open("xl/worksheets/sheet1.xml", "w", force_zip64=True)
+        self._sheet.write((
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<sheetData><row>'
+            + "".join(_xlsx_cell(title, 2) for _, title in REPORT_COLUMNS)
+            + "</row>"
+        ).encode("utf-8"))
+        return self._sink.drain()
+
+    def row(self, row: dict) -> bytes:
+        self._rows += 1
+        if self._rows > XLSX_MAX_ROWS:
+            return b""
+        self._sheet.write(
+            ("<row>" + "".join(_xlsx_cell(row[key]) for key, _ in REPORT_COLUMNS) + "</row>").encode("utf-8")
+        )
+        return self._sink.drain()
+
+    def footer(self) -> bytes:
+        tail = "</sheetData></worksheet>"
+        if self._rows > XLSX_MAX_ROWS:
+            logger.warning("Выгрузка XLSX обрезана до %s строк из %s", XLSX_MAX_ROWS, self._rows)
+        self._sheet.write(tail.encode("utf-8"))
+        self._sheet.close()
+        self._zip.close()
+        return self._sink.drain()
+
+
+EXPORT_WRITERS = {
+    "csv": CsvWriter,
+    "jsonl": JsonLinesWriter,
+    "xlsx": XlsxWriter,
+}
+
+
+async def stream_report(query: str, params: list, writer) -> AsyncIterator[bytes]:
+    """
+    Части файла отчета по мере чтения курсора.
+
+    Соединение берется внутри генератора: соединение запроса к этому моменту
+    уже возвращено в пул, а ответ передается после выхода из обработчика.
+    """
+    pending = [writer.header()]
+    size = len(pending[0])
+    async with acquire() as conn:
+        async with conn.transaction(readonly=True):
+            async for record in conn.cursor(query, *params, prefetch=REPORT_EXPORT_PREFETCH):
+                data = writer.row(report_row(record))
+                if data:
+                    pending.append(data)
+                    size += len(data)
+                if size >= REPORT_EXPORT_CHUNK_BYTES:
+                    yield b"".join(pending)
+                    pending, size = [], 0
+    pending.append(writer.footer())
+    yield b"".join(pending)
@@ -0,0 +1,133 @@
+"""
+Аналитика занятости помещений и сотрудников по суточным агрегатам.
+
+resource_usage_daily поддерживается триггером на resource_bookings
+(миграция 0004), поэтому запрос читает по строке на ресурс и сутки периода
+независимо от числа бронирований. Недельные интервалы складываются из суток.
+"""
+import os
+from datetime import date, timedelta
+from typing import List, Optional
+
+
+# Часы, которые ресурс может быть занят за сутки; от них считается процент загрузки
+ROOM_HOURS_PER_DAY = float(os.getenv("ANALYTICS_ROOM_HOURS_PER_DAY", "12"))
+EMPLOYEE_HOURS_PER_DAY = float(os.getenv("ANALYTICS_EMPLOYEE_HOURS_PER_DAY", "8"))
+ANALYTICS_MAX_DAYS = int(os.getenv("ANALYTICS_MAX_DAYS", "731"))
+
+BUCKETS = ("day", "week")
+
+RESOURCES = {
+    "room": {"table": "rooms", "name": "name", "hours_per_day": ROOM_HOURS_PER_DAY},
+    "employee": {"table": "employees", "name": "full_name", "hours_per_day": EMPLOYEE_HOURS_PER_DAY},
+}
+
+# Таблица и колонка имени берутся из RESOURCES, а не из запроса пользователя
+RESOURCE_LIST_QUERY = """
+    SELECT id, {name} AS name, is_external FROM {table}
+    WHERE $1::int[] IS NULL OR id = ANY($1::int[])
+"""
+
+USAGE_QUERY = """
+    SELECT resource_id,
+           date_trunc($4, day::timestamp)::date AS bucket,
+           SUM(booked_seconds) AS booked_seconds,
+           SUM(bookings) AS bookings
+    FROM resource_usage_daily
+    WHERE resource_type = $1 AND day >= $2 AND day < $3
+      AND ($5::int[] IS NULL OR resource_id = ANY($5::int[]))
+    GROUP BY resource_id, bucket
+    ORDER BY resource_id, bucket
+"""
+
+
+def _bucket_days(bucket: str, bucket_start: date, start: date, end: date) -> int:
+    """Число суток интервала внутри запрошенного периода (крайние недели неполные)"""
+    bucket_end = bucket_start + timedelta(days=1 if bucket == "day" else 7)
+    return (min(bucket_end, end) - max(bucket_start, start)).days
+
+
+async def resource_usage(
+    conn,
+    resource_type: str,
+    start: date,
+    end: date,
+    bucket: str = "day",
+    resource_ids: Optional[List[int]] = None
+) -> dict:
+    """
+    Часы занятости и процент загрузки по интервалам для каждого ресурса.
+
+    Период полуоткрытый: [start, end). Ресурсы без бронирований в периоде
+    попадают в ответ с нулевой загрузкой.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f"Неизвестный интервал: {bucket}")
+    if end <= start:
+        raise ValueError("Дата окончания должна быть позже даты начала")
+    if (end - start).days > ANALYTICS_MAX_DAYS:
+        raise ValueError(f"Период не может быть длиннее {ANALYTICS_MAX_DAYS} дней")
+
+    resource = RESOURCES[resource_type]
+    hours_per_day = resource["hours_per_day"]
+    period_hours = (end - start).days * hours_per_day
+
+    rows = await conn.fetch(USAGE_QUERY, resource_type, start, end, bucket, resource_ids)
+
+    buckets = {}
+    for r in rows:
+        available = _bucket_days(bucket, r["bucket"], start, end) * hours_per_day
+        booked = r["booked_seconds"] / 3600
+        buckets.setdefault(r["resource_id"], []).append({
+            "bucket_start": r["bucket"].isoformat(),
+            "booked_hours": round(booked, 2),
+            "bookings": r["bookings"],
+            "utilization": round(booked / available * 100, 1) if available else 0.0,
+        })
+
+    items = []
+    records = await conn.fetch(
+        RESOURCE_LIST_QUERY.format(table=resource["table"], name=resource["name"]), resource_ids
+    )
+    for record in records:
+        series = buckets.get(record["id"], [])
+        booked_total = sum(b["booked_hours"] for b in series)
+        items.append({
+            "id": record["id"],
+            "name": record["name"],
+            "is_external": bool(record["is_external"]),
+            "booked_hours": round(booked_total, 2),
+            "utilization": round(booked_total / period_hours * 100, 1) if period_hours else 0.0,
+            "buckets": series,
+        })
+    items.sort(key=lambda item: (-item["utilization"], item["name"]))
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "bucket": bucket,
+        "hours_per_day": hours_per_day,
+        "items": items,
+    }
+
+
+async def rebuild_usage(conn) -> int:
+    """
+    Пересчет агрегатов по всем бронированиям одним запросом (после ручных
+    правок в обход триггера или массовой загрузки с отключенными триггерами)
+    """
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE resource_bookings IN SHARE MODE")
+        await conn.execute("TRUNCATE resource_usage_daily")
+        await conn.execute(
+            """
+            INSERT INTO resource_usage_daily (resource_type, resource_id, day, booked_seconds, bookings)
+            SELECT b.resource_type, b.resource_id, d::date,
+                   SUM(EXTRACT(EPOCH FROM LEAST(b.end_time, d + INTERVAL '1 day') - GREATEST(b.start_time, d))::BIGINT),
+                   COUNT(*)
+            FROM resource_bookings b,
+                 generate_series(date_trunc('day', b.start_time), b.end_time - INTERVAL '1 microsecond', INTERVAL '1 day') AS d
+            GROUP BY 1, 2, 3
+            """
+        )
+        return await conn.fetchval("SELECT COUNT(*) FROM resource_usage_daily")
@@ -0,0 +1,223 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+
+AVAILABILITY_CACHE_TTL = float(os.getenv("AVAILABILITY_CACHE_TTL", "30"))
+# Насколько глубоко в прошлое загружаются бронирования; более ранние окна проверяются запросом к БД
+AVAILABILITY_LOOKBACK_DAYS = int(os.getenv("AVAILABILITY_LOOKBACK_DAYS", "1"))
+
+RESOURCE_TYPES = ("room", "employee")
+
+
+class BookingIndex:
+    """
+    Интервалы занятости ресурсов одного типа: resource_id -> отсортированные интервалы.
+
+    Ограничение исключения на resource_bookings гарантирует, что бронирования
+    одного ресурса не пересекаются, поэтому отсортированного по началу массива
+    достаточно: пересечь окно может только последний интервал, начавшийся до
+    конца окна. Проверка занятости - один bisect.
+    """
+
+    def __init__(self):
+        self._starts = {}
+        self._ends = {}
+        self.size = 0
+
+    @classmethod
+    def build(cls, rows):
+        index = cls()
+        intervals = {}
+        for r in rows:
+            intervals.setdefault(r["resource_id"], []).append((r["start_time"], r["end_time"]))
+        for resource_id, items in intervals.items():
+            items.sort()
+            index._starts[resource_id] = [s for s, _ in items]
+            index._ends[resource_id] = [e for _, e in items]
+            index.size += len(items)
+        return index
+
+    def add(self, resource_id: int, start: datetime, end: datetime):
+        """Добавление интервала; вызывающий сам проверяет, что ресурс свободен"""
+        starts = self._starts.setdefault(resource_id, [])
+        ends = self._ends.setdefault(resource_id, [])
+        i = bisect_left(starts, start)
+        starts.insert(i, start)
+        ends.insert(i, end)
+        self.size += 1
+
+    def is_busy(self, resource_id: int, start: datetime, end: datetime) -> bool:
+        starts = self._starts.get(resource_id)
+        if not starts:
+            return False
+        i = bisect_left(starts, end) - 1
+        return i >= 0 and self._ends[resource_id][i] > start
+
+    def count_between(self, resource_id: int, start: datetime, end: datetime) -> int:
+        """Число бронирований, начинающихся в [start, end)"""
+        starts = self._starts.get(resource_id)
+        if not starts:
+            return 0
+        return bisect_left(starts, end) - bisect_left(starts, start)
+
+
+class AvailabilityCache:
+    """Кэш индексов занятости, перестраивается после изменения бронирований или по TTL"""
+
+    def __init__(self, ttl: float = AVAILABILITY_CACHE_TTL, lookback_days: int = AVAILABILITY_LOOKBACK_DAYS):
+        self.ttl = ttl
+        self.lookback = timedelta(days=lookback_days)
+        self._indexes = None
+        self._loaded_at = 0.0
+        self.loaded_from: Optional[datetime] = None
+        self.version = 0
+        self.rebuilds = 0
+        self.last_build_ms = 0.0
+        self._lock = asyncio.Lock()
+
+    def _fresh(self) -> bool:
+        return self._indexes is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def indexes(self, conn) -> dict:
+        if self._fresh():
+            return self._indexes
+        async with self._lock:
+            if not self._fresh():
+                await self._rebuild(conn)
+            return self._indexes
+
+    async def _rebuild(self, conn):
+        started = time.perf_counter()
+        loaded_from = datetime.now() - self.lookback
+        rows = await conn.fetch(
+            """SELECT resource_type, resource_id, start_time, end_time
+               FROM resource_bookings
+               WHERE end_time > $1""",
+            loaded_from
+        )
+        by_type = {resource_type: [] for resource_type in RESOURCE_TYPES}
+        for r in rows:
+            by_type.setdefault(r["resource_type"], []).append(r)
+
+        self._indexes = {t: BookingIndex.build(items) for t, items in by_type.items()}
+        self.loaded_from = loaded_from
+        self._loaded_at = time.monotonic()
+        self.version += 1
+        self.rebuilds += 1
+        self.last_build_ms = (time.perf_counter() - started) * 1000
+
+    def covers(self, start: datetime) -> bool:
+        return self.loaded_from is not None and start >= self.loaded_from
+
+    def invalidate(self):
+        """Сброс после записи в resource_bookings; окончательную проверку всё равно делает GiST-ограничение"""
+        self._indexes = None
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self._indexes is not None,
+            "loaded_from": self.loaded_from.isoformat() if self.loaded_from else None,
+            "bookings": {t: i.size for t, i in (self._indexes or {}).items()},
+            "version": self.version,
+            "rebuilds": self.rebuilds,
+            "last_build_ms": round(self.last_build_ms, 2),
+            "ttl": self.ttl,
+        }
+
+
+availability_cache = AvailabilityCache()
+
+
+async def _busy_from_db(conn, start: datetime, end: datetime) -> dict:
+    """Занятые ресурсы для окна вне загруженного горизонта (через GiST-индекс ограничения)"""
+    rows = await conn.fetch(
+        """SELECT DISTINCT resource_type, resource_id
+           FROM resource_bookings
+           WHERE tsrange(start_time, end_time) && tsrange($1, $2)""",
+        start, end
+    )
+    busy = {resource_type: set() for resource_type in RESOURCE_TYPES}
+    for r in rows:
+        busy.setdefault(r["resource_type"], set()).add(r["resource_id"])
+    return busy
+
+
+async def find_available(
+    conn,
+    start: datetime,
+    end: datetime,
+    capacity: Optional[int] = None,
+    room_type_id: Optional[int] = None,
+    position_ids: Optional[Iterable[int]] = None
+) -> dict:
+    """
+    Свободные помещения и сотрудники на интервал [start, end).
+
+    Помещения упорядочены так: сначала внутренние, затем с наименьшим
+    запасом вместимости. Сотрудники: сначала внутренние, затем наименее
+    загруженные в этот день.
+    """
+    if end <= start:
+        raise ValueError("Дата окончания должна быть позже даты начала")
+
+    # Фильтры по вместимости, типу и должности - в запросе: ресурсов могут быть тысячи
+    rooms = await conn.fetch(
+        """SELECT id, name, address, capacity, room_type_id, is_external FROM rooms
+           WHERE ($1::int IS NULL OR capacity >= $1)
+             AND ($2::int IS NULL OR room_type_id = $2)""",
+        capacity, room_type_id
+    )
+    position_ids = list(set(position_ids or ()))
+    employees = await conn.fetch(
+        """SELECT id, full_name, position_id, position, is_external FROM employees
+           WHERE cardinality($1::int[]) = 0 OR position_id = ANY($1::int[])""",
+        position_ids
+    )
+
+    indexes = await availability_cache.indexes(conn)
+    if availability_cache.covers(start):
+        room_index, employee_index = indexes["room"], indexes["employee"]
+        room_busy = lambda rid: room_index.is_busy(rid, start, end)
+        employee_busy = lambda eid: employee_index.is_busy(eid, start, end)
+        day_start = datetime.combine(start.date(), datetime.min.time())
+        day_load = lambda eid: employee_index.count_between(eid, day_start, day_start + timedelta(days=1))
+    else:
+        busy = await _busy_from_db(conn, start, end)
+        room_busy = lambda rid: rid in busy["room"]
+        employee_busy = lambda eid: eid in busy["employee"]
+        day_load = lambda eid: 0
+
+    free_rooms = []
+    for room in rooms:
+        if room_busy(room["id"]):
+            continue
+        free_rooms.append({
+            "id": room["id"],
+            "name": room["name"],
+            "address": room["address"],
+            "capacity": room["capacity"],
+            "room_type_id": room["room_type_id"],
+            "is_external": bool(room["is_external"]),
+            "spare_capacity": room["capacity"] - capacity if capacity is not None else None,
+        })
+    free_rooms.sort(key=lambda r: (r["is_external"], r["spare_capacity"] or 0, r["capacity"], r["name"]))
+
+    free_employees = []
+    for employee in employees:
+        if employee_busy(employee["id"]):
+            continue
+        free_employees.append({
+            "id": employee["id"],
+            "full_name": employee["full_name"],
+            "position_id": employee["position_id"],
+            "position": employee["position"],
+            "is_external": bool(employee["is_external"]),
+            "day_load": day_load(employee["id"]),
+        })
+    free_employees.sort(key=lambda e: (e["is_external"], e["day_load"], e["full_name"]))
+
+    return {"rooms": free_rooms, "employees": free_employees}
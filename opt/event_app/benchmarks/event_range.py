@@ -0,0 +1,138 @@
+"""
+Сравнение планов и времени выполнения диапазонных запросов по мероприятиям
+до и после перехода на sargable-фильтр и индексы.
+
+Данные генерируются в отдельной схеме, рабочие таблицы не затрагиваются:
+    python benchmarks/event_range.py --events 1000000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SCHEMA = "bench_event_range"
+
+QUERIES = {
+    "date_filter_before": (
+        "SELECT e.id FROM events e "
+        "WHERE DATE(e.start_time) <= $1::date AND DATE(e.end_time) >= $1::date "
+        "ORDER BY e.start_time",
+        lambda day: [day],
+    ),
+    "date_filter_after": (
+        "SELECT e.id FROM events e "
+        "WHERE e.start_time < $2 AND e.end_time >= $1 "
+        "ORDER BY e.start_time",
+        lambda day: [day, day + timedelta(days=1)],
+    ),
+    "upcoming_events": (
+        "SELECT e.id FROM events e WHERE e.start_time > $1 ORDER BY e.start_time LIMIT 3",
+        lambda day: [day],
+    ),
+    "activity_report": (
+        "SELECT e.id FROM events e "
+        "LEFT JOIN resource_bookings rb ON rb.event_id = e.id AND rb.resource_type = 'room' "
+        "WHERE e.start_time >= $1 AND e.end_time <= $2 ORDER BY e.start_time",
+        lambda day: [day, day + timedelta(days=30)],
+    ),
+}
+
+INDEXES = [
+    "CREATE INDEX ON events (start_time, id)",
+    "CREATE INDEX ON events (end_time)",
+    "CREATE INDEX ON resource_bookings (event_id, resource_type)",
+]
+
+
+async def prepare(conn, events_count: int):
+    """Синтетические мероприятия длительностью до трех суток за ~10 лет"""
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {SCHEMA}")
+    await conn.execute(f"SET search_path TO {SCHEMA}")
+    await conn.execute("""
+        CREATE TABLE events (
+            id SERIAL PRIMARY KEY,
+            start_time TIMESTAMP NOT NULL,
+            end_time TIMESTAMP NOT NULL
+        );
+        CREATE TABLE resource_bookings (
+            id SERIAL PRIMARY KEY,
+            event_id INT NOT NULL,
+            resource_type VARCHAR(10) NOT NULL,
+            resource_id INT NOT NULL
+        );
+    """)
+    started = time.perf_counter()
+    await conn.execute("""
+        INSERT INTO events (start_time, end_time)
+        SELECT s, s + (random() * interval '72 hours') + interval '1 hour'
+        FROM (
+            SELECT timestamp '2020-01-01' + random() * interval '3650 days' AS s
+            FROM generate_series(1, $1)
+        ) t
+    """, events_count)
+    await conn.execute("""
+        INSERT INTO resource_bookings (event_id, resource_type, resource_id)
+        SELECT id, 'room', 1 + (id % 500) FROM events
+        UNION ALL
+        SELECT id, 'employee', 1 + (id % 2000) FROM events
+    """)
+    await conn.execute("ANALYZE events; ANALYZE resource_bookings")
+    print(f"Сгенерировано {events_count} мероприятий за {time.perf_counter() - started:.1f} с")
+
+
+async def measure(conn, title: str, day: datetime, repeats: int):
+    print(f"\n=== {title} ===")
+    for name, (sql, make_params) in QUERIES.items():
+        params = make_params(day)
+        plan = await conn.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", *params)
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            await conn.fetch(sql, *params)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"\n-- {name}: median {statistics.median(timings):.2f} ms, "
+              f"max {max(timings):.2f} ms")
+        for row in plan:
+            print("   " + row[0])
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="не удалять схему после прогона")
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError("DATABASE_URL environment variable is not set")
+    database_url = database_url.replace("postgresql+asyncpg://", "postgres://")
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        await prepare(conn, args.events)
+        day = datetime(2024, 6, 15)
+
+        await measure(conn, "Без индексов", day, args.repeats)
+
+        for sql in INDEXES:
+            await conn.execute(sql)
+        await conn.execute("ANALYZE events; ANALYZE resource_bookings")
+
+        await measure(conn, "С индексами", day, args.repeats)
+    finally:
+        if not args.keep:
+            await conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,124 @@
+"""
+Задержка /events во время всплеска входов в систему.
+
+Параллельно с N потоками, которые непрерывно отправляют /login (bcrypt на
+каждый запрос), один поток замеряет время ответа /events. Для сравнения
+"до" и "после" сервер запускается дважды:
+
+    PASSWORD_HASH_EXECUTOR=inline uvicorn main:app --port 8000   # bcrypt в цикле событий
+    uvicorn main:app --port 8000                                 # bcrypt в пуле потоков
+
+    python benchmarks/login_storm.py --url http://127.0.0.1:8000 --logins 50
+"""
+import argparse
+import http.client
+import threading
+import time
+from urllib.parse import urlencode, urlparse
+
+ADMIN_USERNAME = "admin@eventsystem.com"
+ADMIN_PASSWORD = "admin123"
+
+
+def _connection(url):
+    parsed = urlparse(url)
+    return http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=60)
+
+
+def _post_login(conn, username, password):
+    body = urlencode({"username": username, "password": password})
+    conn.request("POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"})
+    response = conn.getresponse()
+    response.read()
+    return response
+
+
+def login_session(url) -> str:
+    conn = _connection(url)
+    try:
+        response = _post_login(conn, ADMIN_USERNAME, ADMIN_PASSWORD)
+        cookie = response.getheader("set-cookie") or ""
+        for part in cookie.split(";"):
+            if part.strip().startswith("session_token="):
+                return part.strip()
+        raise RuntimeError(f"Не удалось войти: HTTP {response.status}")
+    finally:
+        conn.close()
+
+
+def storm(url, stop: threading.Event, counter: list):
+    """Неверный пароль существующего пользователя: bcrypt выполняется, сессия не создается"""
+    conn = _connection(url)
+    try:
+        while not stop.is_set():
+            _post_login(conn, ADMIN_USERNAME, "wrong-password")
+            counter[0] += 1
+    finally:
+        conn.close()
+
+
+def probe(url, cookie, duration, interval) -> list:
+    conn = _connection(url)
+    timings = []
+    deadline = time.perf_counter() + duration
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            conn.request("GET", "/events", headers={"Cookie": cookie})
+            conn.getresponse().read()
+            timings.append((time.perf_counter() - started) * 1000)
+            time.sleep(interval)
+    finally:
+        conn.close()
+    return timings
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(title, timings):
+    print(f"{title}: n={len(timings)} "
+          f"p50={percentile(timings, 50):.1f} ms "
+          f"p95={percentile(timings, 95):.1f} ms "
+          f"p99={percentile(timings, 99):.1f} ms "
+          f"max={max(timings):.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--logins", type=int, default=50, help="число параллельных потоков входа")
+    parser.add_argument("--duration", type=float, default=20.0, help="длительность замера, с")
+    parser.add_argument("--interval", type=float, default=0.05, help="пауза между запросами /events, с")
+    args = parser.parse_args()
+
+    cookie = login_session(args.url)
+
+    report("Без нагрузки", probe(args.url, cookie, min(5.0, args.duration), args.interval))
+
+    stop = threading.Event()
+    counter = [0]
+    workers = [
+        threading.Thread(target=storm, args=(args.url, stop, counter), daemon=True)
+        for _ in range(args.logins)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        started = time.perf_counter()
+        timings = probe(args.url, cookie, args.duration, args.interval)
+        elapsed = time.perf_counter() - started
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=60)
+
+    report(f"Во время {args.logins} параллельных входов", timings)
+    print(f"Обработано входов: {counter[0]} ({counter[0] / elapsed:.1f}/с)")
+
+
+if __name__ == "__main__":
+    main()
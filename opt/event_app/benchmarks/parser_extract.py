@@ -0,0 +1,82 @@
+"""
+Скорость извлечения данных из сохраненных страниц flamp и hh по движкам разбора.
+
+Корпус - каталог с HTML-файлами, имя которых начинается с flamp или hh
+(по умолчанию parsers/fixtures). "html.parser (полное дерево)" - прежний
+способ: BeautifulSoup строит дерево всей страницы без SoupStrainer.
+
+    python benchmarks/parser_extract.py --corpus /path/to/pages --seconds 3
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from parsers.extract import Source, available_backends, extract, get_backend  # noqa: E402
+from parsers.flamp_parser import FLAMP_VENUE  # noqa: E402
+from parsers.hh_parser import HH_RESUME  # noqa: E402
+
+SOURCES = {"flamp": FLAMP_VENUE, "hh": HH_RESUME}
+
+
+def load_corpus(directory: Path) -> dict:
+    corpus = {prefix: [] for prefix in SOURCES}
+    for path in sorted(directory.glob("*.html")):
+        for prefix in SOURCES:
+            if path.name.startswith(prefix):
+                corpus[prefix].append(path.read_text(encoding="utf-8"))
+    return corpus
+
+
+def without_strainer(source: Source) -> Source:
+    return Source(
+        name=f"{source.name}_full",
+        fields=source.fields,
+        root=source.root,
+        finalize=source.finalize
+    )
+
+
+def pages_per_second(source: Source, pages: list, backend, seconds: float) -> float:
+    processed = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        for html in pages:
+            extract(source, html, "bench", backend)
+        processed += len(pages)
+    return processed / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--corpus", type=Path,
+        default=Path(__file__).resolve().parent.parent / "parsers" / "fixtures"
+    )
+    parser.add_argument("--seconds", type=float, default=2.0, help="длительность замера на движок")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    backends = available_backends()
+    print(f"Корпус: {args.corpus} ({', '.join(f'{k}: {len(v)}' for k, v in corpus.items())})")
+    print(f"Доступные движки: {', '.join(backends)}\n")
+
+    for prefix, source in SOURCES.items():
+        pages = corpus[prefix]
+        if not pages:
+            continue
+        print(f"== {prefix} ==")
+        runs = [(name, source, get_backend(name)) for name in backends]
+        if "html.parser" in backends:
+            runs.append(("html.parser (полное дерево)", without_strainer(source), get_backend("html.parser")))
+        for title, run_source, backend in runs:
+            rate = pages_per_second(run_source, pages, backend, args.seconds)
+            print(f"  {title:28} {rate:10.1f} стр/с")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+from datetime import datetime
+from typing import Iterable, Optional
+
+
+BOOKED = "booked"
+ALREADY_BOOKED = "already_booked"
+CONFLICT = "conflict"
+
+RESOURCE_LABELS = {"room": "помещение", "employee": "сотрудник"}
+
+
+class BookingConflictError(Exception):
+    """Хотя бы один ресурс не удалось забронировать; транзакция откатывается"""
+
+    def __init__(self, results: list):
+        super().__init__(describe_conflicts(results))
+        self.results = results
+
+
+async def find_conflicts(
+    conn,
+    resource_type: str,
+    resource_ids: Iterable[int],
+    start_time: datetime,
+    end_time: datetime,
+    exclude_event_id: Optional[int] = None
+) -> dict:
+    """Пересекающиеся по времени бронирования ресурсов: resource_id -> мероприятие"""
+    rows = await conn.fetch(
+        """SELECT DISTINCT ON (rb.resource_id) rb.resource_id, e.id AS event_id, e.name AS event_name
+           FROM resource_bookings rb
+           JOIN events e ON e.id = rb.event_id
+           WHERE rb.resource_type = $1
+             AND rb.resource_id = ANY($2::int[])
+             AND tsrange(rb.start_time, rb.end_time) && tsrange($3, $4)
+             AND ($5::int IS NULL OR rb.event_id <> $5)
+           ORDER BY rb.resource_id, rb.start_time""",
+        resource_type, list(resource_ids), start_time, end_time, exclude_event_id
+    )
+    return {r["resource_id"]: {"event_id": r["event_id"], "event_name": r["event_name"]} for r in rows}
+
+
+async def book_resources(
+    conn,
+    event_id: int,
+    resource_type: str,
+    resource_ids: Iterable[int],
+    start_time: datetime,
+    end_time: datetime
+) -> list:
+    """
+    Бронирование набора ресурсов одним запросом в транзакции.
+
+    Возвращает результат по каждому ресурсу: забронирован, уже был забронирован
+    на это мероприятие или пересекается с другим мероприятием.
+
+    Кэш доступности сбрасывает вызывающий код после фиксации внешней транзакции
+    (booked_any): иначе параллельный запрос заполнит кэш по старому снимку.
+    """
+    resource_ids = list(dict.fromkeys(resource_ids))
+    if not resource_ids:
+        return []
+
+    async with conn.transaction():
+        already_booked = {
+            r["resource_id"] for r in await conn.fetch(
+                """SELECT resource_id FROM resource_bookings
+                   WHERE event_id = $1 AND resource_type = $2 AND resource_id = ANY($3::int[])""",
+                event_id, resource_type, resource_ids
+            )
+        }
+        conflicts = await find_conflicts(
+            conn, resource_type, resource_ids, start_time, end_time, exclude_event_id=event_id
+        )
+        to_insert = [rid for rid in resource_ids if rid not in already_booked and rid not in conflicts]
+
+        inserted = set()
+        if to_insert:
+            # ON CONFLICT DO NOTHING также перехватывает ограничение исключения,
+            # если параллельный запрос успел занять ресурс между проверкой и вставкой
+            inserted = {
+                r["resource_id"] for r in await conn.fetch(
+                    """INSERT INTO resource_bookings (event_id, resource_type, resource_id, start_time, end_time)
+                       SELECT $1, $2, rid, $4, $5 FROM unnest($3::int[]) AS rid
+                       ON CONFLICT DO NOTHING
+                       RETURNING resource_id""",
+                    event_id, resource_type, to_insert, start_time, end_time
+                )
+            }
+
+    results = []
+    for rid in resource_ids:
+        result = {"resource_type": resource_type, "resource_id": rid, "status": BOOKED}
+        if rid in already_booked:
+            result["status"] = ALREADY_BOOKED
+        elif rid in conflicts:
+            result.update(status=CONFLICT, **conflicts[rid])
+        elif rid not in inserted:
+            result.update(status=CONFLICT, event_id=None, event_name=None)
+        results.append(result)
+    return results
+
+
+async def book_employees(conn, event_id: int, employee_ids: Iterable[int],
+                         start_time: datetime, end_time: datetime) -> list:
+    return await book_resources(conn, event_id, 'employee', employee_ids, start_time, end_time)
+
+
+def booked_any(results: list) -> bool:
+    return any(r["status"] == BOOKED for r in results)
+
+
+def has_conflicts(results: list) -> bool:
+    return any(r["status"] == CONFLICT for r in results)
+
+
+def describe_conflicts(results: list) -> str:
+    """Человекочитаемый список конфликтов для вывода организатору"""
+    messages = []
+    for r in results:
+        if r["status"] != CONFLICT:
+            continue
+        label = RESOURCE_LABELS.get(r["resource_type"], "ресурс")
+        if r.get("event_name"):
+            messages.append(f"{label} #{r['resource_id']} занят мероприятием «{r['event_name']}» (#{r['event_id']})")
+        else:
+            messages.append(f"{label} #{r['resource_id']} занят в это время")
+    return "; ".join(messages)
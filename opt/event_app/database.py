@@ -1,7 +1,13 @@
 import asyncpg
 from fastapi import HTTPException
 import os
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
 from dotenv import load_dotenv
+from metrics import observe_query
+from query_profiler import slow_queries, wrap_connection
 
 
 load_dotenv()
@@ -12,9 +18,122 @@ if not DATABASE_URL:
 
 DATABASE_URL = DATABASE_URL.replace("postgresql+asyncpg://", "postgres://")
 
-async def get_connection():
+# Настройки пула соединений
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300"))
+ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "10"))
+
+# Границы гистограммы времени ожидания соединения, в секундах
+ACQUIRE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+pool: Optional[asyncpg.Pool] = None
+
+_acquire_stats = {
+    "waiters": 0,
+    "acquired_total": 0,
+    "timeouts_total": 0,
+    "latency_sum": 0.0,
+    "latency_buckets": [0] * (len(ACQUIRE_BUCKETS) + 1),
+}
+
+
+async def _init_connection(conn):
+    """Настройка нового соединения пула: учет времени запросов для метрик и журнал медленных запросов"""
+    conn.add_query_logger(observe_query)
+    conn.add_query_logger(slow_queries.observe)
+
+
+async def init_pool():
+    """Создание пула соединений приложения"""
+    global pool
+    if pool is not None:
+        return pool
+    pool = await asyncpg.create_pool(
+        DATABASE_URL,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        statement_cache_size=STATEMENT_CACHE_SIZE,
+        max_inactive_connection_lifetime=MAX_INACTIVE_LIFETIME,
+        init=_init_connection,
+    )
+    return pool
+
+
+async def close_pool():
+    """Закрытие пула соединений"""
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+
+
+def _observe_acquire(elapsed: float):
+    _acquire_stats["acquired_total"] += 1
+    _acquire_stats["latency_sum"] += elapsed
+    for i, bound in enumerate(ACQUIRE_BUCKETS):
+        if elapsed <= bound:
+            _acquire_stats["latency_buckets"][i] += 1
+            return
+    _acquire_stats["latency_buckets"][-1] += 1
+
+
+@asynccontextmanager
+async def acquire():
+    """Получение соединения из пула с учетом метрик ожидания"""
+    if pool is None:
+        raise HTTPException(status_code=500, detail="Database pool is not initialized")
+
+    started = time.perf_counter()
+    _acquire_stats["waiters"] += 1
     try:
-        conn = await asyncpg.connect(DATABASE_URL)
-        return conn
+        conn = await pool.acquire(timeout=ACQUIRE_TIMEOUT)
+    except asyncio.TimeoutError:
+        _acquire_stats["timeouts_total"] += 1
+        raise HTTPException(status_code=503, detail="Database pool exhausted")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
+    finally:
+        _acquire_stats["waiters"] -= 1
+    _observe_acquire(time.perf_counter() - started)
+
+    try:
+        yield wrap_connection(conn)
+    finally:
+        await pool.release(conn)
+
+
+async def get_db():
+    """Зависимость FastAPI: соединение из пула на время запроса"""
+    async with acquire() as conn:
+        yield conn
+
+
+def pool_stats():
+    """Текущее состояние пула и гистограмма ожидания соединений"""
+    size = pool.get_size() if pool is not None else 0
+    idle = pool.get_idle_size() if pool is not None else 0
+
+    buckets = {}
+    cumulative = 0
+    for bound, count in zip(ACQUIRE_BUCKETS, _acquire_stats["latency_buckets"]):
+        cumulative += count
+        buckets[str(bound)] = cumulative
+    buckets["+Inf"] = cumulative + _acquire_stats["latency_buckets"][-1]
+
+    return {
+        "min_size": POOL_MIN_SIZE,
+        "max_size": POOL_MAX_SIZE,
+        "size": size,
+        "in_use": size - idle,
+        "idle": idle,
+        "waiters": _acquire_stats["waiters"],
+        "acquired_total": _acquire_stats["acquired_total"],
+        "timeouts_total": _acquire_stats["timeouts_total"],
+        "acquire_latency": {
+            "sum": _acquire_stats["latency_sum"],
+            "count": _acquire_stats["acquired_total"],
+            "buckets": buckets,
+        },
+    }
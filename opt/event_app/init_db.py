@@ -3,19 +3,30 @@ import os
 from pathlib import Path
 from dotenv import load_dotenv
 import asyncio
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 import random
+import argparse
+import migrate
+from analytics import rebuild_usage
+from passwords import get_password_hash
 
 load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 async def drop_tables(conn):
     """Удаление всех таблиц в базе данных"""
     try:
         await conn.execute("""
+            DROP TABLE IF EXISTS schema_migrations CASCADE;
+            DROP TABLE IF EXISTS sync_jobs CASCADE;
+            DROP TABLE IF EXISTS resource_usage_daily CASCADE;
+            DROP TABLE IF EXISTS password_reset_tokens CASCADE;
+            DROP TABLE IF EXISTS user_sessions CASCADE;
+            DROP TABLE IF EXISTS event_participants CASCADE;
+            DROP TABLE IF EXISTS event_contractors CASCADE;
+            DROP TABLE IF EXISTS event_report_invalidations CASCADE;
+            DROP TABLE IF EXISTS event_reports CASCADE;
             DROP TABLE IF EXISTS resource_bookings CASCADE;
+            DROP TABLE IF EXISTS external_contractors CASCADE;
             DROP TABLE IF EXISTS user_roles CASCADE;
             DROP TABLE IF EXISTS events CASCADE;
             DROP TABLE IF EXISTS rooms CASCADE;
@@ -33,7 +44,7 @@ async def drop_tables(conn):
         print(f"Error dropping tables: {e}")
         raise
 
-async def init_db(recreate=False):
+async def init_db(recreate=False, scale=None):
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         raise ValueError("DATABASE_URL environment variable is not set")
@@ -46,14 +57,18 @@ async def init_db(recreate=False):
         if recreate:
             await drop_tables(conn)
         
-        sql_path = Path(__file__).parent / "sql" / "schema.sql"
-        with open(sql_path, encoding='utf-8') as f:
-            sql = f.read()
-        
-        await conn.execute(sql)
+        applied = await migrate.upgrade(conn)
         print("Database schema initialized successfully")
         
-        await add_test_data(conn)
+        # В rooms, employees и events нет уникальных ключей: повторное заполнение
+        # на существующей БД продублировало бы демонстрационные данные
+        if any(migration.version == 1 for migration in applied):
+            await add_test_data(conn)
+        else:
+            print("Schema already existed, test data not added")
+        
+        if scale:
+            await add_synthetic_data(conn, **scale)
         
     except Exception as e:
         print(f"Error initializing database: {e}")
@@ -66,327 +81,453 @@ async def add_test_data(conn):
     print("Adding test data...")
     
     try:
-        # Добавляем должности
-        positions_data = [
-            'Менеджер проектов',
-            'Дизайнер мероприятий',
-            'IT-специалист',
-            'Координатор мероприятий',
-            'Консультант по UX',
-            'Тренер по agile',
-            'Архитектор решений',
-            'Фотограф',
-            'Видеооператор',
-            'Ведущий мероприятий',
-            'Звукорежиссер',
-            'Декоратор',
-            'Администратор',
-            'Охранник',
-            'Уборщик',
-            'Технический специалист',
-            'Маркетолог',
-            'Бухгалтер',
-            'Юрист',
-            'HR-менеджер'
-        ]
+        async with conn.transaction():
+            await _add_test_data(conn)
+        print("Test data added successfully")
+    except Exception as e:
+        print(f"Error adding test data: {e}")
+        raise
+
+async def fetch_name_map(conn, table: str, column: str = "name") -> dict:
+    """Словарь имя -> id для таблицы, загружается одним запросом"""
+    rows = await conn.fetch(f"SELECT id, {column} AS key FROM {table}")
+    return {r["key"]: r["id"] for r in rows}
+
+async def hash_passwords(passwords) -> dict:
+    """bcrypt-хэши различных паролей, вычисленные параллельно в пуле потоков"""
+    unique = sorted(set(passwords))
+    hashes = await asyncio.gather(*(get_password_hash(p) for p in unique))
+    return dict(zip(unique, hashes))
+
+async def _add_test_data(conn):
+    """Справочники, пользователи и демонстрационные мероприятия"""
+    # Добавляем должности
+    positions_data = [
+        'Менеджер проектов',
+        'Дизайнер мероприятий',
+        'IT-специалист',
+        'Координатор мероприятий',
+        'Консультант по UX',
+        'Тренер по agile',
+        'Архитектор решений',
+        'Фотограф',
+        'Видеооператор',
+        'Ведущий мероприятий',
+        'Звукорежиссер',
+        'Декоратор',
+        'Администратор',
+        'Охранник',
+        'Уборщик',
+        'Технический специалист',
+        'Маркетолог',
+        'Бухгалтер',
+        'Юрист',
+        'HR-менеджер'
+    ]
+    
+    await conn.executemany("""
+        INSERT INTO positions (name) VALUES ($1::VARCHAR(100))
+        ON CONFLICT DO NOTHING;
+    """, [(position_name,) for position_name in positions_data])
+    
+    await conn.execute("""
+        INSERT INTO roles (name) VALUES 
+        ('Администратор'), ('Организатор'), ('Сотрудник'), ('Пользователь')
+        ON CONFLICT DO NOTHING;
+    """)
+    
+    users_data = [
+        ('admin@example.com', 'admin123', 'Правящий Александр Владимирович', 'admin@example.com'),
+        ('org1@example.com', 'org123', 'Иванова Мария Петровна', 'org1@example.com'),
+        ('org2@example.com', 'org123', 'Смирнов Алексей Владимирович', 'org2@example.com'),
+        ('coord1@example.com', 'coord123', 'Петров Дмитрий Иванович', 'coord1@example.com')
+    ]
+
+    password_hashes = await hash_passwords(password for _, password, _, _ in users_data)
+    await conn.executemany("""
+        INSERT INTO users (username, password_hash, full_name, email) VALUES
+        ($1::VARCHAR(50), $2::VARCHAR(255), $3::VARCHAR(255), $4::VARCHAR(255))
+        ON CONFLICT DO NOTHING;
+    """, [(username, password_hashes[password], full_name, email)
+          for username, password, full_name, email in users_data])
+    
+    user_ids = await fetch_name_map(conn, "users", "username")
+    role_ids = await fetch_name_map(conn, "roles")
+    user_roles_data = [
+        ('admin@example.com', 'Администратор'),
+        ('org1@example.com', 'Организатор'),
+        ('org2@example.com', 'Организатор'),
+        ('coord1@example.com', 'Сотрудник')
+    ]
+    await conn.executemany(
+        "INSERT INTO user_roles (user_id, role_id) VALUES ($1, $2) ON CONFLICT DO NOTHING",
+        [(user_ids[username], role_ids[role]) for username, role in user_roles_data]
+    )
+    
+    await conn.execute("""
+        INSERT INTO age_categories (name) VALUES 
+        ('0+'), ('6+'), ('12+'), ('16+'), ('18+'), ('21+')
+        ON CONFLICT DO NOTHING;
+    """)
+    
+    await conn.execute("""
+        INSERT INTO event_statuses (name) VALUES 
+        ('Запланировано'), ('Активно'), ('Завершено'), ('Отменено')
+        ON CONFLICT DO NOTHING;
+    """)
+    
+    await conn.execute("""
+        INSERT INTO room_types (name) VALUES 
+        ('Конференц-зал'), ('Тренинг-зал'), ('Коворкинг'), 
+        ('Мультифункциональный зал'), ('Спортивный зал'), ('Кинозал'),
+        ('Лекторий'), ('Выставочный зал'), ('Танцевальный зал'),
+        ('Библиотека'), ('Кафе'), ('Актовый зал')
+        ON CONFLICT DO NOTHING;
+    """)
+    
+    await conn.execute("""
+        INSERT INTO event_types (name, category) VALUES 
+        ('Научное', 'Научное'),
+        ('Деловое', 'Деловое'), 
+        ('Образовательное', 'Образовательное'), 
+        ('Культурно-развлекательное', 'Культурно-развлекательное'), 
+        ('Культурное', 'Культурное'), 
+        ('Спортивное', 'Спортивное'),
+        ('Праздник', 'Праздник')
+        ON CONFLICT DO NOTHING;
+    """)
+    
+    rooms_data = [
+        ('Синий зал Дом молодежи', 'Конференц-зал', 500, 'ул. Ленина, 1', 'Большой конференц-зал с проектором и звуковым оборудованием', 'blue_hall.jpg'),
+        ('Красный зал Дом молодежи', 'Конференц-зал', 150, 'ул. Ленина, 1', 'Малый конференц-зал для переговоров', 'red_hall.jpg'),
+        ('Коворкинг "Точка Кипения"', 'Коворкинг', 30, 'ул. Лермонтова, 83', 'Коворкинг для работы и мероприятий с зонами отдыха', 'coworking_space.jpg'),
+        ('Кинозал Баргузин', 'Кинозал', 50, 'ул. Советская, 175', 'Кинозал с панорамным экраном и Dolby Surround', 'cinema_hall.jpg'),
+        ('Спортивный зал Школа №21', 'Спортивный зал', 50, 'ул. Байкальская, 215', 'Спортивный зал с раздевалками и душевыми', 'sports_hall.jpg'),
+        ('Актовый зал Университета', 'Актовый зал', 300, 'пр. Карла Маркса, 1', 'Большой зал для мероприятий с театральной сценой', 'assembly_hall.jpg'),
+        ('Лекторий Научной библиотеки', 'Лекторий', 80, 'ул. Гагарина, 24', 'Лекционный зал с интерактивной доской', 'lecture_hall.jpg'),
+        ('Выставочный зал ИркутскАрт', 'Выставочный зал', 200, 'ул. Декабрьских Событий, 102', 'Просторный зал для выставок с естественным освещением', 'exhibition_hall.jpg'),
+        ('Танцевальный зал ДК Юность', 'Танцевальный зал', 40, 'ул. Байкальская, 147', 'Зал с зеркалами и станками для танцев', 'dance_studio.jpg'),
+        ('Кафе "Книжный червь"', 'Кафе', 25, 'ул. Урицкого, 8', 'Уютное кафе с возможностью проведения небольших встреч', 'book_cafe.jpg')
+    ]
+            
+    room_type_ids = await fetch_name_map(conn, "room_types")
+    await conn.executemany("""
+        INSERT INTO rooms (name, room_type_id, capacity, address, description, image_filename)
+        VALUES ($1::VARCHAR(255), $2::INTEGER, $3::INTEGER, $4::VARCHAR(255), $5::TEXT, $6::VARCHAR(255))
+        ON CONFLICT DO NOTHING;
+    """, [(name, room_type_ids.get(room_type), capacity, address, description, image_filename)
+          for name, room_type, capacity, address, description, image_filename in rooms_data])
+    
+    # Обновляем данные сотрудников с использованием position_id
+    employees_data = [
+        ('Иванов Алексей Петрович', 'Менеджер проектов', 'ivanov@example.com', False),
+        ('Петрова Светлана Михайловна', 'Дизайнер мероприятий', 'petrova@example.com', False),
+        ('Сидоров Дмитрий Владимирович', 'IT-специалист', 'sidorov@example.com', False),
+        ('Кузнецова Елена Леонидовна', 'Координатор мероприятий', 'kuznetsova@example.com', False),
+        ('Смирнов Виктор Константинович', 'Консультант по UX', 'smirnov@example.com', True),
+        ('Орлова Мария Сергеевна', 'Тренер по agile', 'orlova@example.com', True),
+        ('Жуков Павел Александрович', 'Архитектор решений', 'zhukov@example.com', True),
+        ('Волкова Анна Дмитриевна', 'Фотограф', 'volkova@example.com', True),
+        ('Лебедев Игорь Олегович', 'Видеооператор', 'lebedev@example.com', True),
+        ('Соколова Ольга Игоревна', 'Ведущий мероприятий', 'sokolova@example.com', True),
+        ('Козлов Михаил Андреевич', 'Звукорежиссер', 'kozlov@example.com', True),
+        ('Новикова Татьяна Викторовна', 'Декоратор', 'novikova@example.com', True),
+        ('Петров Дмитрий Иванович', 'Координатор мероприятий', 'coord1@example.com', False)
+    ]
+    
+    position_ids = await fetch_name_map(conn, "positions")
+    employee_records = []
+    for full_name, position_name, contact_info, is_external in employees_data:
+        position_id = position_ids.get(position_name)
+        if position_id:
+            employee_records.append((full_name, position_name, position_id, contact_info, is_external))
+        else:
+            print(f"Должность '{position_name}' не найдена, пропускаем сотрудника '{full_name}'")
+    
+    await conn.executemany("""
+        INSERT INTO employees (full_name, position, position_id, contact_info, is_external)
+        VALUES ($1::VARCHAR(200), $2::VARCHAR(200), $3::INTEGER, $4::TEXT, $5::BOOLEAN)
+        ON CONFLICT DO NOTHING;
+    """, employee_records)
+    
+    # Остальной код остается без изменений...
+    events_data = [
+        # Существующие мероприятия
+        ('Технологическая конференция "Цифровой Байкал"', 
+         'Ежегодная конференция, посвященная новейшим технологическим тенденциям и инновациям в IT-сфере. В программе: выступления ведущих экспертов, мастер-классы, нетворкинг.',
+         datetime(2025, 4, 15, 9, 0), datetime(2025, 4, 17, 18, 0), 500, '16+', 'Активно', 'Научное', 'org1@example.com'),
         
-        for position_name in positions_data:
-            await conn.execute("""
-                INSERT INTO positions (name) VALUES ($1::VARCHAR(100))
-                ON CONFLICT DO NOTHING;
-            """, position_name)
+        ('Корпоративный новогодний праздник', 
+         'Традиционное празднование Нового года для сотрудников и партнеров компании с конкурсами, подарками и живой музыкой.',
+         datetime(2025, 12, 23, 19, 0), datetime(2025, 12, 23, 23, 0), 150, '18+', 'Запланировано', 'Праздник', 'org2@example.com'),
         
-        await conn.execute("""
-            INSERT INTO roles (name) VALUES 
-            ('Администратор'), ('Организатор'), ('Сотрудник'), ('Пользователь')
-            ON CONFLICT DO NOTHING;
-        """)
+        ('Мастер-класс по проектному управлению', 
+         'Практический семинар для менеджеров проектов с разбором реальных кейсов и современных методик управления проектами.',
+         datetime(2025, 2, 5, 10, 0), datetime(2025, 2, 6, 17, 0), 30, '18+', 'Завершено', 'Образовательное', 'org1@example.com'),
         
-        users_data = [
-            ('admin@example.com', 'admin123', 'Правящий Александр Владимирович', 'admin@example.com'),
-            ('org1@example.com', 'org123', 'Иванова Мария Петровна', 'org1@example.com'),
-            ('org2@example.com', 'org123', 'Смирнов Алексей Владимирович', 'org2@example.com'),
-            ('coord1@example.com', 'coord123', 'Петров Дмитрий Иванович', 'coord1@example.com')
-        ]
-
-        for username, password, full_name, email in users_data:
-            await conn.execute("""
-                INSERT INTO users (username, password_hash, full_name, email) VALUES
-                ($1::VARCHAR(50), $2::VARCHAR(255), $3::VARCHAR(255), $4::VARCHAR(255))
-                ON CONFLICT DO NOTHING;
-            """, username, pwd_context.hash(password), full_name, email)
+        ('Фестиваль молодежных инициатив', 
+         'Масштабное мероприятие для активной молодежи с презентацией проектов, конкурсами и возможностью получить грантовую поддержку.',
+         datetime(2025, 5, 20, 10, 0), datetime(2025, 5, 22, 20, 0), 300, '16+', 'Запланировано', 'Культурно-развлекательное', 'org2@example.com'),
         
-        await conn.execute("""
-            INSERT INTO user_roles (user_id, role_id) VALUES
-            ((SELECT id FROM users WHERE username = 'admin@example.com'), 
-             (SELECT id FROM roles WHERE name = 'Администратор')),
-            ((SELECT id FROM users WHERE username = 'org1@example.com'), 
-             (SELECT id FROM roles WHERE name = 'Организатор')),
-            ((SELECT id FROM users WHERE username = 'org2@example.com'), 
-             (SELECT id FROM roles WHERE name = 'Организатор')),
-            ((SELECT id FROM users WHERE username = 'coord1@example.com'), 
-             (SELECT id FROM roles WHERE name = 'Сотрудник'))
-            ON CONFLICT DO NOTHING;
-        """)
+        ('Выставка современного искусства "Арт-Волна"', 
+         'Выставка работ молодых художников и скульпторов с интерактивными инсталляциями и мастер-классами.',
+         datetime(2025, 3, 10, 11, 0), datetime(2025, 3, 20, 19, 0), 100, '12+', 'Активно', 'Культурное', 'org1@example.com'),
         
-        await conn.execute("""
-            INSERT INTO age_categories (name) VALUES 
-            ('0+'), ('6+'), ('12+'), ('16+'), ('18+'), ('21+')
-            ON CONFLICT DO NOTHING;
-        """)
+        ('Турнир по настольному теннису', 
+         'Ежегодный турнир среди сотрудников компаний-партнеров с призовым фондом и развлекательной программой.',
+         datetime(2025, 6, 12, 9, 0), datetime(2025, 6, 12, 18, 0), 50, '16+', 'Запланировано', 'Спортивное', 'org2@example.com'),
         
-        await conn.execute("""
-            INSERT INTO event_statuses (name) VALUES 
-            ('Запланировано'), ('Активно'), ('Завершено'), ('Отменено')
-            ON CONFLICT DO NOTHING;
-        """)
+        ('Лекция "Будущее искусственного интеллекта"', 
+         'Популярная лекция от ведущего эксперта в области ИИ о перспективах развития технологии и ее влиянии на общество.',
+         datetime(2025, 7, 8, 18, 30), datetime(2025, 7, 8, 20, 30), 80, '16+', 'Запланировано', 'Образовательное', 'org1@example.com'),
         
-        await conn.execute("""
-            INSERT INTO room_types (name) VALUES 
-            ('Конференц-зал'), ('Тренинг-зал'), ('Коворкинг'), 
-            ('Мультифункциональный зал'), ('Спортивный зал'), ('Кинозал'),
-            ('Лекторий'), ('Выставочный зал'), ('Танцевальный зал'),
-            ('Библиотека'), ('Кафе'), ('Актовый зал')
-            ON CONFLICT DO NOTHING;
-        """)
+        ('Тренинг "Эффективные коммуникации"', 
+         'Двухдневный тренинг по развитию навыков делового общения и публичных выступлений.',
+         datetime(2025, 8, 14, 10, 0), datetime(2025, 8, 15, 17, 0), 25, '18+', 'Запланировано', 'Образовательное', 'org2@example.com'),
         
-        await conn.execute("""
-            INSERT INTO event_types (name, category) VALUES 
-            ('Научное', 'Научное'),
-            ('Деловое', 'Деловое'), 
-            ('Образовательное', 'Образовательное'), 
-            ('Культурно-развлекательное', 'Культурно-развлекательное'), 
-            ('Культурное', 'Культурное'), 
-            ('Спортивное', 'Спортивное'),
-            ('Праздник', 'Праздник')
-            ON CONFLICT DO NOTHING;
-        """)
+        # Новые мероприятия на 20 апреля 2025
+        ('Воркшоп по веб-разработке', 
+         'Практический воркшоп для начинающих веб-разработчиков с созданием реального проекта.',
+         datetime(2025, 4, 20, 10, 0), datetime(2025, 4, 20, 16, 0), 25, '16+', 'Запланировано', 'Образовательное', 'org1@example.com'),
         
-        rooms_data = [
-            ('Синий зал Дом молодежи', 'Конференц-зал', 500, 'ул. Ленина, 1', 'Большой конференц-зал с проектором и звуковым оборудованием', 'blue_hall.jpg'),
-            ('Красный зал Дом молодежи', 'Конференц-зал', 150, 'ул. Ленина, 1', 'Малый конференц-зал для переговоров', 'red_hall.jpg'),
-            ('Коворкинг "Точка Кипения"', 'Коворкинг', 30, 'ул. Лермонтова, 83', 'Коворкинг для работы и мероприятий с зонами отдыха', 'coworking_space.jpg'),
-            ('Кинозал Баргузин', 'Кинозал', 50, 'ул. Советская, 175', 'Кинозал с панорамным экраном и Dolby Surround', 'cinema_hall.jpg'),
-            ('Спортивный зал Школа №21', 'Спортивный зал', 50, 'ул. Байкальская, 215', 'Спортивный зал с раздевалками и душевыми', 'sports_hall.jpg'),
-            ('Актовый зал Университета', 'Актовый зал', 300, 'пр. Карла Маркса, 1', 'Большой зал для мероприятий с театральной сценой', 'assembly_hall.jpg'),
-            ('Лекторий Научной библиотеки', 'Лекторий', 80, 'ул. Гагарина, 24', 'Лекционный зал с интерактивной доской', 'lecture_hall.jpg'),
-            ('Выставочный зал ИркутскАрт', 'Выставочный зал', 200, 'ул. Декабрьских Событий, 102', 'Просторный зал для выставок с естественным освещением', 'exhibition_hall.jpg'),
-            ('Танцевальный зал ДК Юность', 'Танцевальный зал', 40, 'ул. Байкальская, 147', 'Зал с зеркалами и станками для танцев', 'dance_studio.jpg'),
-            ('Кафе "Книжный червь"', 'Кафе', 25, 'ул. Урицкого, 8', 'Уютное кафе с возможностью проведения небольших встреч', 'book_cafe.jpg')
-        ]
-                
-        for name, room_type, capacity, address, description, image_filename in rooms_data:
-            await conn.execute("""
-            INSERT INTO rooms (name, room_type_id, capacity, address, description, image_filename)
-            VALUES ($1::VARCHAR(255), (SELECT id FROM room_types WHERE name = $2::VARCHAR(100)), $3::INTEGER, $4::VARCHAR(255), $5::TEXT, $6::VARCHAR(255))
-            ON CONFLICT DO NOTHING;
-        """, name, room_type, capacity, address, description, image_filename)
+        ('Концерт молодых исполнителей', 
+         'Музыкальный вечер с выступлениями талантливых молодых музыкантов и певцов.',
+         datetime(2025, 4, 20, 18, 0), datetime(2025, 4, 20, 22, 0), 100, '12+', 'Запланировано', 'Культурно-развлекательное', 'org2@example.com'),
         
-        # Обновляем данные сотрудников с использованием position_id
-        employees_data = [
-            ('Иванов Алексей Петрович', 'Менеджер проектов', 'ivanov@example.com', False),
-            ('Петрова Светлана Михайловна', 'Дизайнер мероприятий', 'petrova@example.com', False),
-            ('Сидоров Дмитрий Владимирович', 'IT-специалист', 'sidorov@example.com', False),
-            ('Кузнецова Елена Леонидовна', 'Координатор мероприятий', 'kuznetsova@example.com', False),
-            ('Смирнов Виктор Константинович', 'Консультант по UX', 'smirnov@example.com', True),
-            ('Орлова Мария Сергеевна', 'Тренер по agile', 'orlova@example.com', True),
-            ('Жуков Павел Александрович', 'Архитектор решений', 'zhukov@example.com', True),
-            ('Волкова Анна Дмитриевна', 'Фотограф', 'volkova@example.com', True),
-            ('Лебедев Игорь Олегович', 'Видеооператор', 'lebedev@example.com', True),
-            ('Соколова Ольга Игоревна', 'Ведущий мероприятий', 'sokolova@example.com', True),
-            ('Козлов Михаил Андреевич', 'Звукорежиссер', 'kozlov@example.com', True),
-            ('Новикова Татьяна Викторовна', 'Декоратор', 'novikova@example.com', True),
-            ('Петров Дмитрий Иванович', 'Координатор мероприятий', 'coord1@example.com', False)
-        ]
+        # Новые мероприятия на 18 февраля 2025
+        ('Семинар по цифровому маркетингу', 
+         'Современные тренды и инструменты цифрового маркетинга для бизнеса.',
+         datetime(2025, 2, 18, 9, 0), datetime(2025, 2, 18, 13, 0), 40, '18+', 'Запланировано', 'Деловое', 'org1@example.com'),
         
-        for full_name, position_name, contact_info, is_external in employees_data:
-            # Сначала получаем ID должности
-            position_id = await conn.fetchval(
-                "SELECT id FROM positions WHERE name = $1::VARCHAR(100)", 
-                position_name
-            )
-            
-            if position_id:
-                await conn.execute("""
-                    INSERT INTO employees (full_name, position, position_id, contact_info, is_external)
-                    VALUES ($1::VARCHAR(200), $2::VARCHAR(200), $3::INTEGER, $4::TEXT, $5::BOOLEAN)
-                    ON CONFLICT DO NOTHING;
-                """, full_name, position_name, position_id, contact_info, is_external)
-            else:
-                print(f"Должность '{position_name}' не найдена, пропускаем сотрудника '{full_name}'")
+        ('Тренинг по тайм-менеджменту', 
+         'Эффективные методы управления временем и повышения продуктивности.',
+         datetime(2025, 2, 18, 14, 0), datetime(2025, 2, 18, 18, 0), 30, '16+', 'Запланировано', 'Образовательное', 'org2@example.com'),
         
-        # Остальной код остается без изменений...
-        events_data = [
-            # Существующие мероприятия
-            ('Технологическая конференция "Цифровой Байкал"', 
-             'Ежегодная конференция, посвященная новейшим технологическим тенденциям и инновациям в IT-сфере. В программе: выступления ведущих экспертов, мастер-классы, нетворкинг.',
-             datetime(2025, 4, 15, 9, 0), datetime(2025, 4, 17, 18, 0), 500, '16+', 'Активно', 'Научное', 'org1@example.com'),
-            
-            ('Корпоративный новогодний праздник', 
-             'Традиционное празднование Нового года для сотрудников и партнеров компании с конкурсами, подарками и живой музыкой.',
-             datetime(2025, 12, 23, 19, 0), datetime(2025, 12, 23, 23, 0), 150, '18+', 'Запланировано', 'Праздник', 'org2@example.com'),
-            
-            ('Мастер-класс по проектному управлению', 
-             'Практический семинар для менеджеров проектов с разбором реальных кейсов и современных методик управления проектами.',
-             datetime(2025, 2, 5, 10, 0), datetime(2025, 2, 6, 17, 0), 30, '18+', 'Завершено', 'Образовательное', 'org1@example.com'),
-            
-            ('Фестиваль молодежных инициатив', 
-             'Масштабное мероприятие для активной молодежи с презентацией проектов, конкурсами и возможностью получить грантовую поддержку.',
-             datetime(2025, 5, 20, 10, 0), datetime(2025, 5, 22, 20, 0), 300, '16+', 'Запланировано', 'Культурно-развлекательное', 'org2@example.com'),
-            
-            ('Выставка современного искусства "Арт-Волна"', 
-             'Выставка работ молодых художников и скульпторов с интерактивными инсталляциями и мастер-классами.',
-             datetime(2025, 3, 10, 11, 0), datetime(2025, 3, 20, 19, 0), 100, '12+', 'Активно', 'Культурное', 'org1@example.com'),
-            
-            ('Турнир по настольному теннису', 
-             'Ежегодный турнир среди сотрудников компаний-партнеров с призовым фондом и развлекательной программой.',
-             datetime(2025, 6, 12, 9, 0), datetime(2025, 6, 12, 18, 0), 50, '16+', 'Запланировано', 'Спортивное', 'org2@example.com'),
-            
-            ('Лекция "Будущее искусственного интеллекта"', 
-             'Популярная лекция от ведущего эксперта в области ИИ о перспективах развития технологии и ее влиянии на общество.',
-             datetime(2025, 7, 8, 18, 30), datetime(2025, 7, 8, 20, 30), 80, '16+', 'Запланировано', 'Образовательное', 'org1@example.com'),
-            
-            ('Тренинг "Эффективные коммуникации"', 
-             'Двухдневный тренинг по развитию навыков делового общения и публичных выступлений.',
-             datetime(2025, 8, 14, 10, 0), datetime(2025, 8, 15, 17, 0), 25, '18+', 'Запланировано', 'Образовательное', 'org2@example.com'),
-            
-            # Новые мероприятия на 20 апреля 2025
-            ('Воркшоп по веб-разработке', 
-             'Практический воркшоп для начинающих веб-разработчиков с созданием реального проекта.',
-             datetime(2025, 4, 20, 10, 0), datetime(2025, 4, 20, 16, 0), 25, '16+', 'Запланировано', 'Образовательное', 'org1@example.com'),
-            
-            ('Концерт молодых исполнителей', 
-             'Музыкальный вечер с выступлениями талантливых молодых музыкантов и певцов.',
-             datetime(2025, 4, 20, 18, 0), datetime(2025, 4, 20, 22, 0), 100, '12+', 'Запланировано', 'Культурно-развлекательное', 'org2@example.com'),
-            
-            # Новые мероприятия на 18 февраля 2025
-            ('Семинар по цифровому маркетингу', 
-             'Современные тренды и инструменты цифрового маркетинга для бизнеса.',
-             datetime(2025, 2, 18, 9, 0), datetime(2025, 2, 18, 13, 0), 40, '18+', 'Запланировано', 'Деловое', 'org1@example.com'),
-            
-            ('Тренинг по тайм-менеджменту', 
-             'Эффективные методы управления временем и повышения продуктивности.',
-             datetime(2025, 2, 18, 14, 0), datetime(2025, 2, 18, 18, 0), 30, '16+', 'Запланировано', 'Образовательное', 'org2@example.com'),
-            
-            ('Вечер настольных игр', 
-             'Расслабляющий вечер с разнообразными настольными играми для всех желающих.',
-             datetime(2025, 2, 18, 19, 0), datetime(2025, 2, 18, 23, 0), 50, '12+', 'Запланировано', 'Культурно-развлекательное', 'org1@example.com'),
-            
-            # Новые мероприятия на 9 декабря 2024
-            ('Подготовка к Новому году: мастер-класс', 
-             'Создание новогодних украшений и подарков своими руками.',
-             datetime(2024, 12, 9, 11, 0), datetime(2024, 12, 9, 14, 0), 20, '6+', 'Запланировано', 'Праздник', 'org2@example.com'),
-            
-            ('Бизнес-завтрак с инвесторами', 
-             'Неформальная встреча предпринимателей с потенциальными инвесторами.',
-             datetime(2024, 12, 9, 9, 0), datetime(2024, 12, 9, 12, 0), 25, '18+', 'Запланировано', 'Деловое', 'org1@example.com'),
-            
-            ('Рождественский хоровой концерт', 
-             'Традиционные рождественские песни в исполнении местного хора.',
-             datetime(2024, 12, 9, 18, 0), datetime(2024, 12, 9, 20, 0), 80, '0+', 'Запланировано', 'Культурное', 'org2@example.com')
-        ]
+        ('Вечер настольных игр', 
+         'Расслабляющий вечер с разнообразными настольными играми для всех желающих.',
+         datetime(2025, 2, 18, 19, 0), datetime(2025, 2, 18, 23, 0), 50, '12+', 'Запланировано', 'Культурно-развлекательное', 'org1@example.com'),
         
-        for name, description, start_time, end_time, max_participants, age_category, status, event_type, organizer in events_data:
-            await conn.execute("""
-                INSERT INTO events (name, description, start_time, end_time, max_participants, 
-                                  min_age_category_id, status_id, event_type_id, organizer_id)
-                VALUES ($1::VARCHAR(255), $2::TEXT, $3::TIMESTAMP, $4::TIMESTAMP, $5::INTEGER, 
-                       (SELECT id FROM age_categories WHERE name = $6::VARCHAR(20)),
-                       (SELECT id FROM event_statuses WHERE name = $7::VARCHAR(50)),
-                       (SELECT id FROM event_types WHERE name = $8::VARCHAR(100)),
-                       (SELECT id FROM users WHERE username = $9::VARCHAR(50)))
-                ON CONFLICT DO NOTHING;
-            """, name, description, start_time, end_time, max_participants, 
-               age_category, status, event_type, organizer)
+        # Новые мероприятия на 9 декабря 2024
+        ('Подготовка к Новому году: мастер-класс', 
+         'Создание новогодних украшений и подарков своими руками.',
+         datetime(2024, 12, 9, 11, 0), datetime(2024, 12, 9, 14, 0), 20, '6+', 'Запланировано', 'Праздник', 'org2@example.com'),
         
-        event_rooms = [
-            # Существующие привязки
-            ('Технологическая конференция "Цифровой Байкал"', 'Синий зал Дом молодежи'),
-            ('Корпоративный новогодний праздник', 'Красный зал Дом молодежи'),
-            ('Мастер-класс по проектному управлению', 'Коворкинг "Точка Кипения"'),
-            ('Фестиваль молодежных инициатив', 'Актовый зал Университета'),
-            ('Выставка современного искусства "Арт-Волна"', 'Выставочный зал ИркутскАрт'),
-            ('Турнир по настольному теннису', 'Спортивный зал Школа №21'),
-            ('Лекция "Будущее искусственного интеллекта"', 'Лекторий Научной библиотеки'),
-            ('Тренинг "Эффективные коммуникации"', 'Коворкинг "Точка Кипения"'),
-            
-            # Новые привязки для мероприятий 20 апреля
-            ('Воркшоп по веб-разработке', 'Коворкинг "Точка Кипения"'),
-            ('Концерт молодых исполнителей', 'Актовый зал Университета'),
-            
-            # Новые привязки для мероприятий 18 февраля
-            ('Семинар по цифровому маркетингу', 'Лекторий Научной библиотеки'),
-            ('Тренинг по тайм-менеджменту', 'Коворкинг "Точка Кипения"'),
-            ('Вечер настольных игр', 'Кафе "Книжный червь"'),
-            
-            # Новые привязки для мероприятий 9 декабря
-            ('Подготовка к Новому году: мастер-класс', 'Коворкинг "Точка Кипения"'),
-            ('Бизнес-завтрак с инвесторами', 'Кафе "Книжный червь"'),
-            ('Рождественский хоровой концерт', 'Лекторий Научной библиотеки')
-        ]
+        ('Бизнес-завтрак с инвесторами', 
+         'Неформальная встреча предпринимателей с потенциальными инвесторами.',
+         datetime(2024, 12, 9, 9, 0), datetime(2024, 12, 9, 12, 0), 25, '18+', 'Запланировано', 'Деловое', 'org1@example.com'),
         
-        for event_name, room_name in event_rooms:
-            await conn.execute("""
-                INSERT INTO resource_bookings (event_id, resource_type, resource_id, start_time, end_time)
-                SELECT 
-                    (SELECT id FROM events WHERE name = $1::VARCHAR(255)),
-                    'room',
-                    (SELECT id FROM rooms WHERE name = $2::VARCHAR(255)),
-                    (SELECT start_time FROM events WHERE name = $1::VARCHAR(255)),
-                    (SELECT end_time FROM events WHERE name = $1::VARCHAR(255))
-                WHERE NOT EXISTS (
-                    SELECT 1 FROM resource_bookings 
-                    WHERE event_id = (SELECT id FROM events WHERE name = $1::VARCHAR(255))
-                    AND resource_type = 'room'
-                    AND resource_id = (SELECT id FROM rooms WHERE name = $2::VARCHAR(255))
-                )
-            """, event_name, room_name)
+        ('Рождественский хоровой концерт', 
+         'Традиционные рождественские песни в исполнении местного хора.',
+         datetime(2024, 12, 9, 18, 0), datetime(2024, 12, 9, 20, 0), 80, '0+', 'Запланировано', 'Культурное', 'org2@example.com')
+    ]
+    
+    age_category_ids = await fetch_name_map(conn, "age_categories")
+    status_ids = await fetch_name_map(conn, "event_statuses")
+    event_type_ids = await fetch_name_map(conn, "event_types")
+    await conn.executemany("""
+        INSERT INTO events (name, description, start_time, end_time, max_participants, 
+                          min_age_category_id, status_id, event_type_id, organizer_id)
+        VALUES ($1::VARCHAR(255), $2::TEXT, $3::TIMESTAMP, $4::TIMESTAMP, $5::INTEGER, 
+               $6::INTEGER, $7::INTEGER, $8::INTEGER, $9::INTEGER)
+        ON CONFLICT DO NOTHING;
+    """, [(name, description, start_time, end_time, max_participants,
+           age_category_ids.get(age_category), status_ids.get(status),
+           event_type_ids.get(event_type), user_ids.get(organizer))
+          for name, description, start_time, end_time, max_participants,
+              age_category, status, event_type, organizer in events_data])
+    
+    events_by_name = {
+        r["name"]: r for r in await conn.fetch("SELECT id, name, start_time, end_time FROM events")
+    }
+    room_ids = await fetch_name_map(conn, "rooms")
+    employee_ids = await fetch_name_map(conn, "employees", "full_name")
+    
+    event_rooms = [
+        # Существующие привязки
+        ('Технологическая конференция "Цифровой Байкал"', 'Синий зал Дом молодежи'),
+        ('Корпоративный новогодний праздник', 'Красный зал Дом молодежи'),
+        ('Мастер-класс по проектному управлению', 'Коворкинг "Точка Кипения"'),
+        ('Фестиваль молодежных инициатив', 'Актовый зал Университета'),
+        ('Выставка современного искусства "Арт-Волна"', 'Выставочный зал ИркутскАрт'),
+        ('Турнир по настольному теннису', 'Спортивный зал Школа №21'),
+        ('Лекция "Будущее искусственного интеллекта"', 'Лекторий Научной библиотеки'),
+        ('Тренинг "Эффективные коммуникации"', 'Коворкинг "Точка Кипения"'),
         
-        event_employees = [
-            # Существующие привязки
-            ('Технологическая конференция "Цифровой Байкал"', ['Иванов Алексей Петрович', 'Петрова Светлана Михайловна', 'Смирнов Виктор Константинович', 'Волкова Анна Дмитриевна', 'Петров Дмитрий Иванович']),
-            ('Корпоративный новогодний праздник', ['Иванов Алексей Петрович', 'Сидоров Дмитрий Владимирович', 'Соколова Ольга Игоревна', 'Козлов Михаил Андреевич']),
-            ('Мастер-класс по проектному управлению', ['Иванов Алексей Петрович', 'Кузнецова Елена Леонидовна', 'Орлова Мария Сергеевна', 'Петров Дмитрий Иванович']),
-            ('Фестиваль молодежных инициатив', ['Петрова Светлана Михайловна', 'Кузнецова Елена Леонидовна', 'Волкова Анна Дмитриевна', 'Лебедев Игорь Олегович']),
-            ('Выставка современного искусства "Арт-Волна"', ['Новикова Татьяна Викторовна', 'Волкова Анна Дмитриевна', 'Петров Дмитрий Иванович']),
-            ('Турнир по настольному теннису', ['Сидоров Дмитрий Владимирович', 'Петров Дмитрий Иванович']),
-            ('Лекция "Будущее искусственного интеллекта"', ['Жуков Павел Александрович', 'Соколова Ольга Игоревна']),
-            ('Тренинг "Эффективные коммуникации"', ['Орлова Мария Сергеевна', 'Кузнецова Елена Леонидовна', 'Петров Дмитрий Иванович']),
-            
-            # Новые привязки для мероприятий
-            ('Воркшоп по веб-разработке', ['Сидоров Дмитрий Владимирович', 'Жуков Павел Александрович']),
-            ('Концерт молодых исполнителей', ['Козлов Михаил Андреевич', 'Волкова Анна Дмитриевна']),
-            ('Семинар по цифровому маркетингу', ['Петрова Светлана Михайловна', 'Петров Дмитрий Иванович']),
-            ('Тренинг по тайм-менеджменту', ['Орлова Мария Сергеевна']),
-            ('Вечер настольных игр', ['Соколова Ольга Игоревна']),
-            ('Подготовка к Новому году: мастер-класс', ['Новикова Татьяна Викторовна']),
-            ('Бизнес-завтрак с инвесторами', ['Иванов Алексей Петрович', 'Петров Дмитрий Иванович']),
-            ('Рождественский хоровой концерт', ['Козлов Михаил Андреевич'])
-        ]
+        # Новые привязки для мероприятий 20 апреля
+        ('Воркшоп по веб-разработке', 'Коворкинг "Точка Кипения"'),
+        ('Концерт молодых исполнителей', 'Актовый зал Университета'),
         
-        for event_name, employees in event_employees:
-            for employee_name in employees:
-                await conn.execute("""
-                    INSERT INTO resource_bookings (event_id, resource_type, resource_id, start_time, end_time)
-                    SELECT 
-                        (SELECT id FROM events WHERE name = $1::VARCHAR(255)),
-                        'employee',
-                        (SELECT id FROM employees WHERE full_name = $2::VARCHAR(200)),
-                        (SELECT start_time FROM events WHERE name = $1::VARCHAR(255)),
-                        (SELECT end_time FROM events WHERE name = $1::VARCHAR(255))
-                    WHERE NOT EXISTS (
-                        SELECT 1 FROM resource_bookings 
-                        WHERE event_id = (SELECT id FROM events WHERE name = $1::VARCHAR(255))
-                        AND resource_type = 'employee'
-                        AND resource_id = (SELECT id FROM employees WHERE full_name = $2::VARCHAR(200))
-                    )
-                """, event_name, employee_name)
+        # Новые привязки для мероприятий 18 февраля
+        ('Семинар по цифровому маркетингу', 'Лекторий Научной библиотеки'),
+        ('Тренинг по тайм-менеджменту', 'Коворкинг "Точка Кипения"'),
+        ('Вечер настольных игр', 'Кафе "Книжный червь"'),
         
-        print("Test data added successfully")
+        # Новые привязки для мероприятий 9 декабря
+        ('Подготовка к Новому году: мастер-класс', 'Коворкинг "Точка Кипения"'),
+        ('Бизнес-завтрак с инвесторами', 'Кафе "Книжный червь"'),
+        ('Рождественский хоровой концерт', 'Лекторий Научной библиотеки')
+    ]
+    
+    bookings = []
+    for event_name, room_name in event_rooms:
+        event = events_by_name[event_name]
+        bookings.append((event["id"], 'room', room_ids[room_name], event["start_time"], event["end_time"]))
+    
+    event_employees = [
+        # Существующие привязки
+        ('Технологическая конференция "Цифровой Байкал"', ['Иванов Алексей Петрович', 'Петрова Светлана Михайловна', 'Смирнов Виктор Константинович', 'Волкова Анна Дмитриевна', 'Петров Дмитрий Иванович']),
+        ('Корпоративный новогодний праздник', ['Иванов Алексей Петрович', 'Сидоров Дмитрий Владимирович', 'Соколова Ольга Игоревна', 'Козлов Михаил Андреевич']),
+        ('Мастер-класс по проектному управлению', ['Иванов Алексей Петрович', 'Кузнецова Елена Леонидовна', 'Орлова Мария Сергеевна', 'Петров Дмитрий Иванович']),
+        ('Фестиваль молодежных инициатив', ['Петрова Светлана Михайловна', 'Кузнецова Елена Леонидовна', 'Волкова Анна Дмитриевна', 'Лебедев Игорь Олегович']),
+        ('Выставка современного искусства "Арт-Волна"', ['Новикова Татьяна Викторовна', 'Волкова Анна Дмитриевна', 'Петров Дмитрий Иванович']),
+        ('Турнир по настольному теннису', ['Сидоров Дмитрий Владимирович', 'Петров Дмитрий Иванович']),
+        ('Лекция "Будущее искусственного интеллекта"', ['Жуков Павел Александрович', 'Соколова Ольга Игоревна']),
+        ('Тренинг "Эффективные коммуникации"', ['Орлова Мария Сергеевна', 'Кузнецова Елена Леонидовна', 'Петров Дмитрий Иванович']),
         
-    except Exception as e:
-        print(f"Error adding test data: {e}")
-        raise
+        # Новые привязки для мероприятий
+        ('Воркшоп по веб-разработке', ['Сидоров Дмитрий Владимирович', 'Жуков Павел Александрович']),
+        ('Концерт молодых исполнителей', ['Козлов Михаил Андреевич', 'Волкова Анна Дмитриевна']),
+        ('Семинар по цифровому маркетингу', ['Петрова Светлана Михайловна', 'Петров Дмитрий Иванович']),
+        ('Тренинг по тайм-менеджменту', ['Орлова Мария Сергеевна']),
+        ('Вечер настольных игр', ['Соколова Ольга Игоревна']),
+        ('Подготовка к Новому году: мастер-класс', ['Новикова Татьяна Викторовна']),
+        ('Бизнес-завтрак с инвесторами', ['Иванов Алексей Петрович', 'Петров Дмитрий Иванович']),
+        ('Рождественский хоровой концерт', ['Козлов Михаил Андреевич'])
+    ]
+    
+    for event_name, employees in event_employees:
+        event = events_by_name[event_name]
+        for employee_name in employees:
+            bookings.append((event["id"], 'employee', employee_ids[employee_name], event["start_time"], event["end_time"]))
+    
+    # ON CONFLICT DO NOTHING срабатывает и на ограничение исключения,
+    # поэтому повторный запуск не создает пересекающихся бронирований
+    await conn.executemany("""
+        INSERT INTO resource_bookings (event_id, resource_type, resource_id, start_time, end_time)
+        VALUES ($1, $2, $3, $4, $5)
+        ON CONFLICT DO NOTHING
+    """, bookings)
+
+# Таблицы, пользовательские триггеры которых отключаются при массовой загрузке
+BULK_LOAD_TABLES = ("events", "resource_bookings")
+
+async def add_synthetic_data(conn, rooms: int, employees: int, events: int,
+                             staff_per_event: int = 2, start: datetime = datetime(2020, 1, 1)):
+    """
+    Генерация нагрузочного набора данных через COPY в одной транзакции.
+    
+    Мероприятие i проводится в помещении i % rooms в слоте i // rooms длиной 4 часа,
+    поэтому бронирования помещений не пересекаются. Одновременно идут мероприятия
+    одного слота, и каждому помещению закреплена своя группа сотрудников,
+    поэтому не пересекаются и бронирования сотрудников.
+    """
+    print(f"Generating synthetic data: {rooms} rooms, {employees} employees, {events} events...")
+    started = datetime.now()
+    staff_per_event = min(staff_per_event, employees // rooms) if rooms else 0
+    
+    async with conn.transaction():
+        # Построчные триггеры (суточные агрегаты занятости, сброс кэша отчетов)
+        # на миллионе строк сводят на нет выигрыш от COPY: на время загрузки они
+        # отключаются, агрегаты пересчитываются одним запросом, кэш отчетов
+        # очищается целиком
+        for table in BULK_LOAD_TABLES:
+            await conn.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+        
+        room_type_ids = list((await fetch_name_map(conn, "room_types")).values())
+        position_ids = await fetch_name_map(conn, "positions")
+        age_category_ids = list((await fetch_name_map(conn, "age_categories")).values())
+        status_ids = list((await fetch_name_map(conn, "event_statuses")).values())
+        event_type_ids = list((await fetch_name_map(conn, "event_types")).values())
+        organizer_ids = list((await fetch_name_map(conn, "users", "username")).values())
+        positions = list(position_ids.items())
+        
+        first_room = await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM rooms")
+        await conn.copy_records_to_table(
+            "rooms",
+            columns=["name", "room_type_id", "capacity", "address", "description", "is_external"],
+            records=(
+                (f"Помещение №{i + 1}", random.choice(room_type_ids), random.randint(10, 500),
+                 f"ул. Тестовая, {i + 1}", None, i % 10 == 0)
+                for i in range(rooms)
+            )
+        )
+        room_ids = [r["id"] for r in await conn.fetch(
+            "SELECT id FROM rooms WHERE id > $1 ORDER BY id", first_room)]
+        
+        first_employee = await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM employees")
+        await conn.copy_records_to_table(
+            "employees",
+            columns=["full_name", "position", "position_id", "contact_info", "is_external"],
+            records=(
+                (f"Сотрудник №{i + 1}", *random.choice(positions), f"employee{i + 1}@example.com", i % 5 == 0)
+                for i in range(employees)
+            )
+        )
+        employee_ids = [r["id"] for r in await conn.fetch(
+            "SELECT id FROM employees WHERE id > $1 ORDER BY id", first_employee)]
+        
+        def event_times(i):
+            slot_start = start + timedelta(hours=4 * (i // rooms))
+            return slot_start, slot_start + timedelta(minutes=random.randint(60, 230))
+        
+        schedule = [event_times(i) for i in range(events)]
+        first_event = await conn.fetchval("SELECT COALESCE(MAX(id), 0) FROM events")
+        await conn.copy_records_to_table(
+            "events",
+            columns=["name", "description", "start_time", "end_time", "max_participants",
+                     "min_age_category_id", "status_id", "event_type_id", "organizer_id"],
+            records=(
+                (f"Мероприятие №{i + 1}", None, start_time, end_time, random.randint(10, 500),
+                 random.choice(age_category_ids), random.choice(status_ids),
+                 random.choice(event_type_ids), random.choice(organizer_ids))
+                for i, (start_time, end_time) in enumerate(schedule)
+            )
+        )
+        event_ids = [r["id"] for r in await conn.fetch(
+            "SELECT id FROM events WHERE id > $1 ORDER BY id", first_event)]
+        
+        def booking_records():
+            for i, (event_id, (start_time, end_time)) in enumerate(zip(event_ids, schedule)):
+                room_index = i % rooms
+                yield (event_id, 'room', room_ids[room_index], start_time, end_time)
+                for j in range(staff_per_event):
+                    employee_id = employee_ids[room_index * staff_per_event + j]
+                    yield (event_id, 'employee', employee_id, start_time, end_time)
+        
+        await conn.copy_records_to_table(
+            "resource_bookings",
+            columns=["event_id", "resource_type", "resource_id", "start_time", "end_time"],
+            records=booking_records()
+        )
+        
+        for table in BULK_LOAD_TABLES:
+            await conn.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+        await rebuild_usage(conn)
+        await conn.execute("DELETE FROM event_reports WHERE params_hash IS NOT NULL")
+    
+    await conn.execute("ANALYZE rooms; ANALYZE employees; ANALYZE events; ANALYZE resource_bookings")
+    print(f"Synthetic data generated in {(datetime.now() - started).total_seconds():.1f}s")
 
 if __name__ == "__main__":
-    asyncio.run(init_db(recreate=True))
\ No newline at end of file
+    parser = argparse.ArgumentParser(
+        description="Применение миграций (migrate.upgrade); тестовые данные - только в новую схему"
+    )
+    parser.add_argument(
+        "--recreate", action="store_true",
+        help="удалить все таблицы и данные перед применением миграций"
+    )
+    parser.add_argument("--rooms", type=int, default=0, help="число синтетических помещений")
+    parser.add_argument("--employees", type=int, default=0, help="число синтетических сотрудников")
+    parser.add_argument("--events", type=int, default=0, help="число синтетических мероприятий")
+    parser.add_argument("--staff-per-event", type=int, default=2)
+    args = parser.parse_args()
+    
+    scale = None
+    if args.events:
+        scale = {
+            "rooms": max(args.rooms, 1),
+            "employees": args.employees,
+            "events": args.events,
+            "staff_per_event": args.staff_per_event
+        }
+    asyncio.run(init_db(recreate=args.recreate, scale=scale))
\ No newline at end of file
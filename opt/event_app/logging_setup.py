@@ -0,0 +1,240 @@
+"""
+Журналирование приложения.
+
+Обработчики пишут записи в очередь (QueueHandler), а вывод в stdout и файл
+выполняет поток QueueListener, поэтому ввод-вывод не блокирует цикл событий.
+Формат - JSON-строка на запись с request_id текущего запроса (LOG_FORMAT=text
+для чтения глазами).
+
+    LOG_LEVEL=INFO                          # уровень корневого логгера
+    LOG_LEVELS=main=DEBUG,parsers=WARNING   # уровни отдельных логгеров
+    LOG_FILE=/var/log/event_app.log         # дополнительно к stdout
+    LOG_DEBUG_RATE=20                       # не больше записей DEBUG в секунду с одного места вызова
+    LOG_DEBUG_SAMPLE=1.0                    # доля записей DEBUG, которые вообще пишутся
+
+Значения токенов, паролей и cookie заменяются на "[скрыто]" до попадания
+записи в очередь - в том числе в тексте исключений и в строках журнала
+доступа uvicorn.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_DEBUG_RATE = int(os.getenv("LOG_DEBUG_RATE", "20"))
+LOG_DEBUG_SAMPLE = float(os.getenv("LOG_DEBUG_SAMPLE", "1.0"))
+
+# Логгеры uvicorn пишут в stdout синхронно; их записи перенаправляются в очередь
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+REDACTED = "[скрыто]"
+SECRET_KEYS = ("token", "password", "secret", "cookie", "authorization")
+
+_SECRET_PATTERNS = (
+    # session_token=..., "password": "...", Authorization: ... и т.п.
+    re.compile(
+        r"(?i)(\w*(?:token|password|secret|cookie|authorization)\w*[\"']?\s*[=:]\s*[\"']?)([^\s\"'&;,]+)"
+    ),
+    # Сессионные токены (secrets.token_hex(32)) без имени параметра
+    re.compile(r"\b[0-9a-f]{64}\b"),
+)
+
+_REQUEST_ID_RE = re.compile(r"^[\w.-]{1,64}$")
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+
+def redact(text: str) -> str:
+    text = _SECRET_PATTERNS[0].sub(lambda m: m.group(1) + REDACTED, text)
+    return _SECRET_PATTERNS[1].sub(REDACTED, text)
+
+
+def _is_secret_key(key: str) -> bool:
+    key = key.lower()
+    return any(secret in key for secret in SECRET_KEYS)
+
+
+def new_request_id(header: Optional[str] = None) -> str:
+    """Идентификатор запроса: из заголовка X-Request-ID, если он допустим, иначе новый"""
+    if header and _REQUEST_ID_RE.match(header):
+        return header
+    return uuid.uuid4().hex
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """'main=DEBUG,parsers=WARNING' -> {"main": "DEBUG", "parsers": "WARNING"}"""
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class DebugRateLimit(logging.Filter):
+    """
+    Ограничение записей DEBUG по месту вызова.
+
+    Сначала применяется выборка (LOG_DEBUG_SAMPLE), затем не больше rate
+    записей в секунду с одной строки кода. Число отброшенных записей
+    добавляется к следующей пропущенной записи полем suppressed.
+    """
+
+    def __init__(self, rate: int = LOG_DEBUG_RATE, sample: float = LOG_DEBUG_SAMPLE):
+        super().__init__()
+        self.rate = rate
+        self.sample = sample
+        self.suppressed_total = 0
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG:
+            return True
+        if self.sample < 1.0 and random.random() >= self.sample:
+            self.suppressed_total += 1
+            return False
+        if self.rate <= 0:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= 1.0:
+                self._windows[key] = [now, 1, 0]
+                if window is not None and window[2]:
+                    record.suppressed = window[2]
+                return True
+            if window[1] < self.rate:
+                window[1] += 1
+                return True
+            window[2] += 1
+            self.suppressed_total += 1
+            return False
+
+
+class RedactingQueueHandler(QueueHandler):
+    """Подготовка записи в потоке вызова: подстановка аргументов, request_id и скрытие секретов"""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = redact(record.getMessage())
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = redact(logging.Formatter().formatException(record.exc_info))
+            record.exc_info = None
+        if record.stack_info:
+            record.stack_info = redact(record.stack_info)
+        for key, value in list(vars(record).items()):
+            if key in _STANDARD_ATTRS:
+                continue
+            if _is_secret_key(key):
+                setattr(record, key, REDACTED)
+            elif isinstance(value, str):
+                setattr(record, key, redact(value))
+
+        request_id = request_id_var.get()
+        if request_id is not None:
+            record.request_id = request_id
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            payload["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_text:
+            payload["exc"] = record.exc_text
+        if record.stack_info:
+            payload["stack"] = record.stack_info
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__(
+            "%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s",
+            defaults={"request_id": "-"}
+        )
+
+
+debug_limiter = DebugRateLimit()
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging():
+    """Настройка корневого логгера; повторный вызов ничего не меняет"""
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if LOG_FILE:
+        handlers.append(logging.FileHandler(LOG_FILE, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = RedactingQueueHandler(log_queue)
+    queue_handler.addFilter(debug_limiter)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        for handler in list(uvicorn_logger.handlers):
+            uvicorn_logger.removeHandler(handler)
+        uvicorn_logger.propagate = True
+
+    for name, level in parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Запись оставшихся в очереди записей и остановка потока"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
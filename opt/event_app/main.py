@@ -1,18 +1,45 @@
-from fastapi import FastAPI, Request, Depends, HTTPException, status, Form
-from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request, Depends, HTTPException, status, Form, Query
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 import asyncpg
 import secrets
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import logging
 import random
+import time
 from typing import Optional,List
-from passlib.context import CryptContext
-from database import get_connection
+from logging_setup import setup_logging, new_request_id, request_id_var
+from metrics import MetricsMiddleware, METRICS_TOKEN, METRICS_PUBLIC, registry as metrics_registry
+from query_profiler import QueryProfilerMiddleware, profiler, slow_queries
+from database import get_db, acquire, init_pool, close_pool, pool_stats
+from session_cache import session_cache, SESSION_NOTIFY_CHANNEL
+from session_maintenance import session_maintenance
+from passwords import verify_password, get_password_hash, hash_stats, shutdown_executor
+from reference_cache import reference_cache
+from reset_tokens import reset_tokens
+from migrate import verify_schema
+from availability import availability_cache, find_available
+from planner import Requirement, AllocationError, allocate, plan, describe_shortages
+from parsers.fetcher import fetcher as parser_fetcher
+from parsers.http_cache import response_cache as parser_response_cache
+from report_cache import report_cache, activity_parameters, ACTIVITY_REPORT
+from resource_lists import (
+    RESOURCE_PAGE_SIZE, employees_count, employees_page, rooms_count, rooms_page
+)
+from analytics import resource_usage, rebuild_usage
+from activity_report import (
+    EXPORT_WRITERS, build_report_query, parse_report_period, report_row, stream_report
+)
+from sync_jobs import sync_jobs, SyncJobConflict, SYNC_KINDS
+from bookings import (
+    book_employees, book_resources, booked_any, has_conflicts, describe_conflicts, BookingConflictError
+)
 from fastapi import UploadFile, File
 import os
 from pathlib import Path
 import json
+import base64
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 
@@ -24,42 +51,53 @@ BASE_DIR = Path(__file__).resolve().parent
 UPLOAD_DIR = BASE_DIR / "static" / "images"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+setup_logging()
+logger = logging.getLogger(__name__)
+
 app = FastAPI()
 app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
 templates = Jinja2Templates(directory=BASE_DIR / "templates")
 
 
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Идентификатор запроса для записей журнала; возвращается в X-Request-ID"""
+    request_id = new_request_id(request.headers.get("X-Request-ID"))
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+if profiler.enabled:
+    app.add_middleware(QueryProfilerMiddleware)
+# Добавлен последним - внешний слой: время запроса включает остальные слои
+app.add_middleware(MetricsMiddleware)
+
+
 ADMIN_USERNAME = "admin@eventsystem.com"
 ADMIN_PASSWORD = "admin123"
 ADMIN_EMAIL = "admin@eventsystem.com"
 ADMIN_NAME = "Администратор Системы"
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-password_reset_tokens = {}
+EVENTS_PAGE_SIZE = int(os.getenv("EVENTS_PAGE_SIZE", "50"))
+EVENTS_PAGE_SIZE_MAX = 200
 
 security = HTTPBearer()
 
 
-async def get_current_user_role(request: Request):
+async def get_current_user_role(request: Request, conn: asyncpg.Connection = Depends(get_db)):
     """Получаем текущего пользователя и его роли"""
-    current_user = await get_current_user(request)
-    conn = await get_connection()
-    try:
-        roles = await conn.fetch(
-            "SELECT r.name FROM roles r JOIN user_roles ur ON r.id = ur.role_id WHERE ur.user_id = $1",
-            current_user['id']
-        )
-        return {"user": current_user, "roles": [r['name'] for r in roles]}
-    finally:
-        await conn.close()
+    return await resolve_identity(request, conn)
         
 def role_required(required_roles: list):
-    async def _role_checker(request: Request):
+    async def _role_checker(user_data: dict = Depends(get_current_user_role)):
         """Фабрика зависимостей для проверки ролей"""
-        user_data = await get_current_user_role(request)
         user_roles = user_data["roles"]
         
         if 'Администратор' in user_roles:
@@ -74,31 +112,23 @@ def role_required(required_roles: list):
         return user_data
     return _role_checker
 
-def verify_password(plain_password: str, hashed_password: str):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password: str):
-    return pwd_context.hash(password)
-
 async def create_admin_user():
     """Создание администратора при первом запуске"""
-    conn = await get_connection()
-    try:
+    async with acquire() as conn:
         admin = await conn.fetchrow(
             "SELECT * FROM users WHERE username = $1", ADMIN_USERNAME
         )
         if not admin:
             admin_id = await conn.fetchval(
                 "INSERT INTO users (username, password_hash, full_name, email) VALUES ($1, $2, $3, $4) RETURNING id",
-                ADMIN_USERNAME, get_password_hash(ADMIN_PASSWORD), ADMIN_NAME, ADMIN_EMAIL
+                ADMIN_USERNAME, await get_password_hash(ADMIN_PASSWORD), ADMIN_NAME, ADMIN_EMAIL
             )
             
             await conn.execute(
                 "INSERT INTO user_roles (user_id, role_id) VALUES ($1, (SELECT id FROM roles WHERE name = 'Администратор'))",
                 admin_id
             )
-    finally:
-        await conn.close()
+            session_cache.invalidate_user(admin_id)
 
 async def get_upcoming_events(conn):
     """Получение предстоящих мероприятий из БД"""
@@ -114,65 +144,92 @@ async def get_upcoming_events(conn):
             "ORDER BY e.start_time LIMIT 3"
         )
     except Exception as e:
-        print(f"Ошибка получения мероприятий: {e}")
+        logger.exception("Ошибка получения мероприятий")
         return []
     
-async def get_current_user(request: Request):
-    """Получение текущего пользователя из сессии"""
+async def resolve_identity(request: Request, conn: asyncpg.Connection):
+    """Пользователь и его роли по сессии, один запрос к БД на весь HTTP-запрос"""
+    user_data = getattr(request.state, "user_data", None)
+    if user_data is not None:
+        return user_data
+
     session_token = request.cookies.get("session_token")
-    print(f"Получен session_token из cookie: {session_token}")
     
     if not session_token:
-        print("Сессионный токен отсутствует")
+        logger.debug("Сессионный токен отсутствует")
         raise HTTPException(
             status_code=303,
             detail="Not authenticated",
             headers={"Location": "/unregistered"}
         )
     
-    conn = await get_connection()
-    try:
-        user = await conn.fetchrow(
-            "SELECT u.id, u.username, u.full_name, u.email FROM users u "
-            "JOIN user_sessions us ON u.id = us.user_id "
-            "WHERE us.session_token = $1 AND us.expires_at > NOW()",
-            session_token
-        )
+    user_data = session_cache.get(session_token)
+    if user_data is not None:
+        request.state.user_data = user_data
+        return user_data
+    
+    user = await conn.fetchrow(
+        """SELECT u.id, u.username, u.full_name, u.email, us.expires_at,
+                  COALESCE(array_agg(r.name) FILTER (WHERE r.name IS NOT NULL), '{}') AS roles
+           FROM user_sessions us
+           JOIN users u ON u.id = us.user_id
+           LEFT JOIN user_roles ur ON ur.user_id = u.id
+           LEFT JOIN roles r ON r.id = ur.role_id
+           WHERE us.session_token = $1 AND us.expires_at > NOW()
+           GROUP BY u.id, us.expires_at""",
+        session_token
+    )
         
-        if not user:
-            print(f"Сессия не найдена или истекла: {session_token}")
-            raise HTTPException(
+    if not user:
+        logger.debug("Сессия не найдена или истекла")
+        raise HTTPException(
             status_code=303,
             detail="Not authenticated",
             headers={"Location": "/unregistered"}
         )
-            
-        print(f"Пользователь найден: {user['username']}")
-        return dict(user)
-    finally:
-        await conn.close()
+        
+    logger.debug("Пользователь найден: %s", user['username'])
+    current_user = dict(user)
+    roles = list(current_user.pop("roles"))
+    expires_at = current_user.pop("expires_at")
+    session_cache.put(session_token, current_user, roles, expires_at)
+    request.state.user_data = {"user": current_user, "roles": roles}
+    return request.state.user_data
+
+async def get_current_user(request: Request, conn: asyncpg.Connection = Depends(get_db)):
+    """Получение текущего пользователя из сессии"""
+    user_data = await resolve_identity(request, conn)
+    return user_data["user"]
 
 @app.on_event("startup")
 async def startup():
-    """Создание таблицы сессий и администратора при запуске"""
-    conn = await get_connection()
+    """Создание пула соединений, проверка версии схемы и создание администратора при запуске"""
+    await init_pool()
     try:
-        await conn.execute("""
-            CREATE TABLE IF NOT EXISTS user_sessions (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                session_token TEXT NOT NULL UNIQUE,
-                created_at TIMESTAMP DEFAULT NOW(),
-                expires_at TIMESTAMP NOT NULL
-            )
-        """)
-        print("Таблица user_sessions создана/проверена")
+        async with acquire() as conn:
+            await verify_schema(conn)
+            logger.info("Версия схемы БД проверена")
+            await reference_cache.load(conn)
+        reference_cache.subscribe(SESSION_NOTIFY_CHANNEL, session_cache.on_notify, session_cache.clear)
+        await reference_cache.start_listener()
+        reset_tokens.start_sweeper()
+        session_maintenance.start()
         await create_admin_user()
     except Exception as e:
-        print(f"Ошибка при создании таблицы сессий: {e}")
+        logger.exception("Ошибка при запуске приложения")
         raise
-    finally:
-        await conn.close()
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Закрытие пула соединений при остановке"""
+    await reference_cache.stop_listener()
+    await sync_jobs.shutdown()
+    await reset_tokens.stop_sweeper()
+    await session_maintenance.stop()
+    await slow_queries.shutdown()
+    await close_pool()
+    await parser_fetcher.close()
+    shutdown_executor()
 
 @app.post("/login")
 async def login(
@@ -182,17 +239,19 @@ async def login(
     remember: bool = Form(False)
 ):
     """Обработка входа в систему"""
-    print(f"Попытка входа: {username}")
+    logger.info("Попытка входа: %s", username)
     
-    conn = await get_connection()
+    # Соединение берется из пула только на время запросов: пока bcrypt проверяет
+    # пароль, оно не должно простаивать занятым
     try:
-        user = await conn.fetchrow(
-            "SELECT id, username, password_hash, full_name, email FROM users WHERE username = $1", 
-            username
-        )
+        async with acquire() as conn:
+            user = await conn.fetchrow(
+                "SELECT id, username, password_hash, full_name, email FROM users WHERE username = $1", 
+                username
+            )
         
         if not user:
-            print(f"Пользователь {username} не найден")
+            logger.warning("Пользователь %s не найден", username)
             return templates.TemplateResponse(
                 "unregistered.html",
                 {
@@ -205,8 +264,8 @@ async def login(
                 status_code=401
             )
         
-        if not verify_password(password, user["password_hash"]):
-            print(f"Неверный пароль для пользователя {username}")
+        if not await verify_password(password, user["password_hash"]):
+            logger.warning("Неверный пароль для пользователя %s", username)
             return templates.TemplateResponse(
                 "unregistered.html",
                 {
@@ -219,19 +278,20 @@ async def login(
                 status_code=401
             )
         
-        print(f"Успешная аутентификация для пользователя {username}")
+        logger.info("Успешная аутентификация для пользователя %s", username)
         
         session_token = secrets.token_hex(32)
         expires_at = datetime.now() + timedelta(days=7 if remember else 1)
         
-        await conn.execute(
-            "INSERT INTO user_sessions (user_id, session_token, expires_at) VALUES ($1, $2, $3)",
-            user["id"],
-            session_token,
-            expires_at
-        )
+        async with acquire() as conn:
+            await conn.execute(
+                "INSERT INTO user_sessions (user_id, session_token, expires_at) VALUES ($1, $2, $3)",
+                user["id"],
+                session_token,
+                expires_at
+            )
         
-        print(f"Сессия создана для user_id: {user['id']}")
+        logger.info("Сессия создана для user_id: %s", user['id'])
         
         response = RedirectResponse(url="/", status_code=303)
         response.set_cookie(
@@ -242,11 +302,24 @@ async def login(
             secure=False
         )
         
-        print(f"Cookie установлен: {session_token}")
         return response
         
+    except HTTPException as e:
+        if e.status_code != 503:
+            raise
+        return templates.TemplateResponse(
+            "unregistered.html",
+            {
+                "request": request,
+                "error": "Сервер перегружен, повторите вход через несколько секунд",
+                "show_login_modal": True,
+                "admin_username": ADMIN_USERNAME,
+                "admin_password": ADMIN_PASSWORD
+            },
+            status_code=503
+        )
     except Exception as e:
-        print(f"Ошибка входа: {e}")
+        logger.exception("Ошибка входа")
         return templates.TemplateResponse(
             "unregistered.html",
             {
@@ -258,13 +331,10 @@ async def login(
             },
             status_code=500
         )
-    finally:
-        await conn.close()
 
 @app.post("/forgot-password")
-async def forgot_password(request: Request, email: str = Form(...)):
+async def forgot_password(request: Request, email: str = Form(...), conn: asyncpg.Connection = Depends(get_db)):
     """Обработка запроса на восстановление пароля"""
-    conn = await get_connection()
     try:
         user = await conn.fetchrow(
             "SELECT id, full_name FROM users WHERE email = $1", 
@@ -272,17 +342,15 @@ async def forgot_password(request: Request, email: str = Form(...)):
         )
         
         if user:
-            token = secrets.token_urlsafe(32)
-            password_reset_tokens[token] = {
-                "user_id": user["id"],
-                "expires": datetime.now() + timedelta(hours=1)
-            }
+            token, expires_at = await reset_tokens.issue(user["id"])
             
             
-            print(f"\n=== Ссылка для сброса пароля ===\n"
-                  f"Для пользователя: {user['full_name']}\n"
-                  f"Ссылка: http://127.0.0.1:8000/reset-password?token={token}\n"
-                  f"Действительна до: {password_reset_tokens[token]['expires']}\n")
+            logger.info("Выдана ссылка сброса пароля для user_id: %s", user["id"])
+            # Отправки почты нет; токен в ссылке скрывается журналом (logging_setup.redact)
+            logger.debug(
+                "Ссылка сброса пароля: http://127.0.0.1:8000/reset-password?token=%s, действительна до %s",
+                token, expires_at
+            )
             
             return templates.TemplateResponse(
                 "unregistered.html",
@@ -305,7 +373,7 @@ async def forgot_password(request: Request, email: str = Form(...)):
                 status_code=404
             )
     except Exception as e:
-        print(f"Ошибка восстановления пароля: {e}")
+        logger.exception("Ошибка восстановления пароля")
         return templates.TemplateResponse(
             "unregistered.html",
             {
@@ -316,13 +384,12 @@ async def forgot_password(request: Request, email: str = Form(...)):
             },
             status_code=500
         )
-    finally:
-        await conn.close()
 
 @app.get("/reset-password")
 async def reset_password_form(request: Request, token: str):
     """Форма для сброса пароля"""
-    if token not in password_reset_tokens:
+    entry = await reset_tokens.peek(token)
+    if entry is None:
         return templates.TemplateResponse(
             "unregistered.html",
             {
@@ -334,8 +401,7 @@ async def reset_password_form(request: Request, token: str):
             status_code=400
         )
     
-    if datetime.now() > password_reset_tokens[token]["expires"]:
-        del password_reset_tokens[token]
+    if datetime.now() > entry["expires_at"]:
         return templates.TemplateResponse(
             "unregistered.html",
             {
@@ -378,7 +444,8 @@ async def reset_password(
             status_code=400
         )
     
-    if token not in password_reset_tokens:
+    entry = await reset_tokens.peek(token)
+    if entry is None:
         return templates.TemplateResponse(
             "unregistered.html",
             {
@@ -390,8 +457,7 @@ async def reset_password(
             status_code=400
         )
     
-    if datetime.now() > password_reset_tokens[token]["expires"]:
-        del password_reset_tokens[token]
+    if datetime.now() > entry["expires_at"]:
         return templates.TemplateResponse(
             "unregistered.html",
             {
@@ -403,16 +469,33 @@ async def reset_password(
             status_code=400
         )
     
-    user_id = password_reset_tokens[token]["user_id"]
-    del password_reset_tokens[token]
-    
-    conn = await get_connection()
     try:
-        await conn.execute(
-            "UPDATE users SET password_hash = $1 WHERE id = $2",
-            get_password_hash(new_password),
-            user_id
-        )
+        # Хэширование (bcrypt) - до взятия соединения из пула, как при входе
+        password_hash = await get_password_hash(new_password)
+        # Токен удаляется в одной транзакции со сменой пароля: при ошибке ссылка остается рабочей,
+        # а из двух одновременных запросов с одним токеном пароль меняет только один
+        async with acquire() as conn, conn.transaction():
+            entry = await reset_tokens.consume(token, conn)
+            if entry is None:
+                return templates.TemplateResponse(
+                    "unregistered.html",
+                    {
+                        "request": request,
+                        "error": "Недействительная или устаревшая ссылка",
+                        "admin_username": ADMIN_USERNAME,
+                        "admin_password": ADMIN_PASSWORD
+                    },
+                    status_code=400
+                )
+            
+            user_id = entry["user_id"]
+            await conn.execute(
+                "UPDATE users SET password_hash = $1 WHERE id = $2",
+                password_hash,
+                user_id
+            )
+            await reset_tokens.revoke_user(user_id, conn)
+            await session_cache.revoke_user(conn, user_id)
         
         return templates.TemplateResponse(
             "unregistered.html",
@@ -424,7 +507,7 @@ async def reset_password(
             }
         )
     except Exception as e:
-        print(f"Ошибка сброса пароля: {e}")
+        logger.exception("Ошибка сброса пароля")
         return templates.TemplateResponse(
             "unregistered.html",
             {
@@ -435,12 +518,15 @@ async def reset_password(
             },
             status_code=500
         )
-    finally:
-        await conn.close()
 
 @app.get("/logout")
-async def logout():
+async def logout(request: Request, conn: asyncpg.Connection = Depends(get_db)):
     """Выход из системы"""
+    session_token = request.cookies.get("session_token")
+    if session_token:
+        await conn.execute("DELETE FROM user_sessions WHERE session_token = $1", session_token)
+        await session_cache.revoke(conn, session_token)
+    
     response = RedirectResponse(url="/unregistered")
     response.delete_cookie("session_token")
     return response
@@ -448,22 +534,14 @@ async def logout():
 @app.get("/", response_class=HTMLResponse)
 async def root(
     request: Request,
-    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     """Главная страница для авторизованных пользователей"""
     try:
+        current_user = user_data["user"]
+        current_user['roles'] = user_data["roles"]
         
-        current_user = await get_current_user(request)
-        
-        conn = await get_connection()
-        roles = await conn.fetch(
-            "SELECT r.name FROM roles r JOIN user_roles ur ON r.id = ur.role_id WHERE ur.user_id = $1",
-            current_user['id']
-        )
-        user_roles = [r['name'] for r in roles]
-        current_user['roles'] = user_roles
-        
-        conn = await get_connection()
         events = await get_upcoming_events(conn)
         
         formatted_events = []
@@ -492,35 +570,29 @@ async def root(
             return RedirectResponse(url="/unregistered")
         raise
     except Exception as e:
-        print(f"Ошибка загрузки главной страницы: {e}")
+        logger.exception("Ошибка загрузки главной страницы")
         return templates.TemplateResponse(
             "error.html",
             {"request": request, "error": "Ошибка загрузки данных"},
             status_code=500
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
         
 @app.get("/activity")
 async def activity(
     request: Request,
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     """Страница отчетов о деятельности организации"""
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
         
-        conn = await get_connection()
-        try:
-            events = await conn.fetch("SELECT id, name FROM events ORDER BY name")
-            rooms = await conn.fetch("SELECT id, name FROM rooms ORDER BY name")
-            employees = await conn.fetch("SELECT id, full_name FROM employees ORDER BY full_name")
-            age_categories = await conn.fetch("SELECT id, name FROM age_categories ORDER BY name")
-            event_statuses = await conn.fetch("SELECT id, name FROM event_statuses ORDER BY name")
-        finally:
-            await conn.close()
+        events = await conn.fetch("SELECT id, name FROM events ORDER BY name")
+        rooms = await conn.fetch("SELECT id, name FROM rooms ORDER BY name")
+        employees = await conn.fetch("SELECT id, full_name FROM employees ORDER BY full_name")
+        age_categories = await reference_cache.get(conn, "age_categories")
+        event_statuses = await reference_cache.get(conn, "event_statuses")
         
         return templates.TemplateResponse(
             "activity.html",
@@ -539,7 +611,7 @@ async def activity(
             return RedirectResponse(url="/unregistered")
         raise
     except Exception as e:
-        print(f"Ошибка загрузки страницы деятельности: {e}")
+        logger.exception("Ошибка загрузки страницы деятельности")
         return templates.TemplateResponse(
             "error.html",
             {"request": request, "error": "Ошибка загрузки данных"},
@@ -554,107 +626,70 @@ async def generate_activity_report(
     event_id: Optional[str] = Form(None),
     filter_type: Optional[str] = Form(None),
     filter_value: Optional[str] = Form(None),
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    export_format: Optional[str] = Form(None, alias="format"),
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
-    """Генерация отчета о деятельности"""
+    """Генерация отчета о деятельности; format=csv|jsonl|xlsx - потоковая выгрузка файлом"""
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         
         try:
-            if 'T' in start_date:
-                start_datetime = datetime.fromisoformat(start_date.replace('T', ' '))
-                end_datetime = datetime.fromisoformat(end_date.replace('T', ' '))
-            else:
-                start_datetime = datetime.strptime(start_date, "%Y-%m-%d %H:%M:%S")
-                end_datetime = datetime.strptime(end_date, "%Y-%m-%d %H:%M:%S")
+            start_datetime, end_datetime = parse_report_period(start_date, end_date)
         except ValueError as e:
             return {"success": False, "error": f"Неверный формат даты: {str(e)}. Попробуйте иначе."}
         
-        query = """
-            SELECT 
-                e.id, e.name, e.description, 
-                e.start_time, e.end_time, e.max_participants,
-                r.name as room_name, et.name as event_type_name,
-                ac.name as age_category_name, es.name as status_name
-            FROM events e
-            LEFT JOIN resource_bookings rb ON rb.event_id = e.id AND rb.resource_type = 'room'
-            LEFT JOIN rooms r ON r.id = rb.resource_id
-            LEFT JOIN event_types et ON et.id = e.event_type_id
-            LEFT JOIN age_categories ac ON ac.id = e.min_age_category_id
-            LEFT JOIN event_statuses es ON es.id = e.status_id
-            WHERE e.start_time >= $1 AND e.end_time <= $2
-        """
-        params = [start_datetime, end_datetime]
-        
-        
-        if event_id and event_id != "all":
-            query += " AND e.id = $3"
-            params.append(int(event_id))  
-        
-        if filter_type and filter_value and filter_value != "all":
-            param_position = len(params) + 1
-            
-            if filter_type == "room":
-                query += f" AND r.id = ${param_position}"
-                params.append(int(filter_value))  
-            elif filter_type == "employees":
-                query += f"""
-                    AND EXISTS (
-                        SELECT 1 FROM resource_bookings rb2 
-                        WHERE rb2.event_id = e.id 
-                        AND rb2.resource_type = 'employee' 
-                        AND rb2.resource_id = ${param_position}
-                    )
-                """
-                params.append(int(filter_value))  
-            elif filter_type == "participants":
-                query += f" AND e.max_participants >= ${param_position}"
-                params.append(int(filter_value))  
-            elif filter_type == "age":
-                query += f" AND e.min_age_category_id = ${param_position}"
-                params.append(int(filter_value))  
-            elif filter_type == "status":
-                query += f" AND e.status_id = ${param_position}"
-                params.append(int(filter_value))  
-        
-        query += " ORDER BY e.start_time"
-        
-        events = await conn.fetch(query, *params)
-        
-        report_data = []
-        for event in events:
-            report_data.append({
-                "id": event["id"],
-                "name": event["name"],
-                "start_date": event["start_time"].isoformat(), 
-                "end_date": event["end_time"].isoformat(),    
-                "status": event["status_name"],
-                "age_category": event["age_category_name"],
-                "participants": event["max_participants"],
-                "event_type": event["event_type_name"],
-                "room": event["room_name"]
-            })
+        query, params = build_report_query(start_datetime, end_datetime, event_id, filter_type, filter_value)
         
-        return {"success": True, "data": report_data}
+        if export_format and export_format != "json":
+            if export_format not in EXPORT_WRITERS:
+                return {"success": False, "error": f"Неизвестный формат выгрузки: {export_format}"}
+            writer = EXPORT_WRITERS[export_format]()
+            filename = (
+                f"activity_report_{start_datetime:%Y%m%d}_{end_datetime:%Y%m%d}.{writer.extension}"
+            )
+            return StreamingResponse(
+                stream_report(query, params, writer),
+                media_type=writer.media_type,
+                headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+            )
+        
+        async def generate():
+            events = await conn.fetch(query, *params)
+            report_data = []
+            for event in events:
+                row = report_row(event)
+                row["start_date"] = row["start_date"].isoformat()
+                row["end_date"] = row["end_date"].isoformat()
+                report_data.append(row)
+            return report_data
+        
+        parameters = activity_parameters(start_datetime, end_datetime, event_id, filter_type, filter_value)
+        report = await report_cache.get_or_generate(conn, ACTIVITY_REPORT, parameters, generate)
+        
+        # Данные из кэша уже в JSON - вставляются в ответ без повторного разбора
+        return Response(
+            content=(
+                f'{{"success": true, "cached": {"true" if report["cached"] else "false"}, '
+                f'"generation_ms": {report["generation_ms"]}, "data": {report["data"]}}}'
+            ),
+            media_type="application/json"
+        )
         
     except Exception as e:
-        print(f"Ошибка генерации отчета: {e}")
+        logger.exception("Ошибка генерации отчета")
         return {"success": False, "error": str(e)}
-    finally:
-        if 'conn' in locals():
-            await conn.close()
             
 @app.get("/profile")
 async def profile(
     request: Request,
-    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         
         
         stats = await conn.fetchrow(
@@ -679,12 +714,6 @@ async def profile(
             current_user['id']
         )
         
-        
-        roles = await conn.fetch(
-            "SELECT r.name FROM roles r JOIN user_roles ur ON r.id = ur.role_id WHERE ur.user_id = $1",
-            current_user['id']
-        )
-        
         return templates.TemplateResponse(
             "profile.html",
             {
@@ -693,7 +722,7 @@ async def profile(
                 "organized_events": stats['organized_events'],
                 "participated_events": stats['participated_events'],
                 "recent_events": recent_events,
-                "user_roles": [r['name'] for r in roles]
+                "user_roles": user_data["roles"]
             }
         )
     except HTTPException as e:
@@ -701,46 +730,41 @@ async def profile(
             return RedirectResponse(url="/unregistered")
         raise
     except Exception as e:
-        print(f"Error loading profile: {e}")
+        logger.exception("Error loading profile")
         return templates.TemplateResponse(
             "error.html",
             {"request": request, "error": "Ошибка загрузки профиля"},
             status_code=500
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 
 @app.post("/profile/update")
 async def update_profile(
     request: Request,
     full_name: str = Form(...),
     email: str = Form(...),
-    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     """Обновление данных профиля"""
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         
         await conn.execute(
             "UPDATE users SET full_name = $1, email = $2 WHERE id = $3",
             full_name, email, current_user['id']
         )
+        await session_cache.revoke_user(conn, current_user['id'])
         
         return RedirectResponse(url="/profile", status_code=303)
         
     except Exception as e:
-        print(f"Error updating profile: {e}")
+        logger.exception("Error updating profile")
         return templates.TemplateResponse(
             "error.html",
             {"request": request, "error": "Ошибка при обновлении профиля"},
             status_code=500
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 
 @app.post("/profile/change-password")
 async def change_password(
@@ -748,7 +772,8 @@ async def change_password(
     current_password: str = Form(...),
     new_password: str = Form(...),
     confirm_password: str = Form(...),
-    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     """Смена пароля пользователя"""
     try:
@@ -760,7 +785,6 @@ async def change_password(
         
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         
         
         user = await conn.fetchrow(
@@ -768,15 +792,16 @@ async def change_password(
             current_user['id']
         )
         
-        if not verify_password(current_password, user['password_hash']):
+        if not await verify_password(current_password, user['password_hash']):
             raise HTTPException(status_code=400, detail="Неверный текущий пароль")
         
         
         await conn.execute(
             "UPDATE users SET password_hash = $1 WHERE id = $2",
-            get_password_hash(new_password),
+            await get_password_hash(new_password),
             current_user['id']
         )
+        await session_cache.revoke_user(conn, current_user['id'])
         
         return RedirectResponse(url="/profile", status_code=303)
         
@@ -787,15 +812,12 @@ async def change_password(
             status_code=e.status_code
         )
     except Exception as e:
-        print(f"Error changing password: {e}")
+        logger.exception("Error changing password")
         return templates.TemplateResponse(
             "error.html",
             {"request": request, "error": "Ошибка при смене пароля"},
             status_code=500
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 
 @app.post("/events/{event_id}/update")
 async def update_event(
@@ -810,12 +832,12 @@ async def update_event(
     end_time: str = Form(...),
     min_age_category_id: Optional[int] = Form(None),
     max_participants: int = Form(...),
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         
         
         event = await conn.fetchrow("SELECT id FROM events WHERE id = $1", event_id)
@@ -861,33 +883,31 @@ async def update_event(
                WHERE event_id = $4 AND resource_type = 'room'""",
             room_id, start_datetime, end_datetime, event_id
         )
+        availability_cache.invalidate()
         
         return RedirectResponse(url=f"/events/{event_id}", status_code=303)
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating event: {e}")
+        logger.exception("Error updating event")
         return templates.TemplateResponse(
             "error.html",
             {"request": request, "error": "Ошибка при обновлении мероприятия"},
             status_code=500
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 
 @app.post("/events/{event_id}/participants")
 async def add_event_participants(
     request: Request,
     event_id: int,
     employee_ids: List[int] = Form(...),
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         
         
         event = await conn.fetchrow(
@@ -899,39 +919,52 @@ async def add_event_participants(
             raise HTTPException(status_code=404, detail="Мероприятие не найдено")
         
         
-        for employee_id in employee_ids:
-            await conn.execute(
-                """INSERT INTO resource_bookings 
-                   (event_id, resource_type, resource_id, start_time, end_time)
-                   VALUES ($1, 'employee', $2, $3, $4)
-                   ON CONFLICT DO NOTHING""",
-                event_id, employee_id, event['start_time'], event['end_time']
+        results = await book_employees(
+            conn, event_id, employee_ids, event['start_time'], event['end_time']
+        )
+        if booked_any(results):
+            availability_cache.invalidate()
+        conflicts = has_conflicts(results)
+
+        if "application/json" in request.headers.get("accept", ""):
+            return JSONResponse(
+                {"event_id": event_id, "results": results},
+                status_code=409 if conflicts else 200
             )
-        
+
+        if conflicts:
+            return templates.TemplateResponse(
+                "error.html",
+                {
+                    "request": request,
+                    "error": f"Не все сотрудники добавлены: {describe_conflicts(results)}"
+                },
+                status_code=409
+            )
+
         return RedirectResponse(url=f"/events/{event_id}", status_code=303)
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error adding participants: {e}")
+        logger.exception("Error adding participants")
         return templates.TemplateResponse(
             "error.html",
             {"request": request, "error": "Ошибка при добавлении участников"},
             status_code=500
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 
 @app.delete("/events/{event_id}/participants/{employee_id}")
 async def remove_event_participant(
     request: Request,
     event_id: int,
     employee_id: int,
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         
         
         await conn.execute(
@@ -939,25 +972,23 @@ async def remove_event_participant(
                WHERE event_id = $1 AND resource_type = 'employee' AND resource_id = $2""",
             event_id, employee_id
         )
+        availability_cache.invalidate()
         
         return JSONResponse({"success": True})
         
     except Exception as e:
-        print(f"Error removing participant: {e}")
+        logger.exception("Error removing participant")
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 
 @app.get("/employees")
 async def employees(
     request: Request,
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         employees = await conn.fetch("SELECT * FROM employees ORDER BY full_name")
         
         return templates.TemplateResponse(
@@ -972,28 +1003,267 @@ async def employees(
         )
     except HTTPException:
         return RedirectResponse(url="/unregistered")
-    finally:
-        await conn.close()
 
 @app.delete("/employees/{employee_id}")
 async def delete_employee(
     request: Request, 
     employee_id: int,
-    user_data: dict = Depends(role_required(['Администратор']))
+    user_data: dict = Depends(role_required(['Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         
         await conn.execute("DELETE FROM employees WHERE id = $1", employee_id)
         
         return JSONResponse({"success": True})
     except Exception as e:
-        print(f"Error deleting employee: {e}")
+        logger.exception("Error deleting employee")
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
-    finally:
-        await conn.close()
+
+def encode_events_cursor(start_time: datetime, event_id: int) -> str:
+    """Курсор страницы мероприятий: последняя пара (start_time, id)"""
+    raw = f"{start_time.isoformat()}|{event_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_events_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        start_time, event_id = raw.split("|")
+        return datetime.fromisoformat(start_time), int(event_id)
+    except (ValueError, UnicodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def fetch_events_page(
+    conn,
+    date: Optional[str] = None,
+    event_type: Optional[str] = None,
+    status: Optional[str] = None,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = EVENTS_PAGE_SIZE
+):
+    """Страница мероприятий с keyset-пагинацией по (start_time, id)"""
+    limit = max(1, min(limit, EVENTS_PAGE_SIZE_MAX))
+    
+    query = """
+        SELECT 
+            e.id, e.name, e.description, e.start_time, e.end_time, e.max_participants,
+            r.name as room_name, et.name as event_type_name, 
+            ac.name as age_category_name, es.name as status_name
+        FROM events e
+        LEFT JOIN LATERAL (
+            SELECT r.name FROM resource_bookings rb
+            JOIN rooms r ON r.id = rb.resource_id
+            WHERE rb.event_id = e.id AND rb.resource_type = 'room'
+            LIMIT 1
+        ) r ON TRUE
+        LEFT JOIN event_types et ON et.id = e.event_type_id
+        LEFT JOIN age_categories ac ON ac.id = e.min_age_category_id
+        LEFT JOIN event_statuses es ON es.id = e.status_id
+        WHERE 1=1
+    """
+    
+    params = []
+    
+    if date:
+        try:
+            day_start = datetime.strptime(date, "%Y-%m-%d")
+            # Пересечение с полуоткрытым интервалом [день, следующий день) без функций над столбцами,
+            # чтобы работали индексы по start_time/end_time
+            query += " AND e.start_time < $2 AND e.end_time >= $1"
+            params.extend([day_start, day_start + timedelta(days=1)])
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    
+    if event_type and event_type.strip():
+        query += f" AND e.event_type_id = ${len(params)+1}"
+        params.append(int(event_type))  
+    
+    if status and status.strip():
+        query += f" AND e.status_id = ${len(params)+1}"
+        params.append(int(status))  
+    
+    if search and search.strip():
+        query += f" AND (e.name ILIKE ${len(params)+1} OR e.description ILIKE ${len(params)+1})"
+        params.append(f"%{search.strip()}%")
+    
+    if cursor:
+        after_start, after_id = decode_events_cursor(cursor)
+        query += f" AND (e.start_time, e.id) > (${len(params)+1}, ${len(params)+2})"
+        params.extend([after_start, after_id])
+    
+    # Запрашиваем на одну строку больше, чтобы узнать, есть ли следующая страница
+    query += f" ORDER BY e.start_time, e.id LIMIT ${len(params)+1}"
+    params.append(limit + 1)
+    
+    rows = await conn.fetch(query, *params)
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_events_cursor(rows[-1]["start_time"], rows[-1]["id"])
+    
+    return rows, next_cursor
+
+@app.get("/api/events")
+async def api_events(
+    date: Optional[str] = None,
+    event_type: Optional[str] = None,
+    status: Optional[str] = None,
+    q: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = EVENTS_PAGE_SIZE,
+    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Постраничный список мероприятий в JSON"""
+    try:
+        rows, next_cursor = await fetch_events_page(
+            conn, date=date, event_type=event_type, status=status,
+            search=q, cursor=cursor, limit=limit
+        )
+    except HTTPException as e:
+        return JSONResponse({"success": False, "error": e.detail}, status_code=e.status_code)
+    except Exception as e:
+        logger.exception("Error listing events")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+    
+    return {
+        "success": True,
+        "events": [
+            {
+                "id": e["id"],
+                "name": e["name"],
+                "description": e["description"],
+                "start_time": e["start_time"].isoformat(),
+                "end_time": e["end_time"].isoformat(),
+                "max_participants": e["max_participants"],
+                "room_name": e["room_name"],
+                "event_type_name": e["event_type_name"],
+                "age_category_name": e["age_category_name"],
+                "status_name": e["status_name"]
+            }
+            for e in rows
+        ],
+        "next_cursor": next_cursor
+    }
+
+@app.get("/api/availability")
+async def api_availability(
+    start: str,
+    end: str,
+    capacity: Optional[int] = None,
+    room_type_id: Optional[int] = None,
+    position_ids: List[int] = Query([]),
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Свободные помещения и сотрудники на заданный интервал, лучшие варианты первыми"""
+    try:
+        result = await find_available(
+            conn,
+            datetime.fromisoformat(start),
+            datetime.fromisoformat(end),
+            capacity=capacity,
+            room_type_id=room_type_id,
+            position_ids=position_ids
+        )
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    except Exception as e:
+        logger.exception("Error searching availability")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+    
+    return {"success": True, "start": start, "end": end, **result}
+
+async def _analytics_response(conn, resource_type, start, end, bucket, resource_ids):
+    try:
+        result = await resource_usage(
+            conn,
+            resource_type,
+            date.fromisoformat(start),
+            date.fromisoformat(end),
+            bucket=bucket,
+            resource_ids=resource_ids or None
+        )
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    except Exception as e:
+        logger.exception("Error loading %s analytics", resource_type)
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+    return {"success": True, **result}
+
+@app.get("/api/analytics/rooms")
+async def api_analytics_rooms(
+    start: str,
+    end: str,
+    bucket: str = "day",
+    room_id: List[int] = Query([]),
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Загрузка помещений по дням или неделям за период [start, end)"""
+    return await _analytics_response(conn, "room", start, end, bucket, room_id)
+
+@app.get("/api/analytics/employees")
+async def api_analytics_employees(
+    start: str,
+    end: str,
+    bucket: str = "day",
+    employee_id: List[int] = Query([]),
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Занятость сотрудников по дням или неделям за период [start, end)"""
+    return await _analytics_response(conn, "employee", start, end, bucket, employee_id)
+
+@app.post("/api/planner/allocate")
+async def api_planner_allocate(
+    request: Request,
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Подбор ресурсов для одного мероприятия"""
+    try:
+        data = await request.json()
+        allocation = await allocate(conn, Requirement.from_dict(data))
+    except (KeyError, ValueError) as e:
+        return JSONResponse({"success": False, "error": f"Неверные параметры: {e}"}, status_code=400)
+    except Exception as e:
+        logger.exception("Error allocating resources")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+    
+    return {"success": True, "allocation": allocation}
+
+@app.post("/api/planner/season")
+async def api_planner_season(
+    request: Request,
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Пакетный подбор ресурсов для списка мероприятий без взаимных конфликтов"""
+    try:
+        data = await request.json()
+        items = data["events"] if isinstance(data, dict) else data
+        requirements = [Requirement.from_dict(item) for item in items]
+        started = time.perf_counter()
+        allocations = await plan(conn, requirements)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    except (KeyError, TypeError, ValueError) as e:
+        return JSONResponse({"success": False, "error": f"Неверные параметры: {e}"}, status_code=400)
+    except Exception as e:
+        logger.exception("Error planning season")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+    
+    return {
+        "success": True,
+        "planned": len(allocations),
+        "complete": sum(1 for a in allocations if a["complete"]),
+        "elapsed_ms": round(elapsed_ms, 1),
+        "allocations": allocations
+    }
 
 @app.get("/events")
 async def events(
@@ -1001,61 +1271,28 @@ async def events(
     date: Optional[str] = None,
     event_type: Optional[str] = None,
     status: Optional[str] = None,
+    q: Optional[str] = None,
     show_modal: Optional[bool] = False,
-    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         
         
         rooms = await conn.fetch("SELECT * FROM rooms ORDER BY name")
-        age_categories = await conn.fetch("SELECT * FROM age_categories ORDER BY name")
+        age_categories = await reference_cache.get(conn, "age_categories")
         employees = await conn.fetch("SELECT * FROM employees ORDER BY full_name")
         
-        
-        query = """
-            SELECT 
-                e.id, e.name, e.description, e.start_time, e.end_time, e.max_participants,
-                r.name as room_name, et.name as event_type_name, 
-                ac.name as age_category_name, es.name as status_name
-            FROM events e
-            LEFT JOIN resource_bookings rb ON rb.event_id = e.id AND rb.resource_type = 'room'
-            LEFT JOIN rooms r ON r.id = rb.resource_id
-            LEFT JOIN event_types et ON et.id = e.event_type_id
-            LEFT JOIN age_categories ac ON ac.id = e.min_age_category_id
-            LEFT JOIN event_statuses es ON es.id = e.status_id
-            WHERE 1=1
-        """
-        
-        params = []
-        
-        if date:
-            try:
-                date_obj = datetime.strptime(date, "%Y-%m-%d").date()
-                query += " AND DATE(e.start_time) <= $1 AND DATE(e.end_time) >= $1"
-                params.append(date_obj)
-            except ValueError:
-                raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
-    
-        
-        if event_type and event_type.strip():
-            query += f" AND e.event_type_id = ${len(params)+1}"
-            params.append(int(event_type))  
-        
-        
-        if status and status.strip():
-            query += f" AND e.status_id = ${len(params)+1}"
-            params.append(int(status))  
-        
-        query += " ORDER BY e.start_time"
-        
-        events = await conn.fetch(query, *params)
+        # Рендерим только первую страницу, остальные подгружаются через /api/events
+        events, next_cursor = await fetch_events_page(
+            conn, date=date, event_type=event_type, status=status, search=q
+        )
         
         
-        event_types = await conn.fetch("SELECT * FROM event_types ORDER BY name")
-        event_statuses = await conn.fetch("SELECT * FROM event_statuses ORDER BY name")
+        event_types = await reference_cache.get(conn, "event_types")
+        event_statuses = await reference_cache.get(conn, "event_statuses")
         
         return templates.TemplateResponse(
             "events.html",
@@ -1063,6 +1300,13 @@ async def events(
                 "request": request,
                 "current_user": current_user,
                 "events": events,
+                "next_cursor": next_cursor,
+                "filters": {
+                    "date": date or "",
+                    "event_type": event_type or "",
+                    "status": status or "",
+                    "q": q or ""
+                },
                 "event_types": event_types,
                 "event_statuses": event_statuses,
                 "rooms": rooms,
@@ -1073,9 +1317,6 @@ async def events(
         )
     except HTTPException:
         return RedirectResponse(url="/unregistered")
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 
 @app.post("/rooms/{room_id}/update")
 async def update_room(
@@ -1089,7 +1330,8 @@ async def update_room(
     image: Optional[UploadFile] = File(None),
     is_external: bool = Form(False),
     external_url: Optional[str] = Form(None),
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     """Обновление данных помещения"""
     image_filename = None
@@ -1097,7 +1339,6 @@ async def update_room(
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()
         
         room = await conn.fetchrow("SELECT * FROM rooms WHERE id = $1", room_id)
         if not room:
@@ -1144,7 +1385,7 @@ async def update_room(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating room: {e}")
+        logger.exception("Error updating room")
         if image_filename and (UPLOAD_DIR / image_filename).exists():
             (UPLOAD_DIR / image_filename).unlink()
         return templates.TemplateResponse(
@@ -1152,25 +1393,37 @@ async def update_room(
             {"request": request, "error": "Ошибка при обновлении помещения"},
             status_code=500
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
             
 @app.get("/events/create", name="create_event")
 async def create_event_form(
     request: Request,
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    capacity: Optional[int] = None,
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
         
-        conn = await get_connection()
         
-        event_types = await conn.fetch("SELECT * FROM event_types ORDER BY name")
+        event_types = await reference_cache.get(conn, "event_types")
+        age_categories = await reference_cache.get(conn, "age_categories")
+        
+        # Если интервал уже выбран, в форме только ресурсы, которые можно забронировать
+        error = None
         rooms = await conn.fetch("SELECT * FROM rooms ORDER BY name")
-        age_categories = await conn.fetch("SELECT * FROM age_categories ORDER BY name")
         employees = await conn.fetch("SELECT * FROM employees ORDER BY full_name")
+        if start and end:
+            try:
+                available = await find_available(
+                    conn, datetime.fromisoformat(start), datetime.fromisoformat(end), capacity=capacity
+                )
+                rooms = available["rooms"]
+                employees = available["employees"]
+            except ValueError as e:
+                error = str(e)
         
         return templates.TemplateResponse(
             "create_event.html",
@@ -1180,19 +1433,19 @@ async def create_event_form(
                 "event_types": event_types,
                 "rooms": rooms,
                 "age_categories": age_categories,
-                "employees": employees
+                "employees": employees,
+                "start": start,
+                "end": end,
+                "capacity": capacity,
+                "error": error
             }
         )
     except HTTPException:
         return RedirectResponse(url="/unregistered")
-    finally:
-        if 'conn' in locals():
-            await conn.close()
             
 @app.delete("/events/{event_id}")
-async def delete_event(request: Request, event_id: int):
+async def delete_event(request: Request, event_id: int, conn: asyncpg.Connection = Depends(get_db)):
     try:
-        conn = await get_connection()
         
         
         await conn.execute(
@@ -1205,18 +1458,16 @@ async def delete_event(request: Request, event_id: int):
             "DELETE FROM events WHERE id = $1",
             event_id
         )
+        availability_cache.invalidate()
         
         return JSONResponse({"success": True})
         
     except Exception as e:
-        print(f"Error deleting event: {e}")
+        logger.exception("Error deleting event")
         return JSONResponse(
             {"success": False, "error": str(e)},
             status_code=500
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
                         
 @app.post("/events/create")
 async def create_event(
@@ -1224,17 +1475,19 @@ async def create_event(
     name: str = Form(...),
     description: str = Form(...),
     event_type_id: int = Form(...),
-    room_id: int = Form(...),
+    room_id: Optional[int] = Form(None),
     start_time: str = Form(...),
     end_time: str = Form(...),
     min_age_category_id: Optional[int] = Form(None),
     max_participants: int = Form(...),
     employee_ids: List[int] = Form([]),
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    auto_allocate: bool = Form(False),
+    position_ids: List[int] = Form([]),
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     """Добавление помещения (внутреннего или внешнего)"""
     try:
-        conn = await get_connection()
         
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
@@ -1249,60 +1502,75 @@ async def create_event(
             )
         
         
-        event_types = await conn.fetch("SELECT * FROM event_types ORDER BY name")
-        rooms = await conn.fetch("SELECT * FROM rooms ORDER BY name")
-        age_categories = await conn.fetch("SELECT * FROM age_categories ORDER BY name")
-        employees = await conn.fetch("SELECT * FROM employees ORDER BY full_name")
-        
-        
-        event = await conn.fetchrow(
-            """INSERT INTO events 
-               (name, description, start_time, end_time, max_participants, 
-                min_age_category_id, event_type_id, organizer_id, status_id)
-               VALUES ($1, $2, $3, $4, $5, $6, $7, $8, 
-                      (SELECT id FROM event_statuses WHERE name = 'Запланировано'))
-               RETURNING id""",
-            name, description, start_datetime, end_datetime, max_participants,
-            min_age_category_id, event_type_id, current_user['id']
-        )
-        
-        
-        await conn.execute(
-            """INSERT INTO resource_bookings 
-               (event_id, resource_type, resource_id, start_time, end_time)
-               VALUES ($1, 'room', $2, $3, $4)""",
-            event['id'], room_id, start_datetime, end_datetime
-        )
-        
-        
-        for employee_id in employee_ids:
-            await conn.execute(
-                """INSERT INTO resource_bookings 
-                   (event_id, resource_type, resource_id, start_time, end_time)
-                   VALUES ($1, 'employee', $2, $3, $4)""",
-                event['id'], employee_id, start_datetime, end_datetime
+        # При автоподборе каждое вхождение position_ids - один требуемый сотрудник этой должности
+        contractor_ids = []
+        if auto_allocate:
+            required = {}
+            for position_id in position_ids:
+                required[position_id] = required.get(position_id, 0) + 1
+            allocation = await allocate(conn, Requirement(
+                start_datetime, end_datetime, capacity=max_participants, positions=required
+            ))
+            if not allocation["complete"]:
+                raise AllocationError(describe_shortages(allocation))
+            room_id = allocation["room"]["id"]
+            employee_ids = list(employee_ids) + [e["id"] for e in allocation["employees"]]
+            contractor_ids = [c["id"] for c in allocation["contractors"]]
+        elif room_id is None:
+            raise AllocationError("Выберите помещение или включите автоподбор ресурсов")
+        
+        # Мероприятие и все бронирования создаются атомарно: при любом конфликте
+        # откатывается всё, а организатор видит полный список конфликтов
+        async with conn.transaction():
+            event = await conn.fetchrow(
+                """INSERT INTO events 
+                   (name, description, start_time, end_time, max_participants, 
+                    min_age_category_id, event_type_id, organizer_id, status_id)
+                   VALUES ($1, $2, $3, $4, $5, $6, $7, $8, 
+                          (SELECT id FROM event_statuses WHERE name = 'Запланировано'))
+                   RETURNING id""",
+                name, description, start_datetime, end_datetime, max_participants,
+                min_age_category_id, event_type_id, current_user['id']
             )
+
+            results = await book_resources(
+                conn, event['id'], 'room', [room_id], start_datetime, end_datetime
+            )
+            results += await book_employees(
+                conn, event['id'], employee_ids, start_datetime, end_datetime
+            )
+            if has_conflicts(results):
+                raise BookingConflictError(results)
+            if contractor_ids:
+                await conn.executemany(
+                    "INSERT INTO event_contractors (event_id, contractor_id) VALUES ($1, $2)",
+                    [(event['id'], contractor_id) for contractor_id in contractor_ids]
+                )
+        availability_cache.invalidate()
         
         return RedirectResponse(url=f"/events/{event['id']}", status_code=303)
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error creating event: {e}")
-        
-        if 'event_types' not in locals():
-            conn = await get_connection()
-            event_types = await conn.fetch("SELECT * FROM event_types ORDER BY name")
-            rooms = await conn.fetch("SELECT * FROM rooms ORDER BY name")
-            age_categories = await conn.fetch("SELECT * FROM age_categories ORDER BY name")
-            employees = await conn.fetch("SELECT * FROM employees ORDER BY full_name")
-            await conn.close()
+        logger.exception("Error creating event")
+        if isinstance(e, BookingConflictError):
+            error = f"Ресурсы заняты: {describe_conflicts(e.results)}"
+        elif isinstance(e, AllocationError):
+            error = f"Не удалось подобрать ресурсы: {e}"
+        else:
+            error = "Ошибка при создании мероприятия"
+        
+        event_types = await reference_cache.get(conn, "event_types")
+        rooms = await conn.fetch("SELECT * FROM rooms ORDER BY name")
+        age_categories = await reference_cache.get(conn, "age_categories")
+        employees = await conn.fetch("SELECT * FROM employees ORDER BY full_name")
             
         return templates.TemplateResponse(
             "create_event.html",
             {
                 "request": request,
-                "error": "Ошибка при создании мероприятия",
+                "error": error,
                 "current_user": current_user,
                 "event_types": event_types,
                 "rooms": rooms,
@@ -1311,20 +1579,17 @@ async def create_event(
             },
             status_code=400
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
             
 @app.get("/events/{event_id}", name="event_details")
 async def event_details(
     request: Request,  # Добавляем request как первый параметр
     event_id: int,     # Параметр пути
-    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор'])) 
+    user_data: dict = Depends(role_required(['Пользователь', 'Сотрудник', 'Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
-        conn = await get_connection()     
         event = await conn.fetchrow(
             """SELECT 
                   e.id, e.name, e.description, e.start_time, e.end_time, 
@@ -1363,10 +1628,10 @@ async def event_details(
         current_employee_ids = [e['id'] for e in employees]
         
         
-        event_types = await conn.fetch("SELECT * FROM event_types ORDER BY name")
-        event_statuses = await conn.fetch("SELECT * FROM event_statuses ORDER BY name")
+        event_types = await reference_cache.get(conn, "event_types")
+        event_statuses = await reference_cache.get(conn, "event_statuses")
         rooms = await conn.fetch("SELECT * FROM rooms ORDER BY name")
-        age_categories = await conn.fetch("SELECT * FROM age_categories ORDER BY name")
+        age_categories = await reference_cache.get(conn, "age_categories")
         
         return templates.TemplateResponse(
             "event_details.html",
@@ -1386,11 +1651,8 @@ async def event_details(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error getting event details: {e}")
+        logger.exception("Error getting event details")
         raise HTTPException(status_code=500, detail="Ошибка сервера")
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 
 @app.get("/activity")
 async def external(request: Request,
@@ -1407,24 +1669,20 @@ async def external(request: Request,
         return RedirectResponse(url="/unregistered")
 
 @app.get("/api/positions")
-async def get_positions():
+async def get_positions(conn: asyncpg.Connection = Depends(get_db)):
     """Получение списка всех должностей"""
     try:
-        conn = await get_connection()
-        positions = await conn.fetch("SELECT id, name FROM positions ORDER BY name")
+        positions = await reference_cache.get(conn, "positions")
         return {
             "success": True,
             "positions": [{"id": p["id"], "name": p["name"]} for p in positions]
         }
     except Exception as e:
-        print(f"Error getting positions: {e}")
+        logger.exception("Error getting positions")
         return {"success": False, "error": str(e)}
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 
 @app.post("/api/positions/add")
-async def add_position(request: Request):
+async def add_position(request: Request, conn: asyncpg.Connection = Depends(get_db)):
     """Добавление новой должности"""
     try:
         data = await request.json()
@@ -1433,7 +1691,6 @@ async def add_position(request: Request):
         if not position_name:
             return {"success": False, "error": "Название должности не может быть пустым"}
         
-        conn = await get_connection()
         
         # Проверяем, существует ли уже такая должность
         existing_position = await conn.fetchrow(
@@ -1454,6 +1711,7 @@ async def add_position(request: Request):
             "INSERT INTO positions (name) VALUES ($1) RETURNING id",
             position_name
         )
+        await reference_cache.invalidate(conn, "positions")
         
         return {
             "success": True,
@@ -1463,11 +1721,8 @@ async def add_position(request: Request):
         }
         
     except Exception as e:
-        print(f"Error adding position: {e}")
+        logger.exception("Error adding position")
         return {"success": False, "error": str(e)}
-    finally:
-        if 'conn' in locals():
-            await conn.close()
             
 @app.post("/employees/add")
 async def add_employee(
@@ -1479,11 +1734,11 @@ async def add_employee(
     is_external: bool = Form(False),
     external_url: Optional[str] = Form(None),
     parsed_data: Optional[str] = Form(None),
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     """Добавление сотрудника (внутреннего или внешнего)"""
     try:
-        conn = await get_connection()
         current_user = user_data["user"]
         
         # Определяем ID должности
@@ -1518,18 +1773,16 @@ async def add_employee(
             INSERT INTO employees (full_name, position, position_id, contact_info, is_external, external_url)
             VALUES ($1, $2, $3, $4, $5, $6) RETURNING id
         """, full_name, position_name, final_position_id, contact_info, is_external, external_url)
+        await reference_cache.invalidate(conn, "positions")
         
         return RedirectResponse(url="/rooms?tab=employees", status_code=303)
         
     except Exception as e:
-        print(f"Error adding employee: {e}")
+        logger.exception("Error adding employee")
         raise HTTPException(
             status_code=500, 
             detail=f"Ошибка при добавлении сотрудника: {str(e)}"
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
             
 @app.post("/employees/{employee_id}/update")
 async def update_employee(
@@ -1541,11 +1794,11 @@ async def update_employee(
     contact_info: Optional[str] = Form(None),
     is_external: bool = Form(False),
     external_url: Optional[str] = Form(None),
-    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     """Обновление данных сотрудника"""
     try:
-        conn = await get_connection()
         
         # Определяем ID должности (аналогично добавлению)
         final_position_id = None
@@ -1579,59 +1832,37 @@ async def update_employee(
                 external_url = $6 
             WHERE id = $7
         """, full_name, position_name, final_position_id, contact_info, is_external, external_url, employee_id)
+        await reference_cache.invalidate(conn, "positions")
         
         return RedirectResponse(url="/rooms?tab=employees", status_code=303)
         
     except Exception as e:
-        print(f"Error updating employee: {e}")
+        logger.exception("Error updating employee")
         raise HTTPException(
             status_code=500, 
             detail=f"Ошибка при обновлении сотрудника: {str(e)}"
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 @app.get("/rooms")
 async def rooms(request: Request,
-                user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+                user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+                conn: asyncpg.Connection = Depends(get_db)
 ):
+    """Страница ресурсов; строки вкладок загружаются через /api/rooms и /api/employees"""
     try:
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
         
-        conn = await get_connection()
-        
-        rooms = await conn.fetch("""
-            SELECT r.*, rt.name as room_type_name 
-            FROM rooms r
-            LEFT JOIN room_types rt ON r.room_type_id = rt.id
-            ORDER BY r.name
-        """)
-        
-        employees = await conn.fetch("""
-            SELECT e.*, p.name as position_name 
-            FROM employees e
-            LEFT JOIN positions p ON e.position_id = p.id
-            ORDER BY e.full_name
-        """)
-        
-        room_types = await conn.fetch("SELECT * FROM room_types ORDER BY name")
-        positions = await conn.fetch("SELECT * FROM positions ORDER BY name")
-        
-        # Добавьте эту проверку для отладки
-        print(f"Количество должностей: {len(positions)}")
-        for position in positions:
-            print(f"Должность: {position['name']} (ID: {position['id']})")
+        room_types = await reference_cache.get(conn, "room_types")
+        positions = await reference_cache.get(conn, "positions")
         
         return templates.TemplateResponse(
             "rooms.html",
             {
                 "request": request,
                 "current_user": current_user,
-                "rooms": rooms,
-                "employees": employees,  
                 "room_types": room_types,
-                "positions": positions  # Убедитесь, что это передается
+                "positions": positions,
+                "page_size": RESOURCE_PAGE_SIZE
             }
         )
     except HTTPException as e:
@@ -1639,20 +1870,100 @@ async def rooms(request: Request,
             return RedirectResponse(url="/unregistered")
         raise
     except Exception as e:
-        print(f"Error in /rooms: {e}")
+        logger.exception("Error in /rooms")
         return templates.TemplateResponse(
             "error.html", 
             {"request": request, "error": str(e)}, 
             status_code=500
         )
-    finally:
-        await conn.close()
+
+@app.get("/api/rooms")
+async def api_rooms(
+    q: Optional[str] = None,
+    room_type_id: Optional[int] = None,
+    max_capacity: Optional[int] = None,
+    address: Optional[str] = None,
+    is_external: Optional[bool] = None,
+    sort: str = "name",
+    order: str = "asc",
+    page: int = 1,
+    page_size: int = RESOURCE_PAGE_SIZE,
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Страница помещений с сортировкой и фильтрами"""
+    try:
+        result = await rooms_page(
+            conn, sort=sort, order=order, page=page, page_size=page_size,
+            q=q, room_type_id=room_type_id, max_capacity=max_capacity,
+            address=address, is_external=is_external
+        )
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    except Exception as e:
+        logger.exception("Error listing rooms")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+    return {"success": True, **result}
+
+@app.get("/api/rooms/count")
+async def api_rooms_count(
+    q: Optional[str] = None,
+    room_type_id: Optional[int] = None,
+    max_capacity: Optional[int] = None,
+    address: Optional[str] = None,
+    is_external: Optional[bool] = None,
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Число помещений под теми же фильтрами"""
+    total = await rooms_count(
+        conn, q=q, room_type_id=room_type_id, max_capacity=max_capacity,
+        address=address, is_external=is_external
+    )
+    return {"success": True, "total": total}
+
+@app.get("/api/employees")
+async def api_employees(
+    q: Optional[str] = None,
+    position_id: Optional[int] = None,
+    is_external: Optional[bool] = None,
+    sort: str = "full_name",
+    order: str = "asc",
+    page: int = 1,
+    page_size: int = RESOURCE_PAGE_SIZE,
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Страница сотрудников с сортировкой и фильтрами"""
+    try:
+        result = await employees_page(
+            conn, sort=sort, order=order, page=page, page_size=page_size,
+            q=q, position_id=position_id, is_external=is_external
+        )
+    except ValueError as e:
+        return JSONResponse({"success": False, "error": str(e)}, status_code=400)
+    except Exception as e:
+        logger.exception("Error listing employees")
+        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
+    return {"success": True, **result}
+
+@app.get("/api/employees/count")
+async def api_employees_count(
+    q: Optional[str] = None,
+    position_id: Optional[int] = None,
+    is_external: Optional[bool] = None,
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Число сотрудников под теми же фильтрами"""
+    total = await employees_count(conn, q=q, position_id=position_id, is_external=is_external)
+    return {"success": True, "total": total}
         
 @app.get("/rooms/{room_id}")
 async def room_details(request: Request, room_id: int,
-                       user_data: dict = Depends(role_required(['Организатор', 'Администратор']))):
+                       user_data: dict = Depends(role_required(['Организатор', 'Администратор'])),
+                       conn: asyncpg.Connection = Depends(get_db)):
     try:
-        conn = await get_connection()
         current_user = user_data["user"]
         current_user['roles'] = user_data["roles"]
         
@@ -1669,7 +1980,7 @@ async def room_details(request: Request, room_id: int,
             raise HTTPException(status_code=404, detail="Помещение не найдено")
             
         # Получаем список типов помещений для формы редактирования
-        room_types = await conn.fetch("SELECT * FROM room_types ORDER BY name")
+        room_types = await reference_cache.get(conn, "room_types")
         
         # Получаем мероприятия в этом помещении
         events = await conn.fetch(
@@ -1695,16 +2006,12 @@ async def room_details(request: Request, room_id: int,
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error getting room details: {e}")
+        logger.exception("Error getting room details")
         raise HTTPException(status_code=500, detail="Ошибка сервера")
-    finally:
-        if 'conn' in locals():
-            await conn.close()
 
 @app.delete("/rooms/{room_id}")
-async def delete_room(request: Request, room_id: int):
+async def delete_room(request: Request, room_id: int, conn: asyncpg.Connection = Depends(get_db)):
     try:
-        conn = await get_connection()
         
         
         has_bookings = await conn.fetchval(
@@ -1730,11 +2037,8 @@ async def delete_room(request: Request, room_id: int):
         return JSONResponse({"success": True})
         
     except Exception as e:
-        print(f"Error deleting room: {e}")
+        logger.exception("Error deleting room")
         return JSONResponse({"success": False, "error": str(e)}, status_code=500)
-    finally:
-        if 'conn' in locals():
-            await conn.close()         
         
 @app.get("/unregistered")
 async def unregistered(
@@ -1756,130 +2060,260 @@ async def unregistered(
         }
     )
 
+@app.get("/metrics")
+async def prometheus_metrics(request: Request):
+    """Метрики маршрутов, запросов к БД и пула соединений в формате Prometheus"""
+    if METRICS_TOKEN:
+        if not secrets.compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"
+        ):
+            return Response(status_code=401)
+    elif not METRICS_PUBLIC:
+        return Response(status_code=401)
+    return Response(
+        metrics_registry.render(pool_stats()),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
-@app.get("/external/sync")
-async def sync_external_resources(request: Request):
-    """Синхронизация внешних ресурсов (специалистов и помещений)"""
-    try:
-        conn = await get_connection()
-        
-        
-        await sync_hh_contractors(conn)
-        
-        
-        await sync_flamp_venues(conn)
-        
-        return JSONResponse({"success": True, "message": "Внешние ресурсы успешно синхронизированы"})
-        
-    except Exception as e:
-        print(f"Error syncing external resources: {e}")
-        return JSONResponse({"success": False, "error": str(e)}, status_code=500)
-    finally:
-        if 'conn' in locals():
-            await conn.close()
+@app.get("/internal/db/pool")
+async def db_pool_metrics(
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Метрики заполненности пула соединений с БД"""
+    return JSONResponse(pool_stats())
 
-async def sync_hh_contractors(conn):
-    """Синхронизация специалистов с hh.ru"""
-    try:
-        
-        
-        contractors = [
-            {
-                "name": "Иванов Иван Иванович",
-                "specialty": "Охранник",
-                "contact_info": "https://hh.ru/resume/123",
-                "rating": 4.5,
-                "price_per_hour": 500
-            }
-        ]
-        
-        for contractor in contractors:
-            
-            exists = await conn.fetchval(
-                "SELECT EXISTS(SELECT 1 FROM external_contractors WHERE name = $1 AND specialty = $2)",
-                contractor["name"], contractor["specialty"]
-            )
-            
-            if not exists:
-                await conn.execute(
-                    "INSERT INTO external_contractors (name, specialty, contact_info, rating, price_per_hour) "
-                    "VALUES ($1, $2, $3, $4, $5)",
-                    contractor["name"], contractor["specialty"], 
-                    contractor["contact_info"], contractor["rating"],
-                    contractor["price_per_hour"]
-                )
-        
-    except Exception as e:
-        print(f"Error syncing hh contractors: {e}")
-        raise
+@app.get("/internal/db/slow-queries")
+async def slow_query_log(
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Последние медленные запросы этого воркера и их планы"""
+    return JSONResponse(slow_queries.stats())
+
+@app.get("/internal/profiler/requests")
+async def profiled_requests(
+    limit: int = Query(50, ge=1, le=500),
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Последние профилированные запросы этого воркера"""
+    return JSONResponse({"mode": profiler.mode, "items": profiler.recent(limit)})
+
+@app.get("/internal/profiler/requests/{profile_id}")
+async def profiled_request(
+    profile_id: str,
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Последовательность запросов к БД одного HTTP-запроса"""
+    profile = profiler.get(profile_id)
+    if profile is None:
+        return JSONResponse({"success": False, "error": "Профиль не найден"}, status_code=404)
+    return JSONResponse(profile.waterfall())
+
+@app.get("/internal/sessions/cache")
+async def session_cache_metrics(
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Счетчики попаданий и промахов кэша сессий"""
+    return JSONResponse(session_cache.stats())
+
+@app.get("/internal/sessions/storage")
+async def session_storage_metrics(
+    user_data: dict = Depends(role_required(['Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Размер таблицы сессий и скорость очистки истекших"""
+    return JSONResponse(await session_maintenance.stats(conn))
+
+@app.get("/internal/passwords")
+async def password_hash_metrics(
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Очередь и время вычисления bcrypt-хэшей"""
+    return JSONResponse(hash_stats())
+
+@app.get("/internal/passwords/reset-tokens")
+async def reset_token_metrics(
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Выданные, использованные и удаленные очисткой токены сброса пароля"""
+    return JSONResponse(reset_tokens.stats())
 
-async def sync_flamp_venues(conn):
-    """Синхронизация помещений с flamp"""
+@app.get("/internal/parsers/cache")
+async def parser_cache_metrics(
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Попадания и размер кэша страниц внешних сайтов"""
+    return JSONResponse({**parser_response_cache.stats(), "fetcher": parser_fetcher.stats})
+
+@app.get("/internal/availability/cache")
+async def availability_cache_metrics(
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Состояние индекса занятости ресурсов"""
+    return JSONResponse(availability_cache.stats())
+
+@app.get("/internal/reports/cache")
+async def report_cache_metrics(
+    user_data: dict = Depends(role_required(['Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Попадания в кэш отчетов и время их построения"""
+    return JSONResponse(await report_cache.stats(conn))
+
+@app.post("/internal/analytics/rebuild")
+async def rebuild_analytics(
+    user_data: dict = Depends(role_required(['Администратор'])),
+    conn: asyncpg.Connection = Depends(get_db)
+):
+    """Пересчет суточных агрегатов занятости по всем бронированиям"""
+    started = time.perf_counter()
+    rows = await rebuild_usage(conn)
+    return JSONResponse({
+        "success": True,
+        "rows": rows,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)
+    })
+
+@app.get("/internal/reference/cache")
+async def reference_cache_metrics(
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Версии и состояние кэша справочников"""
+    return JSONResponse(reference_cache.stats())
+
+
+def _job_json(job: dict) -> dict:
+    return json.loads(json.dumps(job, default=str))
+
+@app.post("/external/sync")
+async def sync_external_resources(
+    request: Request,
+    conn: asyncpg.Connection = Depends(get_db),
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Запуск фоновой синхронизации внешних ресурсов (специалистов и помещений)"""
+    jobs = []
+    for kind in SYNC_KINDS:
+        try:
+            job = await sync_jobs.start(conn, kind, None, user_data["user"]["id"])
+        except SyncJobConflict as e:
+            job = await sync_jobs.get(conn, e.job_id)
+        jobs.append(_job_json(job))
+    return JSONResponse(
+        {"success": True, "message": "Синхронизация внешних ресурсов запущена", "jobs": jobs},
+        status_code=202
+    )
+
+@app.post("/external/sync/jobs")
+async def start_sync_job(
+    request: Request,
+    conn: asyncpg.Connection = Depends(get_db),
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Запуск синхронизации одного вида: {"kind": "hh_contractors" | "flamp_venues", "urls": [...]}"""
+    data = await request.json()
+    kind = data.get("kind")
+    if kind not in SYNC_KINDS:
+        return JSONResponse({"success": False, "error": f"Неизвестный вид синхронизации: {kind}"}, status_code=400)
     try:
-        
-        
-        venues = [
-            {
-                "name": "Чердак (ночной клуб)",
-                "address": "ул. Ленина, 1",
-                "capacity": 100,
-                "description": "Ночной клуб с танцполом",
-                "room_type_id": 1,  
-                "is_external": True,
-                "image_filename": None
-            }
-        ]
-        
-        for venue in venues:
-            
-            exists = await conn.fetchval(
-                "SELECT EXISTS(SELECT 1 FROM rooms WHERE name = $1 AND address = $2)",
-                venue["name"], venue["address"]
-            )
-            
-            if not exists:
-                await conn.execute(
-                    "INSERT INTO rooms (name, address, capacity, description, room_type_id, is_external, image_filename) "
-                    "VALUES ($1, $2, $3, $4, $5, $6, $7)",
-                    venue["name"], venue["address"], venue["capacity"],
-                    venue["description"], venue["room_type_id"], 
-                    venue["is_external"], venue["image_filename"]
-                )
-        
-    except Exception as e:
-        print(f"Error syncing flamp venues: {e}")
-        raise
+        job = await sync_jobs.start(conn, kind, data.get("urls"), user_data["user"]["id"])
+    except SyncJobConflict as e:
+        return JSONResponse({"success": False, "error": str(e), "job_id": e.job_id}, status_code=409)
+    return JSONResponse({"success": True, "job": _job_json(job)}, status_code=202)
+
+@app.get("/external/sync/jobs")
+async def list_sync_jobs(
+    conn: asyncpg.Connection = Depends(get_db),
+    limit: int = Query(20, ge=1, le=200),
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+):
+    """Последние задания синхронизации"""
+    jobs = await sync_jobs.recent(conn, limit)
+    return JSONResponse({"success": True, "jobs": [_job_json(job) for job in jobs]})
+
+@app.get("/external/sync/jobs/{job_id}")
+async def get_sync_job(
+    job_id: int,
+    conn: asyncpg.Connection = Depends(get_db),
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+):
+    """Состояние и прогресс задания синхронизации"""
+    job = await sync_jobs.get(conn, job_id)
+    if job is None:
+        return JSONResponse({"success": False, "error": "Задание не найдено"}, status_code=404)
+    return JSONResponse({"success": True, "job": _job_json(job)})
+
+@app.post("/external/sync/jobs/{job_id}/cancel")
+async def cancel_sync_job(
+    job_id: int,
+    conn: asyncpg.Connection = Depends(get_db),
+    user_data: dict = Depends(role_required(['Администратор']))
+):
+    """Отмена задания синхронизации"""
+    job = await sync_jobs.cancel(conn, job_id)
+    if job is None:
+        return JSONResponse({"success": False, "error": "Задание не найдено или уже завершено"}, status_code=404)
+    return JSONResponse({"success": True, "job": _job_json(job)})
 
 @app.post("/api/parse/flamp")
 async def parse_flamp_venue(url: str = Form(...)):
     """Парсинг помещения с flamp.ru"""
     try:
-        from parsers.flamp_parser import parse_flamp_venue, format_for_db
-        result = parse_flamp_venue(url)
+        from parsers.flamp_parser import fetch_flamp_venue, format_for_db
+        result = await fetch_flamp_venue(url)
         if not result:
             return {"success": False, "error": "Не удалось распарсить заведение"}
         
         db_data = format_for_db(result)
         return {"success": True, "data": db_data}
     except Exception as e:
-        print(f"Error parsing flamp venue: {e}")
+        logger.exception("Error parsing flamp venue")
         return {"success": False, "error": str(e)}
 
 @app.post("/api/parse/hh")
 async def parse_hh_resume(url: str = Form(...)):
     """Парсинг резюме с hh.ru"""
     try:
-        from parsers.hh_parser import parse_hh_resume, format_for_db
-        result = parse_hh_resume(url)
+        from parsers.hh_parser import fetch_hh_resume, format_for_db
+        result = await fetch_hh_resume(url)
         if not result:
             return {"success": False, "error": "Не удалось распарсить резюме"}
         
         db_data = format_for_db(result)
         return {"success": True, "data": db_data}
     except Exception as e:
-        print(f"Error parsing hh resume: {e}")
+        logger.exception("Error parsing hh resume")
         return {"success": False, "error": str(e)}
 
+def _stream_parsed(results, format_for_db):
+    """Результаты пакетного парсинга в формате JSON Lines по мере готовности"""
+    async def lines():
+        async for url, result in results:
+            item = {"url": url, "success": result is not None}
+            if result is not None:
+                item["data"] = format_for_db(result)
+            yield json.dumps(item, ensure_ascii=False, default=str) + "\n"
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@app.post("/api/parse/flamp/bulk")
+async def parse_flamp_venues_bulk(
+    request: Request,
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+):
+    """Пакетный парсинг заведений: {"urls": [...]} -> JSON Lines"""
+    from parsers.flamp_parser import fetch_flamp_venues, format_for_db
+    data = await request.json()
+    return _stream_parsed(fetch_flamp_venues(data.get("urls", [])), format_for_db)
+
+@app.post("/api/parse/hh/bulk")
+async def parse_hh_resumes_bulk(
+    request: Request,
+    user_data: dict = Depends(role_required(['Организатор', 'Администратор']))
+):
+    """Пакетный парсинг резюме: {"urls": [...]} -> JSON Lines"""
+    from parsers.hh_parser import fetch_hh_resumes, format_for_db
+    data = await request.json()
+    return _stream_parsed(fetch_hh_resumes(data.get("urls", [])), format_for_db)
+
 
 @app.post("/rooms/add")
 async def add_room(
@@ -1892,13 +2326,13 @@ async def add_room(
     image: Optional[UploadFile] = File(None),
     is_external: bool = Form(False),
     external_url: Optional[str] = Form(None),
-    parsed_data: Optional[str] = Form(None)
+    parsed_data: Optional[str] = Form(None),
+    conn: asyncpg.Connection = Depends(get_db)
 ):
     """Добавление помещения (внутреннего или внешнего)"""
     image_filename = None  
     
     try:
-        conn = await get_connection()
         
         
         if parsed_data:
@@ -1912,7 +2346,7 @@ async def add_room(
                 is_external = True  
                 external_url = parsed_data.get('source_url', external_url)
             except json.JSONDecodeError as e:
-                print(f"Ошибка декодирования JSON: {e}")
+                logger.warning("Ошибка декодирования JSON: %s", e)
                 
         
         
@@ -1939,7 +2373,7 @@ async def add_room(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Ошибка добавления помещения: {e}")
+        logger.exception("Ошибка добавления помещения")
         if image_filename and (UPLOAD_DIR / image_filename).exists():
             (UPLOAD_DIR / image_filename).unlink()
         return templates.TemplateResponse(
@@ -1947,9 +2381,6 @@ async def add_room(
             {"request": request, "error": "Ошибка при добавлении помещения"},
             status_code=500
         )
-    finally:
-        if 'conn' in locals():
-            await conn.close()
             
 if __name__ == "__main__":
     import uvicorn
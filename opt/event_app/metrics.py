@@ -0,0 +1,224 @@
+"""
+Метрики HTTP-запросов и запросов к БД в текстовом формате Prometheus.
+
+MetricsMiddleware - ASGI-промежуточный слой без буферизации ответа: на запрос
+приходится пара вызовов perf_counter и несколько обновлений словарей. Маршрут
+в метках - шаблон пути FastAPI (/events/{event_id}), а не сам путь, поэтому
+число рядов ограничено числом маршрутов; статика и 404 попадают в
+route="unmatched".
+
+Время и число запросов к БД собирает обработчик query logger asyncpg
+(observe_query), который подключается к каждому соединению пула. Обработчик
+вызывается в контексте задачи, выполнившей запрос, и добавляет время к
+статистике текущего HTTP-запроса - так запросы к БД относятся к маршруту, и
+отношение http_request_db_queries_total к http_requests_total показывает
+маршруты с N+1.
+
+/metrics отдается только с заголовком "Authorization: Bearer <METRICS_TOKEN>";
+без заданного METRICS_TOKEN конечная точка закрыта. Открыть ее без токена
+(например, когда порт доступен только сборщику метрик) - METRICS_PUBLIC=1.
+"""
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Optional
+
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+METRICS_PUBLIC = os.getenv("METRICS_PUBLIC", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+UNMATCHED_ROUTE = "unmatched"
+
+
+class RequestStats:
+    """Запросы к БД в рамках одного HTTP-запроса"""
+
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            yield bound, total
+        yield "+Inf", total + self.counts[-1]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.in_flight = 0
+        self.requests = {}          # (method, route, status) -> число запросов
+        self.latency = {}           # (method, route) -> Histogram
+        self.db_seconds = {}        # (method, route) -> секунды в БД
+        self.db_queries = {}        # (method, route) -> число запросов к БД
+        self.queries_per_request = {}  # (method, route) -> Histogram
+        self.background_queries = 0
+        self.background_db_seconds = 0.0
+
+    def observe_request(self, method: str, route: str, status: int, elapsed: float, stats: RequestStats):
+        key = (method, route)
+        status_key = (method, route, status)
+        self.requests[status_key] = self.requests.get(status_key, 0) + 1
+
+        latency = self.latency.get(key)
+        if latency is None:
+            latency = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            self.queries_per_request[key] = Histogram(QUERY_COUNT_BUCKETS)
+            self.db_seconds[key] = 0.0
+            self.db_queries[key] = 0
+        latency.observe(elapsed)
+        self.queries_per_request[key].observe(stats.queries)
+        self.db_seconds[key] += stats.db_seconds
+        self.db_queries[key] += stats.queries
+
+    def observe_query(self, elapsed: float):
+        stats = current_request.get()
+        if stats is None:
+            self.background_queries += 1
+            self.background_db_seconds += elapsed
+        else:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+    def render(self, pool: Optional[dict] = None) -> str:
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, key_labels, hist):
+            for bound, total in hist.cumulative():
+                lines.append(f"{name}_bucket{_labels(**key_labels, le=bound)} {total}")
+            lines.append(f"{name}_sum{_labels(**key_labels)} {hist.sum}")
+            lines.append(f"{name}_count{_labels(**key_labels)} {hist.count}")
+
+        header("http_requests_in_flight", "gauge", "Запросы, обрабатываемые сейчас")
+        lines.append(f"http_requests_in_flight {self.in_flight}")
+
+        header("http_requests_total", "counter", "Завершенные запросы по маршруту и коду ответа")
+        for (method, route, status), count in sorted(self.requests.items()):
+            lines.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {count}")
+
+        header("http_request_duration_seconds", "histogram", "Время обработки запроса")
+        for (method, route), hist in sorted(self.latency.items()):
+            histogram("http_request_duration_seconds", {"method": method, "route": route}, hist)
+
+        header("http_request_db_seconds_total", "counter", "Время запросов к БД, отнесенное к маршруту")
+        for (method, route), seconds in sorted(self.db_seconds.items()):
+            lines.append(f"http_request_db_seconds_total{_labels(method=method, route=route)} {seconds}")
+
+        header("http_request_db_queries_total", "counter", "Число запросов к БД, отнесенное к маршруту")
+        for (method, route), count in sorted(self.db_queries.items()):
+            lines.append(f"http_request_db_queries_total{_labels(method=method, route=route)} {count}")
+
+        header("http_request_db_queries", "histogram", "Число запросов к БД на один HTTP-запрос")
+        for (method, route), hist in sorted(self.queries_per_request.items()):
+            histogram("http_request_db_queries", {"method": method, "route": route}, hist)
+
+        header("db_background_queries_total", "counter", "Запросы к БД вне HTTP-запросов (фоновые задачи)")
+        lines.append(f"db_background_queries_total {self.background_queries}")
+        header("db_background_seconds_total", "counter", "Время запросов к БД вне HTTP-запросов")
+        lines.append(f"db_background_seconds_total {self.background_db_seconds}")
+
+        if pool is not None:
+            for name, help_text in (
+                ("size", "Соединения в пуле"),
+                ("in_use", "Занятые соединения"),
+                ("idle", "Свободные соединения"),
+                ("waiters", "Ожидающие соединения из пула"),
+            ):
+                header(f"db_pool_{name}", "gauge", help_text)
+                lines.append(f"db_pool_{name} {pool[name]}")
+            header("db_pool_acquire_timeouts_total", "counter", "Таймауты ожидания соединения")
+            lines.append(f"db_pool_acquire_timeouts_total {pool['timeouts_total']}")
+            header("db_pool_acquire_seconds", "histogram", "Ожидание соединения из пула")
+            latency = pool["acquire_latency"]
+            for bound, total in latency["buckets"].items():
+                lines.append(f"db_pool_acquire_seconds_bucket{_labels(le=bound)} {total}")
+            lines.append(f"db_pool_acquire_seconds_sum {latency['sum']}")
+            lines.append(f"db_pool_acquire_seconds_count {latency['count']}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def observe_query(record):
+    """Обработчик conn.add_query_logger: record - asyncpg LoggedQuery"""
+    registry.observe_query(record.elapsed)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        registry.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+            # asyncpg вызывает обработчики query logger через call_soon: один проход
+            # цикла событий, чтобы время последнего запроса к БД попало в статистику
+            await asyncio.sleep(0)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.in_flight -= 1
+            current_request.reset(token)
+            route = scope.get("route")
+            registry.observe_request(
+                scope["method"],
+                getattr(route, "path", None) or UNMATCHED_ROUTE,
+                status,
+                elapsed,
+                stats
+            )
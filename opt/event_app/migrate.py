@@ -0,0 +1,202 @@
+"""
+Версионные миграции схемы БД.
+
+Миграции лежат в sql/migrations/ и называются NNNN_описание.sql. Применённые
+версии записываются в таблицу schema_migrations. Миграция с первой строкой
+"-- migrate: no-transaction" выполняется вне транзакции по одной команде
+(нужно для CREATE INDEX CONCURRENTLY). Для секционированных таблиц (user_sessions
+после "python session_maintenance.py partition") CONCURRENTLY не поддерживается:
+индексы на них создаются обычной миграцией в транзакции.
+
+    python migrate.py status
+    python migrate.py upgrade [--target N] [--dry-run]
+    python migrate.py baseline N
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+from pathlib import Path
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MIGRATIONS_DIR = Path(__file__).parent / "sql" / "migrations"
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+
+# Произвольный ключ advisory-блокировки, чтобы миграции не запускались параллельно
+ADVISORY_LOCK_KEY = 727_001
+
+_FILENAME_RE = re.compile(r"^(\d{4})_([\w-]+)\.sql$")
+
+
+class Migration:
+    def __init__(self, path: Path):
+        match = _FILENAME_RE.match(path.name)
+        if not match:
+            raise ValueError(f"Неверное имя файла миграции: {path.name}")
+        self.version = int(match.group(1))
+        self.name = match.group(2)
+        self.path = path
+        self.sql = path.read_text(encoding="utf-8")
+        self.checksum = hashlib.sha256(self.sql.encode("utf-8")).hexdigest()
+        self.transactional = not self.sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+
+    def statements(self):
+        """Команды миграции по одной (для выполнения вне транзакции)"""
+        lines = [l for l in self.sql.splitlines() if not l.strip().startswith("--")]
+        return [s.strip() for s in "\n".join(lines).split(";") if s.strip()]
+
+
+def load_migrations():
+    migrations = [Migration(p) for p in sorted(MIGRATIONS_DIR.glob("*.sql"))]
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Обнаружены миграции с одинаковым номером")
+    return migrations
+
+
+async def ensure_ledger(conn):
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name TEXT NOT NULL,
+            checksum TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        )
+    """)
+
+
+async def applied_migrations(conn):
+    exists = await conn.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL")
+    if not exists:
+        return {}
+    rows = await conn.fetch("SELECT version, checksum FROM schema_migrations")
+    return {r["version"]: r["checksum"] for r in rows}
+
+
+async def pending_migrations(conn, target=None):
+    applied = await applied_migrations(conn)
+    pending = []
+    for migration in load_migrations():
+        if migration.version in applied:
+            if applied[migration.version] != migration.checksum:
+                print(f"Внимание: миграция {migration.path.name} изменена после применения")
+            continue
+        if target is not None and migration.version > target:
+            break
+        pending.append(migration)
+    return pending
+
+
+async def apply_migration(conn, migration: Migration):
+    if migration.transactional:
+        async with conn.transaction():
+            await conn.execute(migration.sql)
+            await _record(conn, migration)
+    else:
+        for statement in migration.statements():
+            await conn.execute(statement)
+        await _record(conn, migration)
+
+
+async def _record(conn, migration: Migration):
+    await conn.execute(
+        "INSERT INTO schema_migrations (version, name, checksum) VALUES ($1, $2, $3)",
+        migration.version, migration.name, migration.checksum
+    )
+
+
+async def upgrade(conn, target=None, dry_run=False):
+    """Применение всех неприменённых миграций (или вывод их SQL при dry_run)"""
+    await conn.execute("SELECT pg_advisory_lock($1)", ADVISORY_LOCK_KEY)
+    try:
+        if not dry_run:
+            await ensure_ledger(conn)
+        pending = await pending_migrations(conn, target)
+        if not pending:
+            print("Схема БД актуальна")
+            return []
+
+        for migration in pending:
+            mode = "в транзакции" if migration.transactional else "без транзакции"
+            if dry_run:
+                print(f"-- [dry-run] {migration.path.name} ({mode})")
+                print(migration.sql)
+                continue
+            print(f"Применение {migration.path.name} ({mode})...")
+            await apply_migration(conn, migration)
+        return pending
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", ADVISORY_LOCK_KEY)
+
+
+async def baseline(conn, version: int):
+    """Отметка миграций до version как применённых (для БД, созданных до миграций)"""
+    await ensure_ledger(conn)
+    for migration in load_migrations():
+        if migration.version > version:
+            break
+        await conn.execute(
+            "INSERT INTO schema_migrations (version, name, checksum) VALUES ($1, $2, $3) "
+            "ON CONFLICT (version) DO NOTHING",
+            migration.version, migration.name, migration.checksum
+        )
+    print(f"Миграции до версии {version} отмечены как применённые")
+
+
+async def verify_schema(conn):
+    """Проверка при запуске приложения: все миграции должны быть применены"""
+    pending = await pending_migrations(conn)
+    if pending:
+        names = ", ".join(m.path.name for m in pending)
+        raise RuntimeError(
+            f"Схема БД устарела, не применены миграции: {names}. "
+            f"Выполните: python migrate.py upgrade"
+        )
+
+
+async def status(conn):
+    applied = await applied_migrations(conn)
+    for migration in load_migrations():
+        state = "применена" if migration.version in applied else "ожидает"
+        print(f"{migration.version:04d}  {state:10}  {migration.name}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    upgrade_parser = subparsers.add_parser("upgrade", help="применить миграции")
+    upgrade_parser.add_argument("--target", type=int, default=None)
+    upgrade_parser.add_argument("--dry-run", action="store_true")
+
+    subparsers.add_parser("status", help="список миграций и их состояние")
+
+    baseline_parser = subparsers.add_parser("baseline", help="отметить миграции как применённые")
+    baseline_parser.add_argument("version", type=int)
+
+    args = parser.parse_args()
+
+    database_url = os.getenv("DATABASE_URL")
+    if not database_url:
+        raise ValueError("DATABASE_URL environment variable is not set")
+    database_url = database_url.replace("postgresql+asyncpg://", "postgres://")
+
+    conn = await asyncpg.connect(database_url)
+    try:
+        if args.command == "upgrade":
+            await upgrade(conn, target=args.target, dry_run=args.dry_run)
+        elif args.command == "status":
+            await status(conn)
+        elif args.command == "baseline":
+            await baseline(conn, args.version)
+    finally:
+        await conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,239 @@
+"""
+Декларативное извлечение полей из HTML с подключаемым движком разбора.
+
+Поля каждого источника описываются один раз (CSS-селекторы в Source), а
+разбор выполняет самый быстрый доступный движок: selectolax, lxml или
+BeautifulSoup с html.parser. Для BeautifulSoup строится только нужная часть
+дерева через SoupStrainer.
+
+Движок можно выбрать явно переменной окружения PARSER_BACKEND.
+"""
+import os
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+NOT_SPECIFIED = "Не указано"
+
+
+class Field:
+    """
+    Поле страницы.
+
+    selector=None означает текущий узел; attr - значение атрибута вместо
+    текста; many - список всех совпадений; fields - вложенная запись,
+    извлекаемая относительно каждого найденного узла.
+    """
+
+    def __init__(
+        self,
+        selector: Optional[str] = None,
+        attr: Optional[str] = None,
+        many: bool = False,
+        default=NOT_SPECIFIED,
+        fields: Optional[Dict[str, "Field"]] = None
+    ):
+        self.selector = selector
+        self.attr = attr
+        self.many = many
+        self.fields = fields
+        if many:
+            self.default = []
+        elif attr is not None or fields is not None:
+            self.default = None if default is NOT_SPECIFIED else default
+        else:
+            self.default = default
+
+
+class Source:
+    """Описание страниц одного источника"""
+
+    def __init__(
+        self,
+        name: str,
+        fields: Dict[str, Field],
+        root: Optional[str] = None,
+        strain_class_prefixes: Iterable[str] = (),
+        finalize: Optional[Callable[[dict, str], dict]] = None
+    ):
+        self.name = name
+        self.fields = fields
+        self.root = root
+        self.strain_class_prefixes = tuple(strain_class_prefixes)
+        self.finalize = finalize
+
+
+class Backend:
+    name = "base"
+
+    def parse(self, html: str, source: Source):
+        raise NotImplementedError
+
+    def select(self, node, css: str) -> list:
+        raise NotImplementedError
+
+    def text(self, node) -> str:
+        raise NotImplementedError
+
+    def attr(self, node, name: str) -> Optional[str]:
+        raise NotImplementedError
+
+
+class SelectolaxBackend(Backend):
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+
+    def parse(self, html, source):
+        tree = self._parser(html)
+        return tree.root if tree.root is not None else tree
+
+    def select(self, node, css):
+        # lexbor включает в выборку сам узел, если он подходит под селектор
+        return [match for match in node.css(css) if match.mem_id != node.mem_id]
+
+    def text(self, node):
+        return node.text()
+
+    def attr(self, node, name):
+        return node.attributes.get(name)
+
+
+class LxmlBackend(Backend):
+    name = "lxml"
+
+    def __init__(self):
+        import lxml.html
+        from cssselect import HTMLTranslator
+        from lxml.etree import XPath
+        self._fromstring = lxml.html.fromstring
+        self._translator = HTMLTranslator()
+        self._xpath = XPath
+        self._selectors = {}
+
+    def parse(self, html, source):
+        return self._fromstring(html)
+
+    def select(self, node, css):
+        selector = self._selectors.get(css)
+        if selector is None:
+            # Только потомки, без самого узла - как в остальных движках
+            selector = self._selectors[css] = self._xpath(
+                self._translator.css_to_xpath(css, prefix="descendant::")
+            )
+        return selector(node)
+
+    def text(self, node):
+        return node.text_content()
+
+    def attr(self, node, name):
+        return node.get(name)
+
+
+class SoupBackend(Backend):
+    name = "html.parser"
+
+    def __init__(self):
+        from bs4 import BeautifulSoup, SoupStrainer
+        self._soup = BeautifulSoup
+        self._strainer = SoupStrainer
+        self._strainers = {}
+
+    def _strainer_for(self, source: Source):
+        if not source.strain_class_prefixes:
+            return None
+        if source.name not in self._strainers:
+            prefixes = source.strain_class_prefixes
+            self._strainers[source.name] = self._strainer(
+                class_=lambda value: value is not None and value.startswith(prefixes)
+            )
+        return self._strainers[source.name]
+
+    def parse(self, html, source):
+        return self._soup(html, "html.parser", parse_only=self._strainer_for(source))
+
+    def select(self, node, css):
+        return node.select(css)
+
+    def text(self, node):
+        return node.get_text()
+
+    def attr(self, node, name):
+        return node.get(name)
+
+
+BACKENDS = {
+    "selectolax": SelectolaxBackend,
+    "lxml": LxmlBackend,
+    "html.parser": SoupBackend,
+}
+
+_backends: Dict[str, Backend] = {}
+
+
+def available_backends() -> List[str]:
+    names = []
+    for name in BACKENDS:
+        try:
+            get_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+
+def get_backend(name: Optional[str] = None) -> Backend:
+    """Движок по имени или первый доступный в порядке selectolax, lxml, html.parser"""
+    name = name or os.getenv("PARSER_BACKEND")
+    if name:
+        if name not in _backends:
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
+
+    for candidate in BACKENDS:
+        try:
+            return get_backend(candidate)
+        except ImportError:
+            continue
+    raise ImportError("Не найден ни один движок разбора HTML")
+
+
+def _extract_fields(backend: Backend, node, fields: Dict[str, Field]) -> dict:
+    values = {}
+    for key, field in fields.items():
+        nodes = [node] if field.selector is None else backend.select(node, field.selector)
+        if not nodes:
+            values[key] = field.default
+            continue
+        if not field.many:
+            nodes = nodes[:1]
+
+        items = []
+        for match in nodes:
+            if field.fields is not None:
+                items.append(_extract_fields(backend, match, field.fields))
+            elif field.attr is not None:
+                items.append(backend.attr(match, field.attr))
+            else:
+                items.append(backend.text(match).strip())
+        values[key] = items if field.many else items[0]
+    return values
+
+
+def extract(source: Source, html: str, url: str, backend: Optional[Backend] = None) -> Optional[dict]:
+    """Значения полей источника; None, если на странице нет корневого блока"""
+    backend = backend or get_backend()
+    document = backend.parse(html, source)
+
+    node = document
+    if source.root is not None:
+        roots = backend.select(document, source.root)
+        if not roots:
+            return None
+        node = roots[0]
+
+    values = _extract_fields(backend, node, source.fields)
+    if source.finalize is not None:
+        values = source.finalize(values, url)
+    return values
@@ -0,0 +1,195 @@
+"""
+Асинхронная загрузка страниц для парсеров.
+
+Один общий httpx.AsyncClient (пул соединений с keep-alive), ограничение
+числа одновременных запросов к каждому хосту, таймауты и повторы с
+экспоненциальной задержкой. fetch_many принимает сотни URL и отдает
+результаты по мере готовности.
+"""
+import asyncio
+import logging
+import os
+import random
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = float(os.getenv("PARSER_FETCH_TIMEOUT", "10"))
+FETCH_CONNECT_TIMEOUT = float(os.getenv("PARSER_CONNECT_TIMEOUT", "5"))
+FETCH_RETRIES = int(os.getenv("PARSER_FETCH_RETRIES", "3"))
+FETCH_BACKOFF = float(os.getenv("PARSER_FETCH_BACKOFF", "0.5"))
+FETCH_PER_HOST_LIMIT = int(os.getenv("PARSER_PER_HOST_LIMIT", "4"))
+FETCH_MAX_CONNECTIONS = int(os.getenv("PARSER_MAX_CONNECTIONS", "50"))
+# Retry-After длиннее этого значения - отказ без повтора, а не ожидание в запросе
+FETCH_MAX_RETRY_AFTER = float(os.getenv("PARSER_MAX_RETRY_AFTER", "60"))
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+# Ответы, после которых имеет смысл повторить запрос
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class FetchError(Exception):
+    """Страницу не удалось загрузить после всех попыток"""
+
+    def __init__(self, url: str, message: str, status_code: Optional[int] = None):
+        super().__init__(f"{url}: {message}")
+        self.url = url
+        self.status_code = status_code
+
+
+class Fetcher:
+    def __init__(
+        self,
+        per_host_limit: int = FETCH_PER_HOST_LIMIT,
+        max_connections: int = FETCH_MAX_CONNECTIONS,
+        timeout: float = FETCH_TIMEOUT,
+        connect_timeout: float = FETCH_CONNECT_TIMEOUT,
+        retries: int = FETCH_RETRIES,
+        backoff: float = FETCH_BACKOFF,
+        max_retry_after: float = FETCH_MAX_RETRY_AFTER,
+        headers: Optional[Dict[str, str]] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.per_host_limit = per_host_limit
+        self.max_connections = max_connections
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        self.headers = {**DEFAULT_HEADERS, **(headers or {})}
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self.stats = {"requests": 0, "retries": 0, "failures": 0}
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                follow_redirects=True,
+                transport=self.transport
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.per_host_limit)
+        return self._host_slots[host]
+
+    def _delay(self, attempt: int, response: Optional[httpx.Response] = None) -> Optional[float]:
+        """Пауза перед повтором; None - сервер просит ждать дольше max_retry_after"""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = float(retry_after)
+                return delay if delay <= self.max_retry_after else None
+        # Экспоненциальная задержка со случайным разбросом, чтобы повторы не шли залпом
+        return self.backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """GET с повторами; 2xx и 304 возвращаются, остальное - FetchError"""
+        last_error = None
+        for attempt in range(self.retries + 1):
+            response = None
+            try:
+                async with self._slot(url):
+                    self.stats["requests"] += 1
+                    response = await self.client.get(url, headers=headers)
+                if response.status_code < 400:
+                    return response
+                last_error = FetchError(url, f"HTTP {response.status_code}", response.status_code)
+                if response.status_code not in RETRY_STATUSES:
+                    break
+            except httpx.TransportError as e:
+                last_error = FetchError(url, f"{type(e).__name__}: {e}")
+
+            if attempt < self.retries:
+                delay = self._delay(attempt, response)
+                if delay is None:
+                    last_error = FetchError(
+                        url,
+                        f"HTTP {response.status_code}, Retry-After больше {self.max_retry_after:g} с",
+                        response.status_code
+                    )
+                    break
+                self.stats["retries"] += 1
+                logger.info("Повтор %s/%s для %s через %.2f с: %s", attempt + 1, self.retries, url, delay, last_error)
+                await asyncio.sleep(delay)
+
+        self.stats["failures"] += 1
+        raise last_error
+
+    async def fetch_many(
+        self,
+        urls: Iterable[str],
+        handle: Callable[[str, httpx.Response], Awaitable[object]],
+        concurrency: int = 100
+    ) -> AsyncIterator[tuple]:
+        """
+        Загрузка и обработка набора URL; (url, результат, ошибка) отдаются по мере готовности.
+
+        concurrency ограничивает число задач в работе, чтобы тысячи URL
+        не создавали тысячи корутин сразу; ограничение по хостам действует дополнительно.
+        """
+        async def worker(url):
+            return await handle(url, await self.get(url))
+
+        async for item in map_completed(urls, worker, concurrency):
+            yield item
+
+
+async def map_completed(
+    urls: Iterable[str],
+    worker: Callable[[str], Awaitable[object]],
+    concurrency: int = 100
+) -> AsyncIterator[tuple]:
+    """worker для каждого URL с ограничением числа задач; (url, результат, ошибка) по мере готовности"""
+    urls = list(dict.fromkeys(urls))
+    pending = set()
+    position = 0
+
+    async def run(url):
+        try:
+            return url, await worker(url), None
+        except Exception as e:
+            return url, None, e
+
+    try:
+        while position < len(urls) or pending:
+            while position < len(urls) and len(pending) < concurrency:
+                pending.add(asyncio.ensure_future(run(urls[position])))
+                position += 1
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+fetcher = Fetcher()
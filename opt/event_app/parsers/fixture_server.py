@@ -0,0 +1,122 @@
+"""
+Локальный HTTP-сервер с сохраненными страницами для проверки парсеров без сети.
+
+    /flamp/<любой путь>       страница заведения из fixtures/flamp_venue.html
+    /hh/<любой путь>          резюме из fixtures/hh_resume.html
+    /flaky/<n>/<путь>         первые n запросов к пути отвечают 503, затем как <путь>
+    /slow/<мс>/<путь>         ответ с задержкой
+    /status/<код>             пустой ответ с заданным кодом
+
+Страницы отдаются с ETag и Last-Modified и поддерживают условные запросы.
+
+    python -m parsers.fixture_server --port 8765
+
+Из кода - контекстный менеджер serve(), который запускает сервер в фоновом потоке:
+
+    with serve() as base_url:
+        result = parse_flamp_venue(f"{base_url}/flamp/firm/test")
+"""
+import argparse
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+
+ROUTES = {
+    "flamp": "flamp_venue.html",
+    "hh": "hh_resume.html",
+}
+
+STARTED_AT = formatdate(time.time(), usegmt=True)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    attempts = {}
+    attempts_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        parts = self.path.lstrip("/").split("/")
+        self._route(parts)
+
+    def _route(self, parts):
+        head = parts[0] if parts else ""
+
+        if head == "flaky" and len(parts) >= 3 and parts[1].isdigit():
+            key = "/".join(parts)
+            with self.attempts_lock:
+                seen = self.attempts.get(key, 0)
+                self.attempts[key] = seen + 1
+            if seen < int(parts[1]):
+                return self._send(503, b"", {"Retry-After": "0"})
+            return self._route(parts[2:])
+
+        if head == "slow" and len(parts) >= 3 and parts[1].isdigit():
+            time.sleep(int(parts[1]) / 1000)
+            return self._route(parts[2:])
+
+        if head == "status" and len(parts) >= 2 and parts[1].isdigit():
+            return self._send(int(parts[1]), b"")
+
+        if head in ROUTES:
+            body = (FIXTURES_DIR / ROUTES[head]).read_bytes()
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == etag or self.headers.get("If-Modified-Since") == STARTED_AT:
+                return self._send(304, b"", {"ETag": etag, "Last-Modified": STARTED_AT})
+            return self._send(200, body, {
+                "Content-Type": "text/html; charset=utf-8",
+                "ETag": etag,
+                "Last-Modified": STARTED_AT,
+            })
+
+        self._send(404, b"")
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+@contextmanager
+def serve(host: str = "127.0.0.1", port: int = 0):
+    """Сервер в фоновом потоке; возвращает базовый URL"""
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        FixtureHandler.attempts.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер тестовых страниц для парсеров")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), FixtureHandler)
+    print(f"Сервер тестовых страниц: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
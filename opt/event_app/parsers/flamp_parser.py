@@ -1,126 +1,141 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
 import logging
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Iterable, Optional
 import sys
 import io
 
+from parsers.extract import Field, Source, extract
+from parsers.fetcher import Fetcher, fetcher as shared_fetcher, map_completed
+from parsers.http_cache import ResponseCache, response_cache
+
 
 if sys.stdout.encoding != 'UTF-8':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler('flamp_parser.log'), logging.StreamHandler()]
+logger = logging.getLogger(__name__)
+
+def _finalize_venue(values: dict, url: str) -> dict:
+    geo = values['geo'] or {}
+    categories_block = values['categories_block']
+
+    additional_info = {}
+    for row in values['info_rows']:
+        if row['label'] is not None and row['content'] is not None:
+            additional_info[row['label']] = row['content']['items']
+
+    return {
+        'name': values['name'],
+        'type': values['type'],
+        'average_bill': values['average_bill'],
+        'latitude': geo.get('lat'),
+        'longitude': geo.get('lon'),
+        'address': values['address'],
+        'rating': values['rating'],
+        'reviews_count': values['reviews_count'],
+        'phone': values['phone'],
+        'work_hours': values['work_hours'],
+        'categories': categories_block['items'] if categories_block else [],
+        'additional_info': additional_info,
+        'message_link': values['message_link'],
+        'source_url': url
+    }
+
+ITEMS = {'items': Field('li.list__item', many=True)}
+
+FLAMP_VENUE = Source(
+    name='flamp_venue',
+    strain_class_prefixes=('header-filial', 'filial-'),
+    fields={
+        'name': Field('h1.header-filial__name'),
+        'type': Field('div.header-filial__subtitle'),
+        'average_bill': Field('li.header-filial__tag'),
+        'geo': Field('div.filial-location__map', fields={
+            'lat': Field(attr='data-lat'),
+            'lon': Field(attr='data-lon'),
+        }),
+        'address': Field('div.filial-address__label'),
+        'rating': Field('div.filial-rating__value'),
+        'reviews_count': Field('a.filial-rating__reviews'),
+        'phone': Field('a[href^="tel:"]'),
+        'work_hours': Field('div.filial-workhours__timetable'),
+        'categories_block': Field('div.filial-info-row__content', fields=ITEMS),
+        'info_rows': Field('div.filial-info__row', many=True, fields={
+            'label': Field('div.l-inner__column--side', default=None),
+            'content': Field('div.filial-info-row__content', fields=ITEMS),
+        }),
+        'message_link': Field(
+            'a.action.button-cta.button-cta--thm-white-round.button-cta--icon-message.js-link',
+            attr='href'
+        ),
+    },
+    finalize=_finalize_venue
 )
 
-def parse_flamp_venue(url: str) -> Optional[Dict[str, str]]:
+def extract_flamp_venue(html: str, url: str, backend=None) -> Optional[Dict[str, str]]:
     """
-    Парсит страницу заведения на flamp.ru и возвращает структурированные данные.
+    Разбирает загруженную страницу заведения на flamp.ru и возвращает структурированные данные.
     
     Args:
+        html: HTML-код страницы
         url: URL заведения на flamp.ru
+        backend: движок разбора (по умолчанию самый быстрый из доступных)
         
     Returns:
         Словарь с данными о заведении или None в случае ошибки
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        logging.info(f"Начинаем парсинг заведения: {url}")
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        
-        name_tag = soup.find('h1', class_='header-filial__name')
-        name = name_tag.text.strip() if name_tag else "Не указано"
-        
-        
-        venue_type_tag = soup.find('div', class_='header-filial__subtitle')
-        venue_type = venue_type_tag.text.strip() if venue_type_tag else "Не указано"
-        
-        
-        average_bill_tag = soup.find('li', class_='header-filial__tag')
-        average_bill = average_bill_tag.text.strip() if average_bill_tag else "Не указано"
-        
-        
-        geo_data = soup.find('div', class_='filial-location__map')
-        lat = geo_data.get('data-lat') if geo_data else None
-        lon = geo_data.get('data-lon') if geo_data else None
-        
-        
-        address_tag = soup.find('div', class_='filial-address__label')
-        address = address_tag.text.strip() if address_tag else "Не указано"
-        
-        
-        rating_tag = soup.find('div', class_='filial-rating__value')
-        rating = rating_tag.text.strip() if rating_tag else "Не указано"
-        
-        
-        reviews_count_tag = soup.find('a', class_='filial-rating__reviews')
-        reviews_count = reviews_count_tag.text.strip() if reviews_count_tag else "Не указано"
-        
-        
-        phone_tag = soup.find('a', href=lambda x: x and x.startswith('tel:'))
-        phone = phone_tag.text.strip() if phone_tag else "Не указано"
-        
-        
-        work_hours_tag = soup.find('div', class_='filial-workhours__timetable')
-        work_hours = work_hours_tag.text.strip() if work_hours_tag else "Не указано"
-        
-        
-        categories = []
-        categories_block = soup.find('div', class_='filial-info-row__content')
-        if categories_block:
-            for item in categories_block.find_all('li', class_='list__item'):
-                categories.append(item.text.strip())
-        
-        
-        additional_info = {}
-        additional_blocks = soup.find_all('div', class_='filial-info__row')
-        for block in additional_blocks:
-            label_tag = block.find('div', class_='l-inner__column--side')
-            if label_tag:
-                label = label_tag.text.strip()
-                content_tag = block.find('div', class_='filial-info-row__content')
-                if content_tag:
-                    items = [item.text.strip() for item in content_tag.find_all('li', class_='list__item')]
-                    additional_info[label] = items
-        
-        
-        message_link_tag = soup.find('a', class_='action button-cta button-cta--thm-white-round button-cta--icon-message js-link')
-        message_link = message_link_tag['href'] if message_link_tag else None
-        
-        
-        result = {
-            'name': name,
-            'type': venue_type,
-            'average_bill': average_bill,
-            'latitude': lat,
-            'longitude': lon,
-            'address': address,
-            'rating': rating,
-            'reviews_count': reviews_count,
-            'phone': phone,
-            'work_hours': work_hours,
-            'categories': categories,
-            'additional_info': additional_info,
-            'message_link': message_link,
-            'source_url': url
-        }
-        
-        logging.info("Парсинг заведения успешно завершен")
+        result = extract(FLAMP_VENUE, html, url, backend)
+        logger.debug("Парсинг заведения успешно завершен")
         return result
-        
     except Exception as e:
-        logging.error(f"Ошибка при парсинге заведения: {e}", exc_info=True)
+        logger.exception("Ошибка при парсинге заведения")
+        return None
+
+async def fetch_flamp_venue(
+    url: str,
+    fetcher: Fetcher = shared_fetcher,
+    cache: Optional[ResponseCache] = response_cache
+) -> Optional[Dict[str, str]]:
+    """Загрузка и разбор страницы без блокировки цикла событий (с учетом дискового кэша)"""
+    if cache is not None:
+        cached = cache.lookup(url, FLAMP_VENUE.name)
+        if cached is not None:
+            return cached
+
+    logger.debug("Начинаем парсинг заведения: %s", url)
+    try:
+        if cache is not None:
+            return await cache.fetch_parsed(url, FLAMP_VENUE.name, lambda html: extract_flamp_venue(html, url), fetcher)
+        response = await fetcher.get(url)
+    except Exception as e:
+        logger.error("Ошибка при загрузке заведения: %s", e)
         return None
+    return await asyncio.to_thread(extract_flamp_venue, response.text, url)
+
+async def fetch_flamp_venues(
+    urls: Iterable[str],
+    fetcher: Fetcher = shared_fetcher,
+    cache: Optional[ResponseCache] = response_cache
+) -> AsyncIterator[tuple]:
+    """Пакетный парсинг: пары (url, данные или None) по мере готовности"""
+    async def worker(url):
+        if cache is not None:
+            return await cache.fetch_parsed(url, FLAMP_VENUE.name, lambda html: extract_flamp_venue(html, url), fetcher)
+        response = await fetcher.get(url)
+        return await asyncio.to_thread(extract_flamp_venue, response.text, url)
+
+    async for url, result, error in map_completed(urls, worker):
+        if error is not None:
+            logger.error("Ошибка при парсинге заведения %s: %s", url, error)
+        yield url, result
+
+def parse_flamp_venue(url: str) -> Optional[Dict[str, str]]:
+    """Синхронный вариант для запуска из командной строки"""
+    async def run():
+        async with Fetcher() as fetcher:
+            return await fetch_flamp_venue(url, fetcher)
+    return asyncio.run(run())
 
 def format_for_db(data: Dict[str, str]) -> Dict[str, str]:
     """
@@ -158,6 +173,8 @@ def format_for_db(data: Dict[str, str]) -> Dict[str, str]:
     }
 
 if __name__ == "__main__":
+    from logging_setup import setup_logging
+    setup_logging()
     
     test_url = "https://irkutsk.flamp.ru/firm/cherdak_nochnojj_klub-1548640652947676"
     
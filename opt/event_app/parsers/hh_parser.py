@@ -1,144 +1,146 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
 import logging
-from typing import Dict, Optional
+from typing import AsyncIterator, Dict, Iterable, Optional
 import sys
 
+from parsers.extract import Field, Source, extract
+from parsers.fetcher import Fetcher, fetcher as shared_fetcher, map_completed
+from parsers.http_cache import ResponseCache, response_cache
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[logging.FileHandler('hh_parser.log'), logging.StreamHandler()]
+
+logger = logging.getLogger(__name__)
+
+def _finalize_resume(values: dict, url: str) -> dict:
+    employment_type = "Не указано"
+    work_schedule = "Не указано"
+    for text in values['employment_paragraphs']:
+        if "Занятость:" in text:
+            employment_type = text.replace("Занятость:", "").strip()
+        elif "График работы:" in text:
+            work_schedule = text.replace("График работы:", "").strip()
+
+    total_experience = "Не указано"
+    for title in values['experience_titles']:
+        if "Опыт работы" in title['text'] and len(title['spans']) >= 2:
+            total_experience = f"{title['spans'][0]} {title['spans'][1]}"
+            break
+
+    last_job = values['last_job'] or {
+        'period': "Не указано",
+        'company': "Не указано",
+        'position': "Не указано",
+        'description': "Не указано"
+    }
+    last_job['description'] = last_job['description'].replace('<br>', '\n')
+
+    return {
+        'gender': values['gender'],
+        'age': values['age'],
+        'birthday': values['birthday'],
+        'address': values['address'],
+        'position': values['position'],
+        'specialization': values['specialization'],
+        'employment_type': employment_type,
+        'work_schedule': work_schedule,
+        'total_experience': total_experience,
+        'last_job': last_job,
+        'source_url': url
+    }
+
+HH_RESUME = Source(
+    name='hh_resume',
+    root='div.resume-wrapper',
+    strain_class_prefixes=('resume-wrapper',),
+    fields={
+        'gender': Field('span[data-qa="resume-personal-gender"]'),
+        'age': Field('span[data-qa="resume-personal-age"]'),
+        'birthday': Field('span[data-qa="resume-personal-birthday"]'),
+        'address': Field('span[data-qa="resume-personal-address"]'),
+        'position': Field('span[data-qa="resume-block-title-position"]'),
+        'specialization': Field('li[data-qa="resume-block-position-specialization"]'),
+        'employment_paragraphs': Field('div.resume-block-container p', many=True),
+        'experience_titles': Field('span.resume-block__title-text_sub', many=True, fields={
+            'text': Field(),
+            'spans': Field('span', many=True),
+        }),
+        'last_job': Field('div.resume-block-item-gap', fields={
+            'period': Field('div.bloko-column_xs-4'),
+            'company': Field('div.bloko-text_strong'),
+            'position': Field('div[data-qa="resume-block-experience-position"]'),
+            'description': Field('div[data-qa="resume-block-experience-description"]'),
+        }),
+    },
+    finalize=_finalize_resume
 )
 
-def parse_hh_resume(url: str) -> Optional[Dict[str, str]]:
+def extract_hh_resume(html: str, url: str, backend=None) -> Optional[Dict[str, str]]:
     """
-    Парсит резюме с hh.ru и возвращает структурированные данные.
+    Разбирает загруженную страницу резюме с hh.ru и возвращает структурированные данные.
     
     Args:
+        html: HTML-код страницы
         url: URL резюме на hh.ru
+        backend: движок разбора (по умолчанию самый быстрый из доступных)
         
     Returns:
         Словарь с данными о кандидате или None в случае ошибки
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        logging.info(f"Начинаем парсинг резюме: {url}")
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        
-        personal_info = soup.find('div', class_='resume-wrapper')
-        if not personal_info:
-            logging.error("Не удалось найти блок с основной информацией")
+        result = extract(HH_RESUME, html, url, backend)
+        if result is None:
+            logger.error("Не удалось найти блок с основной информацией")
             return None
-            
-        
-        gender_tag = personal_info.find('span', {'data-qa': 'resume-personal-gender'})
-        gender = gender_tag.text.strip() if gender_tag else "Не указано"
-        
-        
-        age_tag = personal_info.find('span', {'data-qa': 'resume-personal-age'})
-        age = age_tag.text.strip() if age_tag else "Не указано"
-        
-        
-        birthday_tag = personal_info.find('span', {'data-qa': 'resume-personal-birthday'})
-        birthday = birthday_tag.text.strip() if birthday_tag else "Не указано"
-        
-        
-        address_tag = personal_info.find('span', {'data-qa': 'resume-personal-address'})
-        address = address_tag.text.strip() if address_tag else "Не указано"
-        
-        
-        position_tag = personal_info.find('span', {'data-qa': 'resume-block-title-position'})
-        position = position_tag.text.strip() if position_tag else "Не указано"
-        
-        
-        specialization_tag = personal_info.find('li', {'data-qa': 'resume-block-position-specialization'})
-        specialization = specialization_tag.text.strip() if specialization_tag else "Не указано"
-        
-        
-        employment_info = soup.find('div', class_='resume-block-container')
-        employment_type = "Не указано"
-        work_schedule = "Не указано"
-        
-        if employment_info:
-            paragraphs = employment_info.find_all('p')
-            for p in paragraphs:
-                text = p.text.strip()
-                if "Занятость:" in text:
-                    employment_type = text.replace("Занятость:", "").strip()
-                elif "График работы:" in text:
-                    work_schedule = text.replace("График работы:", "").strip()
-        
-        
-        experience_section = soup.find('span', class_='resume-block__title-text_sub', string=lambda text: text and "Опыт работы" in text)
-        total_experience = "Не указано"
-        
-        if experience_section:
-            spans = experience_section.find_all('span')
-            if len(spans) >= 2:
-                total_experience = f"{spans[0].text.strip()} {spans[1].text.strip()}"
-        
-        
-        last_job = {
-            'period': "Не указано",
-            'company': "Не указано",
-            'position': "Не указаno",
-            'description': "Не указано"
-        }
-        
-        last_experience = soup.find_all('div', class_='resume-block-item-gap')
-        if last_experience:
-            last_job_block = last_experience[0]
-            
-            
-            period_tag = last_job_block.find('div', class_='bloko-column_xs-4')
-            if period_tag:
-                last_job['period'] = period_tag.text.strip()
-            
-            
-            company_tag = last_job_block.find('div', class_='bloko-text_strong')
-            if company_tag:
-                last_job['company'] = company_tag.text.strip()
-            
-            
-            position_tag = last_job_block.find('div', {'data-qa': 'resume-block-experience-position'})
-            if position_tag:
-                last_job['position'] = position_tag.text.strip()
-            
-            
-            description_tag = last_job_block.find('div', {'data-qa': 'resume-block-experience-description'})
-            if description_tag:
-                last_job['description'] = description_tag.text.strip().replace('<br>', '\n')
-        
-        
-        result = {
-            'gender': gender,
-            'age': age,
-            'birthday': birthday,
-            'address': address,
-            'position': position,
-            'specialization': specialization,
-            'employment_type': employment_type,
-            'work_schedule': work_schedule,
-            'total_experience': total_experience,
-            'last_job': last_job,
-            'source_url': url
-        }
-        
-        logging.info("Парсинг резюме успешно завершен")
+        logger.debug("Парсинг резюме успешно завершен")
         return result
-        
     except Exception as e:
-        logging.error(f"Ошибка при парсинге резюме: {e}", exc_info=True)
+        logger.exception("Ошибка при парсинге резюме")
         return None
 
+async def fetch_hh_resume(
+    url: str,
+    fetcher: Fetcher = shared_fetcher,
+    cache: Optional[ResponseCache] = response_cache
+) -> Optional[Dict[str, str]]:
+    """Загрузка и разбор страницы без блокировки цикла событий (с учетом дискового кэша)"""
+    if cache is not None:
+        cached = cache.lookup(url, HH_RESUME.name)
+        if cached is not None:
+            return cached
+
+    logger.debug("Начинаем парсинг резюме: %s", url)
+    try:
+        if cache is not None:
+            return await cache.fetch_parsed(url, HH_RESUME.name, lambda html: extract_hh_resume(html, url), fetcher)
+        response = await fetcher.get(url)
+    except Exception as e:
+        logger.error("Ошибка при загрузке резюме: %s", e)
+        return None
+    return await asyncio.to_thread(extract_hh_resume, response.text, url)
+
+async def fetch_hh_resumes(
+    urls: Iterable[str],
+    fetcher: Fetcher = shared_fetcher,
+    cache: Optional[ResponseCache] = response_cache
+) -> AsyncIterator[tuple]:
+    """Пакетный парсинг: пары (url, данные или None) по мере готовности"""
+    async def worker(url):
+        if cache is not None:
+            return await cache.fetch_parsed(url, HH_RESUME.name, lambda html: extract_hh_resume(html, url), fetcher)
+        response = await fetcher.get(url)
+        return await asyncio.to_thread(extract_hh_resume, response.text, url)
+
+    async for url, result, error in map_completed(urls, worker):
+        if error is not None:
+            logger.error("Ошибка при парсинге резюме %s: %s", url, error)
+        yield url, result
+
+def parse_hh_resume(url: str) -> Optional[Dict[str, str]]:
+    """Синхронный вариант для запуска из командной строки"""
+    async def run():
+        async with Fetcher() as fetcher:
+            return await fetch_hh_resume(url, fetcher)
+    return asyncio.run(run())
+
 def format_for_db(data: Dict[str, str]) -> Dict[str, str]:
     """Форматирует данные из парсера для сохранения в БД."""
     if not data:
@@ -165,6 +167,8 @@ def format_for_db(data: Dict[str, str]) -> Dict[str, str]:
     }
 
 if __name__ == "__main__":
+    from logging_setup import setup_logging
+    setup_logging()
     
     test_url = "https://hh.ru/resume/a01ed8be0003d5eb080039ed1f37704d734d4b?query=%D0%BE%D1%85%D1%80%D0%B0%D0%BD%D0%BD%D0%B8%D0%BA&searchRid=174195924470992ce3d1ca9808ead37f&hhtmFrom=resume_search_result"
     
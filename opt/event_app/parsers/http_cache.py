@@ -0,0 +1,323 @@
+"""
+Дисковый кэш ответов внешних сайтов и результатов их разбора.
+
+Тела ответов хранятся по хэшу содержимого (blobs/ab/abcdef...), поэтому
+одинаковые страницы под разными URL занимают место один раз, а повторно
+загруженная, но не изменившаяся страница не разбирается заново. Метаданные
+URL (ETag, Last-Modified, время загрузки, хэш тела, результаты разбора)
+лежат в meta/<хэш URL>.json и держатся в памяти: попадание в пределах TTL
+отдается без сети и без диска. После TTL выполняется условный запрос, ответ
+304 продлевает запись. Общий размер тел ограничен, вытесняются давно не
+использованные записи.
+
+Счетчики ссылок на тела живут в памяти процесса, поэтому у каждого воркера
+свой подкаталог slot-N: иначе один воркер удалял бы тела, на которые
+ссылается индекс другого. Воркер занимает первый свободный слот под
+блокировкой файла .lock и держит ее до завершения; после перезапуска слот
+занимается снова вместе с накопленным кэшем. Поэтому на диске не больше
+каталогов, чем воркеров работало одновременно, а PARSER_CACHE_MAX_BYTES
+ограничивает размер одного слота. Каталоги по PID от прежних версий
+удаляются. Загрузки одного URL выполняются по очереди.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Optional
+
+from parsers.fetcher import Fetcher
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+    import msvcrt
+
+
+PARSER_CACHE_DIR = Path(os.getenv(
+    "PARSER_CACHE_DIR", str(Path(tempfile.gettempdir()) / "event_app_parser_cache")
+))
+PARSER_CACHE_TTL = float(os.getenv("PARSER_CACHE_TTL", "3600"))
+PARSER_CACHE_MAX_BYTES = int(os.getenv("PARSER_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+PARSER_CACHE_SLOTS = int(os.getenv("PARSER_CACHE_SLOTS", "64"))
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _try_lock(fd: int) -> bool:
+    """Неблокирующая эксклюзивная блокировка файла; снимается при завершении процесса"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        directory: Path = PARSER_CACHE_DIR,
+        ttl: float = PARSER_CACHE_TTL,
+        max_bytes: int = PARSER_CACHE_MAX_BYTES
+    ):
+        self.root = Path(directory)
+        # Каталог слота выбирается при первом обращении
+        self.directory: Optional[Path] = None
+        self._slot_fd: Optional[int] = None
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._blob_refs = {}
+        self._blob_sizes = {}
+        self._bytes = 0
+        self._loaded = False
+        # URL -> [блокировка, число ожидающих]; запись удаляется вместе с последним
+        self._locks = {}
+        self.stats_counters = {
+            "hits": 0, "revalidated": 0, "misses": 0, "evictions": 0, "errors": 0,
+        }
+
+    def _meta_path(self, url: str) -> Path:
+        return self.directory / "meta" / f"{_sha256(url.encode('utf-8'))}.json"
+
+    def _blob_path(self, body_hash: str) -> Path:
+        return self.directory / "blobs" / body_hash[:2] / body_hash
+
+    def _claim_slot(self):
+        """Первый не занятый другим процессом slot-N"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        for slot in range(PARSER_CACHE_SLOTS):
+            directory = self.root / f"slot-{slot}"
+            directory.mkdir(exist_ok=True)
+            fd = os.open(directory / ".lock", os.O_RDWR | os.O_CREAT)
+            if _try_lock(fd):
+                self._slot_fd = fd
+                self.directory = directory
+                self._remove_orphans()
+                return
+            os.close(fd)
+        raise RuntimeError(f"Все {PARSER_CACHE_SLOTS} каталогов кэша в {self.root} заняты")
+
+    def _remove_orphans(self):
+        """Каталоги по PID, которые создавали прежние версии кэша и никто не удалял"""
+        for path in self.root.iterdir():
+            if path.is_dir() and path.name.isdigit():
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _load(self):
+        """Выбор слота и чтение метаданных с диска при первом обращении"""
+        self._loaded = True
+        self._claim_slot()
+        entries = []
+        for path in (self.directory / "meta").glob("*.json"):
+            try:
+                entries.append(json.loads(path.read_text(encoding="utf-8")))
+            except (OSError, ValueError):
+                continue
+        for entry in sorted(entries, key=lambda e: e.get("accessed_at", 0)):
+            if self._blob_path(entry["body_hash"]).exists():
+                self._index(entry)
+
+    def _index(self, entry: dict):
+        self._entries[entry["url"]] = entry
+        body_hash = entry["body_hash"]
+        if body_hash not in self._blob_refs:
+            self._blob_sizes[body_hash] = entry["size"]
+            self._bytes += entry["size"]
+        self._blob_refs[body_hash] = self._blob_refs.get(body_hash, 0) + 1
+
+    def _release_blob(self, body_hash: str):
+        if body_hash not in self._blob_refs:
+            return
+        self._blob_refs[body_hash] -= 1
+        if self._blob_refs[body_hash] <= 0:
+            del self._blob_refs[body_hash]
+            self._bytes -= self._blob_sizes.pop(body_hash)
+            self._blob_path(body_hash).unlink(missing_ok=True)
+
+    def _unindex(self, url: str) -> Optional[dict]:
+        entry = self._entries.pop(url, None)
+        if entry is not None:
+            self._release_blob(entry["body_hash"])
+        return entry
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _evict(self):
+        while self._entries and self._bytes > self.max_bytes:
+            url = next(iter(self._entries))
+            self._unindex(url)
+            self._meta_path(url).unlink(missing_ok=True)
+            self.stats_counters["evictions"] += 1
+
+    def _persist(self, entry: dict, body: Optional[bytes] = None):
+        if body is not None:
+            blob = self._blob_path(entry["body_hash"])
+            if not blob.exists():
+                _write_atomic(blob, body)
+        _write_atomic(
+            self._meta_path(entry["url"]),
+            json.dumps(entry, ensure_ascii=False, default=str).encode("utf-8")
+        )
+
+    def _store(self, url: str, response) -> dict:
+        """Обновление индекса; запись на диск выполняет вызывающий код"""
+        body_hash = _sha256(response.content)
+        # Освобождается запись, которая заменяется сейчас, а не прочитанная до загрузки
+        previous = self._entries.pop(url, None)
+        entry = {
+            "url": url,
+            "body_hash": body_hash,
+            "size": len(response.content),
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "encoding": response.encoding or "utf-8",
+            "fetched_at": time.time(),
+            "accessed_at": time.time(),
+            # Содержимое не изменилось - результаты разбора остаются в силе
+            "parsed": previous["parsed"] if previous and previous["body_hash"] == body_hash else {},
+        }
+        # Сначала ссылка на новое тело, затем освобождение старого: если тело
+        # не изменилось, файл не должен удаляться
+        self._index(entry)
+        if previous is not None:
+            self._release_blob(previous["body_hash"])
+        return entry
+
+    def _read_body(self, entry: dict) -> str:
+        return self._blob_path(entry["body_hash"]).read_bytes().decode(entry["encoding"], errors="replace")
+
+    def lookup(self, url: str, parser_key: str):
+        """Результат разбора из памяти, если запись свежая; иначе None"""
+        if not self._loaded:
+            self._load()
+        entry = self._entries.get(url)
+        if entry is None or time.time() - entry["fetched_at"] >= self.ttl:
+            return None
+        if parser_key not in entry["parsed"]:
+            return None
+        self._entries.move_to_end(url)
+        entry["accessed_at"] = time.time()
+        self.stats_counters["hits"] += 1
+        return entry["parsed"][parser_key]
+
+    async def fetch_parsed(
+        self,
+        url: str,
+        parser_key: str,
+        parse: Callable[[str], Optional[dict]],
+        fetcher: Fetcher
+    ) -> Optional[dict]:
+        """
+        Результат разбора страницы с учетом кэша.
+
+        parse выполняется в отдельном потоке и только если содержимое страницы
+        изменилось или еще не разбиралось этим парсером.
+        """
+        cached = self.lookup(url, parser_key)
+        if cached is not None:
+            return cached
+
+        slot = self._locks.setdefault(url, [asyncio.Lock(), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                # Пока ждали, URL мог загрузить другой вызов
+                cached = self.lookup(url, parser_key)
+                if cached is not None:
+                    return cached
+                return await self._fetch_parsed(url, parser_key, parse, fetcher)
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._locks[url]
+
+    async def _fetch_parsed(self, url, parser_key, parse, fetcher):
+        entry = self._entries.get(url)
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = await fetcher.get(url, headers=headers or None)
+
+        if (
+            response.status_code == 304 and entry is not None
+            and parser_key not in entry["parsed"]
+            and not self._blob_path(entry["body_hash"]).exists()
+        ):
+            # Тело пропало с диска: по 304 разобрать нечего, нужна полная загрузка
+            self._unindex(url)
+            entry = None
+            response = await fetcher.get(url)
+
+        html = None
+        body = None
+        if response.status_code == 304 and entry is not None:
+            self.stats_counters["revalidated"] += 1
+            entry["fetched_at"] = entry["accessed_at"] = time.time()
+            self._entries.move_to_end(url)
+        else:
+            previous_hash = entry["body_hash"] if entry is not None else None
+            entry = self._store(url, response)
+            if entry["body_hash"] == previous_hash:
+                self.stats_counters["revalidated"] += 1
+            else:
+                self.stats_counters["misses"] += 1
+            body = response.content
+            html = response.text
+
+        if parser_key not in entry["parsed"]:
+            if html is None:
+                html = await asyncio.to_thread(self._read_body, entry)
+            result = await asyncio.to_thread(parse, html)
+            if result is None:
+                self.stats_counters["errors"] += 1
+            else:
+                entry["parsed"][parser_key] = result
+
+        await asyncio.to_thread(self._persist, dict(entry, parsed=dict(entry["parsed"])), body)
+        self._evict()
+        return entry["parsed"].get(parser_key)
+
+    def clear(self):
+        for url in list(self._entries):
+            self._unindex(url)
+            self._meta_path(url).unlink(missing_ok=True)
+
+    def stats(self) -> dict:
+        counters = self.stats_counters
+        lookups = counters["hits"] + counters["revalidated"] + counters["misses"]
+        return {
+            **counters,
+            "entries": len(self._entries),
+            "blobs": len(self._blob_sizes),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hit_ratio": (counters["hits"] + counters["revalidated"]) / lookups if lookups else 0.0,
+        }
+
+
+response_cache = ResponseCache()
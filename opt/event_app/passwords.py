@@ -0,0 +1,110 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+# bcrypt отпускает GIL, поэтому потоков достаточно; число потоков ограничивает
+# и одновременные вычисления хэшей, чтобы всплеск входов не занял все ядра
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Максимальная длина очереди; при превышении запрос отклоняется с 503 (0 - без ограничения)
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "200"))
+# "inline" - считать прямо в цикле событий (старое поведение, только для сравнения в бенчмарке)
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+_hash_stats = {
+    "queued": 0,
+    "running": 0,
+    "max_queued": 0,
+    "completed_total": 0,
+    "rejected_total": 0,
+    "wait_sum": 0.0,
+    "run_sum": 0.0,
+}
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt"
+        )
+    return _executor
+
+
+_slots: Optional[asyncio.Semaphore] = None
+
+
+async def _run(func, *args):
+    global _slots
+    if PASSWORD_HASH_EXECUTOR == "inline":
+        return func(*args)
+
+    if PASSWORD_HASH_MAX_QUEUE and _hash_stats["queued"] >= PASSWORD_HASH_MAX_QUEUE:
+        _hash_stats["rejected_total"] += 1
+        raise HTTPException(status_code=503, detail="Password hashing queue is full")
+
+    # Очередь ведется в цикле событий, а не внутри пула потоков, чтобы метрики
+    # обновлялись из одного потока и очередь можно было ограничить
+    if _slots is None:
+        _slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+
+    enqueued = time.perf_counter()
+    _hash_stats["queued"] += 1
+    _hash_stats["max_queued"] = max(_hash_stats["max_queued"], _hash_stats["queued"])
+    try:
+        await _slots.acquire()
+    finally:
+        _hash_stats["queued"] -= 1
+
+    started = time.perf_counter()
+    _hash_stats["wait_sum"] += started - enqueued
+    _hash_stats["running"] += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), func, *args)
+    finally:
+        _slots.release()
+        _hash_stats["running"] -= 1
+        _hash_stats["completed_total"] += 1
+        _hash_stats["run_sum"] += time.perf_counter() - started
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run(pwd_context.verify, plain_password, hashed_password)
+
+
+async def get_password_hash(password: str) -> str:
+    return await _run(pwd_context.hash, password)
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def hash_stats() -> dict:
+    """Глубина очереди и время ожидания/вычисления хэшей паролей"""
+    completed = _hash_stats["completed_total"]
+    return {
+        "mode": PASSWORD_HASH_EXECUTOR,
+        "workers": PASSWORD_HASH_WORKERS,
+        "max_queue": PASSWORD_HASH_MAX_QUEUE,
+        "queued": _hash_stats["queued"],
+        "running": _hash_stats["running"],
+        "max_queued": _hash_stats["max_queued"],
+        "completed_total": completed,
+        "rejected_total": _hash_stats["rejected_total"],
+        "avg_wait_ms": _hash_stats["wait_sum"] / completed * 1000 if completed else 0.0,
+        "avg_run_ms": _hash_stats["run_sum"] / completed * 1000 if completed else 0.0,
+    }
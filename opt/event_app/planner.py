@@ -0,0 +1,254 @@
+"""
+Автоматический подбор ресурсов для мероприятий.
+
+Сначала подбираются внутренние помещения и сотрудники, при их нехватке -
+внешние (is_external), а недостающие специалисты добираются из внешних
+подрядчиков по совпадению специальности с названием должности.
+
+Эвристика жадная: мероприятия обрабатываются по времени начала, помещение
+выбирается по принципу best fit (наименьший достаточный запас вместимости),
+сотрудники - наименее загруженные в текущем плане. Занятость загружается
+из БД один раз на весь горизонт плана, назначения плана добавляются в тот же
+индекс, поэтому план не конфликтует ни с БД, ни сам с собой.
+"""
+from datetime import datetime
+from typing import Optional
+
+from availability import BookingIndex
+from reference_cache import reference_cache
+
+
+class AllocationError(Exception):
+    """Для мероприятия не удалось подобрать все ресурсы"""
+
+
+class Requirement:
+    """Требования одного мероприятия"""
+
+    def __init__(
+        self,
+        start: datetime,
+        end: datetime,
+        capacity: Optional[int] = None,
+        room_type_id: Optional[int] = None,
+        positions: Optional[dict] = None,
+        name: Optional[str] = None
+    ):
+        if end <= start:
+            raise ValueError("Дата окончания должна быть позже даты начала")
+        self.start = start
+        self.end = end
+        self.capacity = capacity
+        self.room_type_id = room_type_id
+        self.positions = {int(k): int(v) for k, v in (positions or {}).items() if int(v) > 0}
+        self.name = name
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(
+            start=datetime.fromisoformat(data["start"]),
+            end=datetime.fromisoformat(data["end"]),
+            capacity=data.get("capacity") or data.get("max_participants"),
+            room_type_id=data.get("room_type_id"),
+            positions=data.get("positions"),
+            name=data.get("name")
+        )
+
+
+class PlanState:
+    """Занятость ресурсов на горизонте плана: бронирования из БД плюс назначения плана"""
+
+    def __init__(self, bookings, contractor_bookings):
+        by_type = {"room": [], "employee": []}
+        for r in bookings:
+            by_type[r["resource_type"]].append(r)
+        self.indexes = {t: BookingIndex.build(rows) for t, rows in by_type.items()}
+        # Подрядчики не защищены ограничением исключения, интервалы могут пересекаться
+        self.contractors = {}
+        for r in contractor_bookings:
+            self.contractors.setdefault(r["contractor_id"], []).append((r["start_time"], r["end_time"]))
+        self.assigned = {"room": {}, "employee": {}, "contractor": {}}
+
+    def is_busy(self, kind: str, resource_id: int, start: datetime, end: datetime) -> bool:
+        if kind == "contractor":
+            return any(s < end and e > start for s, e in self.contractors.get(resource_id, ()))
+        return self.indexes[kind].is_busy(resource_id, start, end)
+
+    def reserve(self, kind: str, resource_id: int, start: datetime, end: datetime):
+        if kind == "contractor":
+            self.contractors.setdefault(resource_id, []).append((start, end))
+        else:
+            self.indexes[kind].add(resource_id, start, end)
+        self.assigned[kind][resource_id] = self.assigned[kind].get(resource_id, 0) + 1
+
+    def load(self, kind: str, resource_id: int) -> int:
+        return self.assigned[kind].get(resource_id, 0)
+
+
+async def load_state(conn, start: datetime, end: datetime) -> PlanState:
+    """Занятость всех ресурсов на горизонте [start, end) двумя запросами"""
+    bookings = await conn.fetch(
+        """SELECT resource_type, resource_id, start_time, end_time
+           FROM resource_bookings
+           WHERE tsrange(start_time, end_time) && tsrange($1, $2)""",
+        start, end
+    )
+    contractor_bookings = await conn.fetch(
+        """SELECT ec.contractor_id, e.start_time, e.end_time
+           FROM event_contractors ec
+           JOIN events e ON e.id = ec.event_id
+           WHERE e.start_time < $2 AND e.end_time > $1""",
+        start, end
+    )
+    return PlanState(bookings, contractor_bookings)
+
+
+def _pick_room(state: PlanState, rooms: list, req: Requirement) -> Optional[dict]:
+    candidates = [
+        room for room in rooms
+        if (req.capacity is None or room["capacity"] >= req.capacity)
+        and (req.room_type_id is None or room["room_type_id"] == req.room_type_id)
+    ]
+    candidates.sort(key=lambda r: (bool(r["is_external"]), r["capacity"], r["id"]))
+    for room in candidates:
+        if not state.is_busy("room", room["id"], req.start, req.end):
+            state.reserve("room", room["id"], req.start, req.end)
+            return {
+                "id": room["id"],
+                "name": room["name"],
+                "capacity": room["capacity"],
+                "is_external": bool(room["is_external"]),
+            }
+    return None
+
+
+def _pick_employees(state: PlanState, employees: list, position_id: int, count: int, req: Requirement) -> list:
+    candidates = [e for e in employees if e["position_id"] == position_id]
+    candidates.sort(key=lambda e: (bool(e["is_external"]), state.load("employee", e["id"]), e["id"]))
+    picked = []
+    for employee in candidates:
+        if len(picked) == count:
+            break
+        if not state.is_busy("employee", employee["id"], req.start, req.end):
+            state.reserve("employee", employee["id"], req.start, req.end)
+            picked.append({
+                "id": employee["id"],
+                "full_name": employee["full_name"],
+                "position_id": position_id,
+                "is_external": bool(employee["is_external"]),
+            })
+    return picked
+
+
+def _pick_contractors(state: PlanState, contractors: list, specialty: str, count: int, req: Requirement) -> list:
+    specialty = specialty.strip().lower()
+    candidates = [c for c in contractors if c["specialty"].strip().lower() == specialty]
+    candidates.sort(key=lambda c: (-(c["rating"] or 0), c["price_per_hour"] or 0, c["id"]))
+    picked = []
+    for contractor in candidates:
+        if len(picked) == count:
+            break
+        if not state.is_busy("contractor", contractor["id"], req.start, req.end):
+            state.reserve("contractor", contractor["id"], req.start, req.end)
+            picked.append({
+                "id": contractor["id"],
+                "name": contractor["name"],
+                "specialty": contractor["specialty"],
+                "price_per_hour": float(contractor["price_per_hour"]) if contractor["price_per_hour"] is not None else None,
+            })
+    return picked
+
+
+def _allocate_one(state: PlanState, resources: dict, req: Requirement) -> dict:
+    room = _pick_room(state, resources["rooms"], req)
+    employees, contractors, shortages = [], [], []
+    for position_id, count in sorted(req.positions.items()):
+        picked = _pick_employees(state, resources["employees"], position_id, count, req)
+        employees += picked
+        missing = count - len(picked)
+        if missing and position_id in resources["position_names"]:
+            hired = _pick_contractors(
+                state, resources["contractors"], resources["position_names"][position_id], missing, req
+            )
+            contractors += hired
+            missing -= len(hired)
+        if missing:
+            shortages.append({"position_id": position_id, "missing": missing})
+
+    return {
+        "name": req.name,
+        "start": req.start.isoformat(),
+        "end": req.end.isoformat(),
+        "room": room,
+        "employees": employees,
+        "contractors": contractors,
+        "shortages": shortages,
+        "complete": room is not None and not shortages,
+    }
+
+
+async def _load_resources(conn, requirements: list) -> dict:
+    """Ресурсы-кандидаты на весь план: только подходящие хотя бы одному мероприятию"""
+    capacities = [r.capacity for r in requirements]
+    min_capacity = None if None in capacities else min(capacities)
+    position_ids = sorted({p for r in requirements for p in r.positions})
+    rooms = await conn.fetch(
+        """SELECT id, name, address, capacity, room_type_id, is_external FROM rooms
+           WHERE $1::int IS NULL OR capacity >= $1""",
+        min_capacity
+    )
+    employees = await conn.fetch(
+        """SELECT id, full_name, position_id, is_external FROM employees
+           WHERE position_id = ANY($1::int[])""",
+        position_ids
+    )
+    contractors = await conn.fetch(
+        "SELECT id, name, specialty, rating, price_per_hour FROM external_contractors"
+    )
+    positions = await reference_cache.get(conn, "positions")
+    return {
+        "rooms": rooms,
+        "employees": employees,
+        "contractors": [dict(c) for c in contractors],
+        "position_names": {p["id"]: p["name"] for p in positions},
+    }
+
+
+async def plan(conn, requirements: list) -> list:
+    """
+    План на набор мероприятий (сезон) за один вызов.
+
+    Результаты возвращаются в порядке входного списка.
+    """
+    if not requirements:
+        return []
+
+    state = await load_state(
+        conn,
+        min(r.start for r in requirements),
+        max(r.end for r in requirements)
+    )
+    resources = await _load_resources(conn, requirements)
+
+    # Сначала ранние мероприятия, при одинаковом начале - более требовательные к вместимости
+    order = sorted(
+        range(len(requirements)),
+        key=lambda i: (requirements[i].start, -(requirements[i].capacity or 0))
+    )
+    results = [None] * len(requirements)
+    for i in order:
+        results[i] = _allocate_one(state, resources, requirements[i])
+    return results
+
+
+async def allocate(conn, requirement: Requirement) -> dict:
+    return (await plan(conn, [requirement]))[0]
+
+
+def describe_shortages(allocation: dict) -> str:
+    messages = []
+    if allocation["room"] is None:
+        messages.append("нет свободного помещения подходящей вместимости")
+    for shortage in allocation["shortages"]:
+        messages.append(f"не хватает {shortage['missing']} сотрудн. на должность #{shortage['position_id']}")
+    return "; ".join(messages)
@@ -0,0 +1,386 @@
+"""
+Профилировщик запросов к БД и журнал медленных запросов.
+
+Профилирование включается переменной QUERY_PROFILER:
+
+    off     - выключено (по умолчанию)
+    header  - только запросы с заголовком X-Query-Profile, значение которого
+              совпадает с QUERY_PROFILER_TOKEN; без токена режим не включается
+    all     - все запросы
+
+Для профилируемого HTTP-запроса acquire() выдает ProfiledConnection - обертку
+соединения, которая записывает отпечаток SQL (текст без литералов), число
+параметров, число строк и время каждого запроса со смещением от начала
+HTTP-запроса. Ответ получает заголовки X-Query-Profile-Id и Server-Timing
+(по записи на запрос - инструменты разработчика браузера показывают их
+списком), полная последовательность запросов доступна в
+/internal/profiler/requests/{id}. Профили хранятся в памяти воркера, который
+обработал запрос.
+
+Медленные запросы (дольше SLOW_QUERY_MS) журналируются для всех соединений
+пула через query logger asyncpg независимо от профилировщика. Для SELECT
+план EXPLAIN (ANALYZE, BUFFERS) снимается в фоновой задаче на отдельном
+соединении, в транзакции только для чтения с откатом, не чаще раза в
+SLOW_QUERY_EXPLAIN_INTERVAL секунд для одного отпечатка.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import secrets
+import time
+import uuid
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from metrics import current_request
+
+
+logger = logging.getLogger(__name__)
+
+QUERY_PROFILER = os.getenv("QUERY_PROFILER", "off")
+QUERY_PROFILER_TOKEN = os.getenv("QUERY_PROFILER_TOKEN", "")
+QUERY_PROFILE_HISTORY = int(os.getenv("QUERY_PROFILE_HISTORY", "100"))
+# Записей о запросах в заголовке Server-Timing (остальные - только в профиле)
+SERVER_TIMING_ENTRIES = 20
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "1") == "1"
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+SLOW_QUERY_EXPLAIN_TIMEOUT_MS = int(os.getenv("SLOW_QUERY_EXPLAIN_TIMEOUT_MS", "5000"))
+SLOW_QUERY_HISTORY = int(os.getenv("SLOW_QUERY_HISTORY", "100"))
+
+PROFILE_HEADER = b"x-query-profile"
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"\$\d+")
+_SPACE_RE = re.compile(r"\s+")
+# EXPLAIN ANALYZE выполняет запрос: только чтение и без побочных эффектов вне транзакции
+_EXPLAINABLE_RE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+_UNSAFE_RE = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|advisory|pg_notify|pg_sleep|nextval|setval|set_config|dblink)\b",
+    re.IGNORECASE
+)
+
+
+def fingerprint(sql: str):
+    """(id, текст) отпечатка: литералы и номера параметров заменены на ?"""
+    normalized = _SPACE_RE.sub(" ", sql).strip()
+    normalized = _STRING_RE.sub("?", normalized)
+    normalized = _PARAM_RE.sub("?", normalized)
+    normalized = _NUMBER_RE.sub("?", normalized)
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12], normalized
+
+
+def _rows(result) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, str):
+        # Статус команды: "UPDATE 3", "INSERT 0 1", "SELECT 5"
+        tail = result.rsplit(" ", 1)[-1]
+        return int(tail) if tail.isdigit() else 0
+    return 1
+
+
+class QueryProfile:
+    def __init__(self, method: str, path: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.status = None
+        self.queries = []
+
+    def add(self, sql: str, params: int, rows: int, started: float, elapsed: float, error: Optional[str] = None):
+        fingerprint_id, text = fingerprint(sql)
+        self.queries.append({
+            "fingerprint": fingerprint_id,
+            "sql": text,
+            "params": params,
+            "rows": rows,
+            "offset_ms": round((started - self.started) * 1000, 2),
+            "duration_ms": round(elapsed * 1000, 2),
+            "slow": elapsed * 1000 >= SLOW_QUERY_MS,
+            "error": error,
+        })
+
+    def finish(self, status: int):
+        self.status = status
+        self.duration_ms = round((time.perf_counter() - self.started) * 1000, 2)
+
+    def db_ms(self) -> float:
+        return round(sum(q["duration_ms"] for q in self.queries), 2)
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing: итог по БД и самые долгие запросы"""
+        entries = [f'db;dur={self.db_ms()};desc="{len(self.queries)} queries"']
+        slowest = sorted(enumerate(self.queries), key=lambda item: -item[1]["duration_ms"])
+        for index, query in sorted(slowest[:SERVER_TIMING_ENTRIES]):
+            desc = query["sql"][:80].encode("ascii", "replace").decode("ascii").replace('"', "'")
+            entries.append(f'q{index + 1};dur={query["duration_ms"]};desc="{desc}"')
+        return ", ".join(entries)
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "queries": len(self.queries),
+            "db_ms": self.db_ms(),
+        }
+
+    def waterfall(self) -> dict:
+        """Запросы в порядке выполнения и повторы одного отпечатка (признак N+1)"""
+        repeated = {}
+        for query in self.queries:
+            repeated[query["fingerprint"]] = repeated.get(query["fingerprint"], 0) + 1
+        return {
+            **self.summary(),
+            "repeated": {k: v for k, v in repeated.items() if v > 1},
+            "statements": self.queries,
+        }
+
+
+current_profile: ContextVar[Optional[QueryProfile]] = ContextVar("current_profile", default=None)
+
+
+class ProfiledConnection:
+    """Обертка соединения asyncpg: запросы учитываются в профиле, остальное передается как есть"""
+
+    def __init__(self, conn, profile: QueryProfile):
+        self._conn = conn
+        self._profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def _timed(self, method, query: str, args: tuple, kwargs: dict):
+        started = time.perf_counter()
+        try:
+            result = await method(query, *args, **kwargs)
+        except Exception as e:
+            self._profile.add(query, len(args), 0, started, time.perf_counter() - started, type(e).__name__)
+            raise
+        self._profile.add(query, len(args), _rows(result), started, time.perf_counter() - started)
+        return result
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed(self._conn.fetch, query, args, kwargs)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed(self._conn.fetchrow, query, args, kwargs)
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed(self._conn.fetchval, query, args, kwargs)
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed(self._conn.execute, query, args, kwargs)
+
+    async def executemany(self, command, args, **kwargs):
+        args = list(args)
+        started = time.perf_counter()
+        result = await self._conn.executemany(command, args, **kwargs)
+        self._profile.add(command, len(args[0]) if args else 0, len(args), started, time.perf_counter() - started)
+        return result
+
+
+def wrap_connection(conn):
+    """Соединение для текущего контекста: обертка, если запрос профилируется"""
+    profile = current_profile.get()
+    return ProfiledConnection(conn, profile) if profile is not None else conn
+
+
+class QueryProfiler:
+    def __init__(self, mode: str = QUERY_PROFILER, token: str = QUERY_PROFILER_TOKEN, history: int = QUERY_PROFILE_HISTORY):
+        if mode == "header" and not token:
+            # Иначе любой анонимный клиент получал бы отпечатки SQL и время запросов
+            logger.warning("QUERY_PROFILER=header без QUERY_PROFILER_TOKEN: профилировщик выключен")
+            mode = "off"
+        self.mode = mode
+        self.token = token
+        self._profiles: "OrderedDict[str, QueryProfile]" = OrderedDict()
+        self.history = history
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode in ("header", "all")
+
+    def wants(self, headers) -> bool:
+        if self.mode == "all":
+            return True
+        if self.mode != "header":
+            return False
+        for name, value in headers:
+            if name == PROFILE_HEADER:
+                return secrets.compare_digest(value.decode("latin-1"), self.token)
+        return False
+
+    def store(self, profile: QueryProfile):
+        self._profiles[profile.id] = profile
+        while len(self._profiles) > self.history:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[QueryProfile]:
+        return self._profiles.get(profile_id)
+
+    def recent(self, limit: int = 50) -> list:
+        return [p.summary() for p in reversed(list(self._profiles.values())[-limit:])]
+
+
+profiler = QueryProfiler()
+
+
+class QueryProfilerMiddleware:
+    """Профиль запроса и заголовки с его итогами; добавляется, только если профилировщик включен"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.wants(scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile(scope["method"], scope["path"])
+        token = current_profile.set(profile)
+        status = 500
+
+        async def send_with_profile(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-query-profile-id", profile.id.encode("latin-1")),
+                    (b"server-timing", profile.server_timing().encode("latin-1")),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            current_profile.reset(token)
+            profile.finish(status)
+            profiler.store(profile)
+            logger.info(
+                "Профиль запроса %s %s: %s запросов к БД, %s мс",
+                profile.method, profile.path, len(profile.queries), profile.db_ms(),
+                extra={"profile_id": profile.id, "duration_ms": profile.duration_ms}
+            )
+
+
+class _Rollback(Exception):
+    """Выход из транзакции EXPLAIN с откатом; несет текст плана"""
+
+
+class SlowQueryLog:
+    """Журнал медленных запросов со всех соединений пула (обработчик query logger asyncpg)"""
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_QUERY_MS,
+        explain: bool = SLOW_QUERY_EXPLAIN,
+        explain_interval: float = SLOW_QUERY_EXPLAIN_INTERVAL,
+        history: int = SLOW_QUERY_HISTORY
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.explain_interval = explain_interval
+        self.entries = deque(maxlen=history)
+        self.counters = {"slow": 0, "explained": 0, "explain_errors": 0}
+        self._explained_at = {}
+        self._explain_lock = asyncio.Lock()
+        self._tasks = set()
+
+    def observe(self, record):
+        """record - asyncpg LoggedQuery"""
+        elapsed_ms = record.elapsed * 1000
+        if elapsed_ms < self.threshold_ms or record.query.lstrip()[:7].upper() == "EXPLAIN":
+            return
+
+        fingerprint_id, text = fingerprint(record.query)
+        self.counters["slow"] += 1
+        entry = {
+            "fingerprint": fingerprint_id,
+            "sql": text,
+            "params": len(record.args or ()),
+            "duration_ms": round(elapsed_ms, 2),
+            "at": datetime.now().isoformat(),
+            "error": type(record.exception).__name__ if record.exception else None,
+            "plan": None,
+        }
+        self.entries.append(entry)
+        logger.warning(
+            "Медленный запрос %.1f мс: %s", elapsed_ms, text[:500],
+            extra={"fingerprint": fingerprint_id, "duration_ms": entry["duration_ms"]}
+        )
+
+        if self._should_explain(fingerprint_id, record):
+            task = asyncio.get_running_loop().create_task(
+                self._explain(entry, record.query, tuple(record.args or ()))
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _should_explain(self, fingerprint_id: str, record) -> bool:
+        if not self.explain or record.exception is not None:
+            return False
+        if not _EXPLAINABLE_RE.match(record.query) or _UNSAFE_RE.search(record.query):
+            return False
+        now = time.monotonic()
+        if now - self._explained_at.get(fingerprint_id, -self.explain_interval) < self.explain_interval:
+            return False
+        self._explained_at[fingerprint_id] = now
+        return True
+
+    async def _explain(self, entry: dict, query: str, args: tuple):
+        # Задача создана в контексте HTTP-запроса: план не должен попасть в его профиль и метрики
+        current_profile.set(None)
+        current_request.set(None)
+        # database импортирует этот модуль, поэтому acquire импортируется при вызове
+        from database import acquire
+
+        async with self._explain_lock:
+            try:
+                async with acquire() as conn:
+                    async with conn.transaction(readonly=True):
+                        await conn.execute(f"SET LOCAL statement_timeout = {SLOW_QUERY_EXPLAIN_TIMEOUT_MS}")
+                        rows = await conn.fetch(f"EXPLAIN (ANALYZE, BUFFERS) {query}", *args)
+                        # Транзакция откатывается: EXPLAIN ANALYZE не должен оставить следов
+                        raise _Rollback("\n".join(r[0] for r in rows))
+            except _Rollback as plan:
+                entry["plan"] = str(plan)
+                self.counters["explained"] += 1
+                logger.warning(
+                    "План медленного запроса %s:\n%s", entry["fingerprint"], entry["plan"],
+                    extra={"fingerprint": entry["fingerprint"]}
+                )
+            except Exception as e:
+                self.counters["explain_errors"] += 1
+                logger.warning("Не удалось получить план запроса %s: %s", entry['fingerprint'], e)
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "explain": self.explain,
+            **self.counters,
+            "recent": list(reversed(self.entries)),
+        }
+
+
+slow_queries = SlowQueryLog()
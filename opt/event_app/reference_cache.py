@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+import asyncpg
+
+from database import DATABASE_URL
+
+
+logger = logging.getLogger(__name__)
+
+# Небольшие справочники, которые нужны почти каждой форме. Помещения и
+# сотрудники сюда не входят: их тысячи, и они читаются из БД с фильтрами
+REFERENCE_QUERIES = {
+    "event_types": "SELECT * FROM event_types ORDER BY name",
+    "event_statuses": "SELECT * FROM event_statuses ORDER BY name",
+    "age_categories": "SELECT * FROM age_categories ORDER BY name",
+    "room_types": "SELECT * FROM room_types ORDER BY name",
+    "positions": "SELECT * FROM positions ORDER BY name",
+}
+
+NOTIFY_CHANNEL = "reference_data_changed"
+LISTEN_ENABLED = os.getenv("REFERENCE_CACHE_LISTEN", "1") == "1"
+# Верхняя граница устаревания, если оповещение потеряно (или LISTEN выключен)
+REFERENCE_CACHE_TTL = float(os.getenv("REFERENCE_CACHE_TTL", "300"))
+# Пауза перед повторным подключением слушателя после обрыва
+LISTEN_RECONNECT_DELAY = float(os.getenv("REFERENCE_CACHE_RECONNECT_DELAY", "5"))
+
+
+class ReferenceCache:
+    """Версионированный кэш справочников с инвалидацией при записи и по TTL"""
+
+    def __init__(self, ttl: float = REFERENCE_CACHE_TTL):
+        self.ttl = ttl
+        self._data = {}
+        self._loaded_at = {}
+        self.versions = {table: 0 for table in REFERENCE_QUERIES}
+        self.loads = 0
+        self.stale_loads = 0
+        self.reconnects = 0
+        self._listener: Optional[asyncpg.Connection] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Другие каналы на том же соединении: канал -> (обработчик, сброс при обрыве)
+        self._subscriptions = {}
+
+    async def load(self, conn, tables=None) -> dict:
+        """
+        Загрузка (перезагрузка) справочников из БД.
+
+        Если во время запроса справочник был сброшен (invalidate или
+        оповещение), прочитанные строки могут быть старыми: они возвращаются
+        вызывающему, но в кэш не записываются.
+        """
+        loaded = {}
+        for table in tables or REFERENCE_QUERIES:
+            version = self.versions[table]
+            rows = [dict(r) for r in await conn.fetch(REFERENCE_QUERIES[table])]
+            self.loads += 1
+            loaded[table] = rows
+            if self.versions[table] != version:
+                self.stale_loads += 1
+                continue
+            self._data[table] = rows
+            self._loaded_at[table] = time.monotonic()
+        return loaded
+
+    def _fresh(self, table: str) -> bool:
+        return table in self._data and time.monotonic() - self._loaded_at[table] < self.ttl
+
+    async def get(self, conn, table: str) -> list:
+        if self._fresh(table):
+            return self._data[table]
+        return (await self.load(conn, [table]))[table]
+
+    async def get_many(self, conn, *tables) -> dict:
+        return {table: await self.get(conn, table) for table in tables}
+
+    def _drop(self, table: str):
+        self._data.pop(table, None)
+        self.versions[table] += 1
+
+    async def invalidate(self, conn, *tables):
+        """Сброс справочников после записи и оповещение других воркеров"""
+        for table in tables:
+            self._drop(table)
+            if LISTEN_ENABLED:
+                await conn.execute(
+                    "SELECT pg_notify($1, $2)", NOTIFY_CHANNEL, f"{os.getpid()}:{table}"
+                )
+
+    def _on_notify(self, connection, pid, channel, payload):
+        sender, _, table = payload.partition(":")
+        if sender == str(os.getpid()):
+            return
+        if table in REFERENCE_QUERIES:
+            self._drop(table)
+
+    def subscribe(self, channel: str, callback, reset):
+        """
+        Канал, который слушается на том же соединении (вызывать до start_listener).
+
+        reset вызывается после обрыва соединения и после переподключения:
+        оповещения за это время потеряны.
+        """
+        self._subscriptions[channel] = (callback, reset)
+
+    def _reset_all(self):
+        for table in REFERENCE_QUERIES:
+            self._drop(table)
+        for _, reset in self._subscriptions.values():
+            reset()
+
+    def _on_terminate(self, connection):
+        # Пока слушателя нет, оповещения теряются: кэши сбрасываются целиком
+        self._listener = None
+        self._reset_all()
+        if not self._stopping:
+            logger.warning("Соединение LISTEN справочников разорвано, переподключение")
+            self._reconnect_task = asyncio.ensure_future(self._reconnect())
+
+    async def _connect(self):
+        listener = await asyncpg.connect(DATABASE_URL)
+        await listener.add_listener(NOTIFY_CHANNEL, self._on_notify)
+        for channel, (callback, _) in self._subscriptions.items():
+            await listener.add_listener(channel, callback)
+        listener.add_termination_listener(self._on_terminate)
+        self._listener = listener
+
+    async def _reconnect(self):
+        while not self._stopping and self._listener is None:
+            await asyncio.sleep(LISTEN_RECONNECT_DELAY)
+            try:
+                await self._connect()
+                self.reconnects += 1
+                # Оповещения, пришедшие до подключения, потеряны
+                self._reset_all()
+            except Exception:
+                logger.exception("Не удалось переподключить LISTEN справочников")
+
+    async def start_listener(self):
+        """Подписка на изменения справочников через LISTEN/NOTIFY"""
+        if not LISTEN_ENABLED or self._listener is not None:
+            return
+        self._stopping = False
+        await self._connect()
+
+    async def stop_listener(self):
+        self._stopping = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._listener is None:
+            return
+        listener, self._listener = self._listener, None
+        try:
+            listener.remove_termination_listener(self._on_terminate)
+            await listener.remove_listener(NOTIFY_CHANNEL, self._on_notify)
+            for channel, (callback, _) in self._subscriptions.items():
+                await listener.remove_listener(channel, callback)
+            await asyncio.wait_for(listener.close(), timeout=5)
+        except Exception:
+            listener.terminate()
+
+    def stats(self) -> dict:
+        return {
+            "loaded": sorted(self._data),
+            "versions": dict(self.versions),
+            "loads": self.loads,
+            "stale_loads": self.stale_loads,
+            "ttl": self.ttl,
+            "listening": self._listener is not None,
+            "reconnects": self.reconnects,
+        }
+
+
+reference_cache = ReferenceCache()
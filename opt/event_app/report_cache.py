@@ -0,0 +1,266 @@
+"""
+Кэш готовых отчетов в таблице event_reports.
+
+Ключ - хэш канонических параметров отчета: одинаковые по смыслу запросы
+(event_id="all" и без event_id, числа строкой и числом) попадают в одну
+запись. Записи удаляются триггерами миграции 0005 при изменении мероприятий
+и бронирований, пересекающих период отчета; TTL ограничивает срок жизни
+записи на случай изменений, которые триггеры не отслеживают.
+
+Перед построением отчета запоминается снимок транзакций БД. Отчет не
+сохраняется, если за время построения зафиксирован сброс кэша по
+пересекающемуся периоду (журнал event_report_invalidations, миграция 0009):
+иначе в кэш попал бы отчет без этих изменений.
+
+Попадания в кэш считаются в памяти и записываются в event_reports пачкой не
+чаще раза в REPORT_CACHE_HIT_FLUSH_INTERVAL секунд (или при накоплении
+REPORT_CACHE_HIT_FLUSH_SIZE), чтобы чтение из кэша не было записью в БД.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+REPORT_CACHE_ENABLED = os.getenv("REPORT_CACHE_ENABLED", "1") == "1"
+REPORT_CACHE_TTL = int(os.getenv("REPORT_CACHE_TTL", "3600"))
+REPORT_CACHE_HIT_FLUSH_INTERVAL = float(os.getenv("REPORT_CACHE_HIT_FLUSH_INTERVAL", "60"))
+REPORT_CACHE_HIT_FLUSH_SIZE = int(os.getenv("REPORT_CACHE_HIT_FLUSH_SIZE", "100"))
+
+ACTIVITY_REPORT = "activity"
+
+
+def activity_parameters(
+    start: datetime,
+    end: datetime,
+    event_id: Optional[str] = None,
+    filter_type: Optional[str] = None,
+    filter_value: Optional[str] = None
+) -> dict:
+    """Канонический вид параметров отчета о деятельности (значения как у build_report_query)"""
+    parameters = {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "event_id": int(event_id) if event_id and event_id != "all" else None,
+        "filter_type": None,
+        "filter_value": None,
+    }
+    if filter_type and filter_value and filter_value != "all":
+        parameters["filter_type"] = filter_type
+        parameters["filter_value"] = int(filter_value)
+    return parameters
+
+
+def parameters_hash(report_type: str, parameters: dict) -> str:
+    canonical = json.dumps(
+        {"report_type": report_type, **parameters}, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ReportCache:
+    def __init__(
+        self,
+        ttl: int = REPORT_CACHE_TTL,
+        enabled: bool = REPORT_CACHE_ENABLED,
+        hit_flush_interval: float = REPORT_CACHE_HIT_FLUSH_INTERVAL,
+        hit_flush_size: int = REPORT_CACHE_HIT_FLUSH_SIZE
+    ):
+        self.ttl = ttl
+        self.enabled = enabled
+        self.hit_flush_interval = hit_flush_interval
+        self.hit_flush_size = hit_flush_size
+        self.counters = {"hits": 0, "misses": 0, "stale_skipped": 0, "errors": 0}
+        self._pending_hits = {}     # (report_type, params_hash) -> попадания, не записанные в БД
+        self._last_flush = time.monotonic()
+        self.generations = 0
+        self.generation_ms_total = 0.0
+        self.generation_ms_max = 0.0
+
+    async def lookup(self, conn, report_type: str, params_hash: str) -> Optional[str]:
+        """JSON данных отчета без разбора или None"""
+        return await conn.fetchval(
+            """
+            SELECT data::text FROM event_reports
+            WHERE report_type = $1 AND params_hash = $2
+              AND generated_at > NOW() - make_interval(secs => $3)
+            """,
+            report_type, params_hash, self.ttl
+        )
+
+    async def _count_hit(self, conn, key: tuple):
+        self._pending_hits[key] = self._pending_hits.get(key, 0) + 1
+        if (sum(self._pending_hits.values()) >= self.hit_flush_size
+                or time.monotonic() - self._last_flush >= self.hit_flush_interval):
+            await self.flush_hits(conn)
+
+    async def flush_hits(self, conn):
+        """Запись накопленных попаданий одним запросом"""
+        pending, self._pending_hits = self._pending_hits, {}
+        self._last_flush = time.monotonic()
+        if not pending:
+            return
+        try:
+            await conn.execute(
+                """
+                UPDATE event_reports r SET hits = r.hits + h.hits, last_hit_at = NOW()
+                FROM unnest($1::text[], $2::text[], $3::int[]) AS h(report_type, params_hash, hits)
+                WHERE r.report_type = h.report_type AND r.params_hash = h.params_hash
+                """,
+                [key[0] for key in pending], [key[1] for key in pending], list(pending.values())
+            )
+        except Exception as e:
+            # Счетчик попаданий - статистика, ответ из-за него не должен падать
+            self.counters["errors"] += 1
+            logger.exception("Ошибка записи попаданий в кэш отчетов")
+
+    async def store(
+        self,
+        conn,
+        report_type: str,
+        params_hash: str,
+        parameters: dict,
+        data: list,
+        generation_ms: float,
+        snapshot: str
+    ) -> Optional[str]:
+        """
+        Сохранение отчета, построенного на снимке snapshot (txid_current_snapshot).
+
+        Возвращает JSON данных или None, если после снимка зафиксирован сброс
+        кэша по пересекающемуся периоду - тогда отчет не сохраняется.
+        """
+        encoded = json.dumps(data, ensure_ascii=False, default=str)
+        async with conn.transaction():
+            await conn.execute(
+                """
+                DELETE FROM event_reports
+                WHERE params_hash IS NOT NULL AND generated_at <= NOW() - make_interval(secs => $1)
+                """,
+                self.ttl
+            )
+            # Отчет строится не дольше TTL, более старые записи журнала не нужны
+            await conn.execute(
+                "DELETE FROM event_report_invalidations WHERE invalidated_at <= NOW() - make_interval(secs => $1)",
+                self.ttl
+            )
+            result = await conn.execute(
+                """
+                INSERT INTO event_reports
+                    (event_id, report_type, generated_at, data, parameters, params_hash,
+                     period_start, period_end, row_count, generation_ms)
+                SELECT $1, $2, NOW(), $3::jsonb, $4::jsonb, $5, $6, $7, $8, $9
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM event_report_invalidations i
+                    WHERE NOT txid_visible_in_snapshot(i.txid, $10::txid_snapshot)
+                      AND (i.period_start IS NULL
+                           OR tsrange(i.period_start, i.period_end, '[]') && tsrange($6, $7, '[]'))
+                )
+                ON CONFLICT (report_type, params_hash) DO UPDATE SET
+                    generated_at = NOW(),
+                    data = EXCLUDED.data,
+                    parameters = EXCLUDED.parameters,
+                    row_count = EXCLUDED.row_count,
+                    generation_ms = EXCLUDED.generation_ms,
+                    hits = 0,
+                    last_hit_at = NULL
+                """,
+                parameters.get("event_id"), report_type, encoded,
+                json.dumps(parameters, ensure_ascii=False), params_hash,
+                datetime.fromisoformat(parameters["start"]), datetime.fromisoformat(parameters["end"]),
+                len(data), round(generation_ms, 1), snapshot
+            )
+        if result.endswith(" 0"):
+            return None
+        return encoded
+
+    async def get_or_generate(
+        self,
+        conn,
+        report_type: str,
+        parameters: dict,
+        generate: Callable[[], Awaitable[list]]
+    ) -> dict:
+        """
+        Данные отчета как JSON-текст: из кэша или после generate.
+
+        Возвращает {"data": <json>, "cached": bool, "generation_ms": float}.
+        """
+        if not self.enabled:
+            started = time.perf_counter()
+            data = await generate()
+            return {
+                "data": json.dumps(data, ensure_ascii=False, default=str),
+                "cached": False,
+                "generation_ms": self._record((time.perf_counter() - started) * 1000),
+            }
+
+        params_hash = parameters_hash(report_type, parameters)
+        cached = await self.lookup(conn, report_type, params_hash)
+        if cached is not None:
+            self.counters["hits"] += 1
+            await self._count_hit(conn, (report_type, params_hash))
+            return {"data": cached, "cached": True, "generation_ms": 0.0}
+
+        self.counters["misses"] += 1
+        # Снимок до построения: сброс, зафиксированный позже, в отчет может не попасть
+        snapshot = await conn.fetchval("SELECT txid_current_snapshot()::text")
+        started = time.perf_counter()
+        data = await generate()
+        generation_ms = self._record((time.perf_counter() - started) * 1000)
+        try:
+            encoded = await self.store(
+                conn, report_type, params_hash, parameters, data, generation_ms, snapshot
+            )
+            if encoded is None:
+                self.counters["stale_skipped"] += 1
+        except Exception as e:
+            # Отчет уже построен - ошибка записи в кэш не должна его терять
+            self.counters["errors"] += 1
+            logger.exception("Ошибка сохранения отчета в кэш")
+            encoded = None
+        if encoded is None:
+            encoded = json.dumps(data, ensure_ascii=False, default=str)
+        return {"data": encoded, "cached": False, "generation_ms": generation_ms}
+
+    def _record(self, generation_ms: float) -> float:
+        self.generations += 1
+        self.generation_ms_total += generation_ms
+        self.generation_ms_max = max(self.generation_ms_max, generation_ms)
+        return round(generation_ms, 1)
+
+    async def stats(self, conn) -> dict:
+        """Счетчики этого процесса и сводка по записям в БД"""
+        await self.flush_hits(conn)
+        lookups = self.counters["hits"] + self.counters["misses"]
+        row = await conn.fetchrow(
+            """
+            SELECT COUNT(*) AS entries,
+                   COALESCE(SUM(hits), 0) AS stored_hits,
+                   COALESCE(AVG(generation_ms), 0) AS avg_generation_ms,
+                   COALESCE(SUM(pg_column_size(data)), 0) AS data_bytes
+            FROM event_reports
+            WHERE params_hash IS NOT NULL
+            """
+        )
+        return {
+            **self.counters,
+            "enabled": self.enabled,
+            "ttl": self.ttl,
+            "hit_ratio": self.counters["hits"] / lookups if lookups else 0.0,
+            "generations": self.generations,
+            "avg_generation_ms": round(self.generation_ms_total / self.generations, 1) if self.generations else 0.0,
+            "max_generation_ms": round(self.generation_ms_max, 1),
+            "entries": row["entries"],
+            "stored_hits": row["stored_hits"],
+            "stored_avg_generation_ms": round(float(row["avg_generation_ms"]), 1),
+            "data_bytes": row["data_bytes"],
+        }
+
+
+report_cache = ReportCache()
@@ -0,0 +1,244 @@
+"""
+Хранилище токенов сброса пароля.
+
+DatabaseTokenStore (по умолчанию) держит токены в таблице
+password_reset_tokens, поэтому ссылка, выданная одним воркером, работает на
+любом другом. Проверка ссылки при открытии формы обслуживается из LRU-кэша
+процесса, а использование токена - всегда одним DELETE ... RETURNING, так что
+токен нельзя применить дважды даже с разных воркеров. MemoryTokenStore -
+словарь процесса для запуска с одним воркером.
+
+В обоих хранилищах ключ - хэш токена, поиск по ключу без перебора. Просроченные
+токены удаляет периодическая очистка.
+"""
+import asyncio
+import logging
+import os
+import secrets
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from database import acquire
+from session_cache import hash_token
+
+
+logger = logging.getLogger(__name__)
+
+PASSWORD_RESET_STORE = os.getenv("PASSWORD_RESET_STORE", "db")
+PASSWORD_RESET_TTL = int(os.getenv("PASSWORD_RESET_TTL", "3600"))
+PASSWORD_RESET_SWEEP_INTERVAL = float(os.getenv("PASSWORD_RESET_SWEEP_INTERVAL", "300"))
+PASSWORD_RESET_CACHE_SIZE = int(os.getenv("PASSWORD_RESET_CACHE_SIZE", "10000"))
+
+
+class TokenStore:
+    """
+    Общий интерфейс хранилищ.
+
+    peek и consume возвращают {"user_id", "expires_at"} или None; срок
+    действия проверяет вызывающий код, чтобы отличать устаревшую ссылку от
+    неизвестной.
+    """
+
+    name = "base"
+
+    def __init__(self, ttl: int = PASSWORD_RESET_TTL):
+        self.ttl = ttl
+        self.counters = {"issued": 0, "consumed": 0, "swept": 0}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def issue(self, user_id: int):
+        """Новый токен и срок его действия"""
+        token = secrets.token_urlsafe(32)
+        expires_at = datetime.now() + timedelta(seconds=self.ttl)
+        await self._store(hash_token(token), {"user_id": user_id, "expires_at": expires_at})
+        self.counters["issued"] += 1
+        return token, expires_at
+
+    async def _store(self, key: str, entry: dict):
+        raise NotImplementedError
+
+    async def peek(self, token: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def consume(self, token: str, conn=None) -> Optional[dict]:
+        """Удаление токена; запись возвращается только одному из конкурирующих запросов"""
+        raise NotImplementedError
+
+    async def revoke_user(self, user_id: int, conn=None):
+        """Удаление остальных токенов пользователя после смены пароля"""
+        raise NotImplementedError
+
+    async def sweep(self) -> int:
+        """Удаление просроченных токенов; возвращает их число"""
+        raise NotImplementedError
+
+    async def _sweep_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.counters["swept"] += await self.sweep()
+            except Exception as e:
+                logger.exception("Ошибка очистки токенов сброса пароля")
+
+    def start_sweeper(self, interval: float = PASSWORD_RESET_SWEEP_INTERVAL):
+        if self._sweeper is None and interval > 0:
+            self._sweeper = asyncio.create_task(self._sweep_loop(interval))
+
+    async def stop_sweeper(self):
+        if self._sweeper is None:
+            return
+        self._sweeper.cancel()
+        try:
+            await self._sweeper
+        except asyncio.CancelledError:
+            pass
+        self._sweeper = None
+
+    def stats(self) -> dict:
+        return {"store": self.name, "ttl": self.ttl, **self.counters}
+
+
+class MemoryTokenStore(TokenStore):
+    """Токены в памяти процесса: подходит только для одного воркера"""
+
+    name = "memory"
+
+    def __init__(self, ttl: int = PASSWORD_RESET_TTL):
+        super().__init__(ttl)
+        self._tokens = {}
+
+    async def _store(self, key, entry):
+        self._tokens[key] = entry
+
+    async def peek(self, token):
+        entry = self._tokens.get(hash_token(token))
+        return dict(entry) if entry is not None else None
+
+    async def consume(self, token, conn=None):
+        entry = self._tokens.pop(hash_token(token), None)
+        if entry is not None:
+            self.counters["consumed"] += 1
+        return entry
+
+    async def revoke_user(self, user_id, conn=None):
+        for key in [k for k, e in self._tokens.items() if e["user_id"] == user_id]:
+            del self._tokens[key]
+
+    async def sweep(self):
+        now = datetime.now()
+        expired = [k for k, e in self._tokens.items() if e["expires_at"] <= now]
+        for key in expired:
+            del self._tokens[key]
+        return len(expired)
+
+    def stats(self):
+        return {**super().stats(), "size": len(self._tokens)}
+
+
+class DatabaseTokenStore(TokenStore):
+    """Токены в БД с кэшем процесса для проверки ссылок"""
+
+    name = "db"
+
+    def __init__(self, ttl: int = PASSWORD_RESET_TTL, cache_size: int = PASSWORD_RESET_CACHE_SIZE):
+        super().__init__(ttl)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _remember(self, key: str, entry: dict):
+        if self.cache_size <= 0:
+            return
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _store(self, key, entry):
+        async with acquire() as conn:
+            await conn.execute(
+                "INSERT INTO password_reset_tokens (token_hash, user_id, expires_at) VALUES ($1, $2, $3)",
+                key, entry["user_id"], entry["expires_at"]
+            )
+        self._remember(key, entry)
+
+    async def peek(self, token):
+        # Токен, использованный на другом воркере, может остаться в кэше до очистки;
+        # это влияет только на показ формы - consume всегда проверяет БД
+        key = hash_token(token)
+        entry = self._cache.get(key)
+        if entry is not None:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return dict(entry)
+
+        self.cache_misses += 1
+        async with acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT user_id, expires_at FROM password_reset_tokens WHERE token_hash = $1", key
+            )
+        if row is None:
+            return None
+        entry = dict(row)
+        self._remember(key, entry)
+        return dict(entry)
+
+    async def consume(self, token, conn=None):
+        key = hash_token(token)
+        self._cache.pop(key, None)
+        query = "DELETE FROM password_reset_tokens WHERE token_hash = $1 RETURNING user_id, expires_at"
+        if conn is not None:
+            row = await conn.fetchrow(query, key)
+        else:
+            async with acquire() as own_conn:
+                row = await own_conn.fetchrow(query, key)
+        if row is None:
+            return None
+        self.counters["consumed"] += 1
+        return dict(row)
+
+    async def revoke_user(self, user_id, conn=None):
+        for key in [k for k, e in self._cache.items() if e["user_id"] == user_id]:
+            del self._cache[key]
+        query = "DELETE FROM password_reset_tokens WHERE user_id = $1"
+        if conn is not None:
+            await conn.execute(query, user_id)
+        else:
+            async with acquire() as own_conn:
+                await own_conn.execute(query, user_id)
+
+    async def sweep(self):
+        now = datetime.now()
+        for key in [k for k, e in self._cache.items() if e["expires_at"] <= now]:
+            del self._cache[key]
+        async with acquire() as conn:
+            result = await conn.execute("DELETE FROM password_reset_tokens WHERE expires_at <= $1", now)
+        return int(result.split()[-1])
+
+    def stats(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            **super().stats(),
+            "cache_size": len(self._cache),
+            "cache_max_size": self.cache_size,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_ratio": self.cache_hits / lookups if lookups else 0.0,
+        }
+
+
+TOKEN_STORES = {
+    "db": DatabaseTokenStore,
+    "memory": MemoryTokenStore,
+}
+
+
+def create_token_store(kind: str = PASSWORD_RESET_STORE) -> TokenStore:
+    if kind not in TOKEN_STORES:
+        raise ValueError(f"Неизвестное хранилище токенов: {kind}")
+    return TOKEN_STORES[kind]()
+
+
+reset_tokens = create_token_store()
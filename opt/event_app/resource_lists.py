@@ -0,0 +1,164 @@
+"""
+Постраничные списки помещений и сотрудников для страницы /rooms.
+
+Сортировка - только по разрешенным колонкам (с id для однозначного порядка),
+фильтры - параметрами запроса. Общее число строк считается отдельным
+запросом: таблица получает страницу сразу, а счетчик догружается.
+"""
+import os
+from typing import Optional
+
+
+RESOURCE_PAGE_SIZE = int(os.getenv("RESOURCE_PAGE_SIZE", "25"))
+RESOURCE_PAGE_SIZE_MAX = 200
+
+ROOMS_FROM = """
+    FROM rooms r
+    LEFT JOIN room_types rt ON rt.id = r.room_type_id
+"""
+
+ROOMS_COLUMNS = """
+    r.id, r.name, r.address, r.capacity, r.description, r.room_type_id,
+    rt.name AS room_type_name, r.is_external, r.image_filename, r.external_url
+"""
+
+ROOMS_SORT = {
+    "name": "r.name",
+    "room_type_name": "rt.name",
+    "capacity": "r.capacity",
+    "address": "r.address",
+    "is_external": "r.is_external",
+}
+
+EMPLOYEES_FROM = """
+    FROM employees e
+    LEFT JOIN positions p ON p.id = e.position_id
+"""
+
+EMPLOYEES_COLUMNS = """
+    e.id, e.full_name, e.position_id, COALESCE(p.name, e.position) AS position_name,
+    e.contact_info, e.is_external, e.external_url
+"""
+
+EMPLOYEES_SORT = {
+    "full_name": "e.full_name",
+    "position_name": "COALESCE(p.name, e.position)",
+    "is_external": "e.is_external",
+    "contact_info": "e.contact_info",
+}
+
+
+def rooms_filter(
+    q: Optional[str] = None,
+    room_type_id: Optional[int] = None,
+    max_capacity: Optional[int] = None,
+    address: Optional[str] = None,
+    is_external: Optional[bool] = None
+):
+    conditions, params = [], []
+    if q and q.strip():
+        params.append(f"%{q.strip()}%")
+        conditions.append(f"r.name ILIKE ${len(params)}")
+    if room_type_id is not None:
+        params.append(room_type_id)
+        conditions.append(f"r.room_type_id = ${len(params)}")
+    if max_capacity is not None:
+        params.append(max_capacity)
+        conditions.append(f"r.capacity <= ${len(params)}")
+    if address and address.strip():
+        params.append(f"%{address.strip()}%")
+        conditions.append(f"r.address ILIKE ${len(params)}")
+    if is_external is not None:
+        params.append(is_external)
+        conditions.append(f"r.is_external = ${len(params)}")
+    return conditions, params
+
+
+def employees_filter(
+    q: Optional[str] = None,
+    position_id: Optional[int] = None,
+    is_external: Optional[bool] = None
+):
+    conditions, params = [], []
+    if q and q.strip():
+        params.append(f"%{q.strip()}%")
+        conditions.append(f"e.full_name ILIKE ${len(params)}")
+    if position_id is not None:
+        params.append(position_id)
+        conditions.append(f"e.position_id = ${len(params)}")
+    if is_external is not None:
+        params.append(is_external)
+        conditions.append(f"COALESCE(e.is_external, FALSE) = ${len(params)}")
+    return conditions, params
+
+
+def _where(conditions) -> str:
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+async def fetch_page(
+    conn,
+    source: str,
+    columns: str,
+    sort_columns: dict,
+    id_column: str,
+    conditions: list,
+    params: list,
+    sort: str,
+    order: str = "asc",
+    page: int = 1,
+    page_size: int = RESOURCE_PAGE_SIZE
+) -> dict:
+    """Страница строк; ValueError при неизвестной колонке сортировки"""
+    if sort not in sort_columns:
+        raise ValueError(f"Сортировка по {sort} не поддерживается")
+    direction = "DESC" if order == "desc" else "ASC"
+    page = max(1, page)
+    page_size = max(1, min(page_size, RESOURCE_PAGE_SIZE_MAX))
+
+    params = list(params)
+    params.extend([page_size + 1, (page - 1) * page_size])
+    rows = await conn.fetch(
+        f"SELECT {columns} {source}{_where(conditions)}"
+        f" ORDER BY {sort_columns[sort]} {direction} NULLS LAST, {id_column} {direction}"
+        f" LIMIT ${len(params) - 1} OFFSET ${len(params)}",
+        *params
+    )
+    return {
+        "items": [dict(r) for r in rows[:page_size]],
+        "page": page,
+        "page_size": page_size,
+        "has_more": len(rows) > page_size,
+        "sort": sort,
+        "order": direction.lower(),
+    }
+
+
+async def count_rows(conn, source: str, conditions: list, params: list) -> int:
+    return await conn.fetchval(f"SELECT COUNT(*) {source}{_where(conditions)}", *params)
+
+
+async def rooms_page(conn, sort="name", order="asc", page=1, page_size=RESOURCE_PAGE_SIZE, **filters) -> dict:
+    conditions, params = rooms_filter(**filters)
+    return await fetch_page(
+        conn, ROOMS_FROM, ROOMS_COLUMNS, ROOMS_SORT, "r.id",
+        conditions, params, sort, order, page, page_size
+    )
+
+
+async def rooms_count(conn, **filters) -> int:
+    conditions, params = rooms_filter(**filters)
+    return await count_rows(conn, ROOMS_FROM, conditions, params)
+
+
+async def employees_page(conn, sort="full_name", order="asc", page=1, page_size=RESOURCE_PAGE_SIZE, **filters) -> dict:
+    conditions, params = employees_filter(**filters)
+    return await fetch_page(
+        conn, EMPLOYEES_FROM, EMPLOYEES_COLUMNS, EMPLOYEES_SORT, "e.id",
+        conditions, params, sort, order, page, page_size
+    )
+
+
+async def employees_count(conn, **filters) -> int:
+    conditions, params = employees_filter(**filters)
+    return await count_rows(conn, EMPLOYEES_FROM, conditions, params)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+
+
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "60"))
+
+# Отзыв сессий рассылается остальным воркерам через соединение LISTEN
+# справочников (reference_cache.subscribe)
+SESSION_NOTIFY_CHANNEL = "session_revoked"
+
+
+def hash_token(session_token: str) -> str:
+    """Ключ кэша: в памяти хранится только хэш токена, а не сам токен"""
+    return hashlib.sha256(session_token.encode("utf-8")).hexdigest()
+
+
+class SessionCache:
+    """LRU-кэш сессий: пользователь, роли и срок действия сессии"""
+
+    def __init__(self, max_size: int = SESSION_CACHE_SIZE, ttl: float = SESSION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session_token: str) -> Optional[dict]:
+        key = hash_token(session_token)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        if time.monotonic() >= entry["valid_until"]:
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return {"user": dict(entry["user"]), "roles": list(entry["roles"])}
+
+    def put(self, session_token: str, user: dict, roles: list, expires_at: datetime):
+        if self.max_size <= 0:
+            return
+
+        # TTL записи не может превышать срок жизни самой сессии
+        remaining = (expires_at - datetime.now()).total_seconds()
+        ttl = min(self.ttl, remaining)
+        if ttl <= 0:
+            return
+
+        key = hash_token(session_token)
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = {
+            "user": dict(user),
+            "roles": list(roles),
+            "expires_at": expires_at,
+            "valid_until": time.monotonic() + ttl,
+        }
+        self._by_user.setdefault(user["id"], set()).add(key)
+
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def invalidate(self, session_token: str):
+        """Удаление одной сессии (выход из системы)"""
+        self._remove(hash_token(session_token))
+
+    def invalidate_user(self, user_id: int):
+        """Удаление всех сессий пользователя (смена пароля, ролей, удаление)"""
+        for key in list(self._by_user.get(user_id, ())):
+            self._remove(key)
+
+    async def revoke(self, conn, session_token: str):
+        """invalidate в этом воркере и оповещение остальных"""
+        key = hash_token(session_token)
+        self._remove(key)
+        await self._notify(conn, f"session:{key}")
+
+    async def revoke_user(self, conn, user_id: int):
+        """invalidate_user в этом воркере и оповещение остальных"""
+        self.invalidate_user(user_id)
+        await self._notify(conn, f"user:{user_id}")
+
+    async def _notify(self, conn, message: str):
+        # Внутри транзакции оповещение доставляется после фиксации
+        await conn.execute(
+            "SELECT pg_notify($1, $2)", SESSION_NOTIFY_CHANNEL, f"{os.getpid()}:{message}"
+        )
+
+    def on_notify(self, connection, pid, channel, payload):
+        sender, _, message = payload.partition(":")
+        if sender == str(os.getpid()):
+            return
+        kind, _, value = message.partition(":")
+        if kind == "session":
+            self._remove(value)
+        elif kind == "user" and value.isdigit():
+            self.invalidate_user(int(value))
+
+    def clear(self):
+        self._entries.clear()
+        self._by_user.clear()
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry["user"]["id"]
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+session_cache = SessionCache()
@@ -0,0 +1,379 @@
+"""
+Обслуживание таблицы user_sessions.
+
+Каждый вход добавляет строку, и без очистки таблица и индекс по session_token
+растут бесконечно. Фоновая задача удаляет истекшие сессии пачками по
+SESSION_PURGE_BATCH_SIZE строк: каждая пачка - отдельная короткая транзакция,
+поэтому очистка не держит блокировок на всю таблицу. За проход удаляется не
+больше SESSION_PURGE_MAX_BATCHES пачек, остаток дочищает следующий проход.
+
+Таблицу можно перевести в секционированный режим (секция на сутки по
+expires_at):
+
+    python session_maintenance.py partition
+
+Тогда очистка не удаляет строки, а целиком удаляет секции, в которых все
+сессии истекли, и заранее создает секции на SESSION_PARTITION_AHEAD_DAYS суток
+вперед. Сессии, для которых секции нет (очистка долго не запускалась), попадают
+в секцию по умолчанию user_sessions_default, поэтому вход не ломается; при
+создании секции на день ее строки переносятся из секции по умолчанию, а
+истекшие удаляются из нее пачками. Режим определяется по каталогу БД,
+отдельной настройки нет.
+
+После секционирования CREATE INDEX CONCURRENTLY на user_sessions не
+работает: миграции с индексами этой таблицы пишутся без
+"-- migrate: no-transaction" и CONCURRENTLY.
+
+    python session_maintenance.py status
+    python session_maintenance.py purge
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import asyncpg
+
+from database import DATABASE_URL, acquire
+
+
+logger = logging.getLogger(__name__)
+
+SESSION_PURGE_INTERVAL = float(os.getenv("SESSION_PURGE_INTERVAL", "600"))
+SESSION_PURGE_BATCH_SIZE = int(os.getenv("SESSION_PURGE_BATCH_SIZE", "1000"))
+SESSION_PURGE_MAX_BATCHES = int(os.getenv("SESSION_PURGE_MAX_BATCHES", "100"))
+# Пауза между пачками, чтобы очистка не вытесняла запросы приложения
+SESSION_PURGE_PAUSE = float(os.getenv("SESSION_PURGE_PAUSE", "0.05"))
+# Сессия живет не дольше 7 дней, секции создаются с запасом
+SESSION_PARTITION_AHEAD_DAYS = int(os.getenv("SESSION_PARTITION_AHEAD_DAYS", "14"))
+
+# Ключ advisory-блокировки: при нескольких воркерах проход выполняет только один
+PURGE_LOCK_KEY = 727_002
+
+PARTITION_PREFIX = "user_sessions_p"
+DEFAULT_PARTITION = "user_sessions_default"
+_PARTITION_RE = re.compile(rf"^{PARTITION_PREFIX}(\d{{8}})$")
+
+PURGE_QUERY = """
+    DELETE FROM {table}
+    WHERE id IN (
+        SELECT id FROM {table}
+        WHERE expires_at <= NOW()
+        ORDER BY expires_at
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    )
+"""
+
+
+def partition_name(day: date) -> str:
+    return f"{PARTITION_PREFIX}{day:%Y%m%d}"
+
+
+async def is_partitioned(conn) -> bool:
+    return await conn.fetchval(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = 'user_sessions'::regclass"
+    )
+
+
+async def list_partitions(conn, parent: str = "user_sessions") -> dict:
+    """Секции таблицы: {день: имя секции}"""
+    rows = await conn.fetch(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass
+        """,
+        parent
+    )
+    partitions = {}
+    for r in rows:
+        match = _PARTITION_RE.match(r["relname"])
+        if match:
+            partitions[datetime.strptime(match.group(1), "%Y%m%d").date()] = r["relname"]
+    return partitions
+
+
+async def ensure_partitions(conn, parent: str = "user_sessions", until: Optional[date] = None) -> int:
+    """Секции с сегодняшнего дня до until (по умолчанию на SESSION_PARTITION_AHEAD_DAYS вперед)"""
+    today = date.today()
+    until = until or today + timedelta(days=SESSION_PARTITION_AHEAD_DAYS)
+    existing = await list_partitions(conn, parent)
+    created = 0
+    day = today
+    while day <= until:
+        if day not in existing:
+            await _create_partition(conn, parent, day)
+            created += 1
+        day += timedelta(days=1)
+    return created
+
+
+async def _create_partition(conn, parent: str, day: date):
+    """
+    Секция на сутки. Строки этих суток, уже попавшие в секцию по умолчанию,
+    переносятся в нее: иначе PostgreSQL не даст создать секцию.
+    """
+    start, end = day.isoformat(), (day + timedelta(days=1)).isoformat()
+    default = await conn.fetchval(
+        """
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = $1::regclass AND pg_get_expr(c.relpartbound, c.oid) = 'DEFAULT'
+        """,
+        parent
+    )
+    async with conn.transaction():
+        moved = default is not None and await conn.fetchval(
+            f"SELECT EXISTS (SELECT 1 FROM {default} WHERE expires_at >= '{start}' AND expires_at < '{end}')"
+        )
+        if moved:
+            await conn.execute(
+                f"CREATE TEMP TABLE user_sessions_moved AS "
+                f"SELECT * FROM {default} WHERE expires_at >= '{start}' AND expires_at < '{end}'"
+            )
+            await conn.execute(
+                f"DELETE FROM {default} WHERE expires_at >= '{start}' AND expires_at < '{end}'"
+            )
+        await conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF {parent} "
+            f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        )
+        if moved:
+            await conn.execute(f"INSERT INTO {parent} SELECT * FROM user_sessions_moved")
+            await conn.execute("DROP TABLE user_sessions_moved")
+
+
+async def drop_expired_partitions(conn) -> dict:
+    """Удаление секций за прошедшие сутки: все сессии в них уже истекли"""
+    today = date.today()
+    dropped = rows = 0
+    for day, name in sorted((await list_partitions(conn)).items()):
+        if day >= today:
+            break
+        # Точное число строк не считается: секция удаляется целиком
+        rows += await conn.fetchval(
+            "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE relname = $1", name
+        ) or 0
+        await conn.execute(f"DROP TABLE IF EXISTS {name}")
+        dropped += 1
+    return {"partitions": dropped, "rows": rows}
+
+
+async def partition_table(conn) -> int:
+    """
+    Перевод user_sessions в секционированный режим.
+
+    Выполняется в одной транзакции с эксклюзивной блокировкой таблицы;
+    переносятся только действующие сессии. Уникальность session_token
+    обеспечивается в паре с expires_at (ключ секционирования обязан входить в
+    уникальные индексы), а сам токен - 256 случайных бит.
+    """
+    async with conn.transaction():
+        await conn.execute("LOCK TABLE user_sessions IN ACCESS EXCLUSIVE MODE")
+        if await is_partitioned(conn):
+            return 0
+
+        await conn.execute("""
+            CREATE TABLE user_sessions_partitioned (
+                id INTEGER NOT NULL DEFAULT nextval('user_sessions_id_seq'),
+                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                session_token TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW(),
+                expires_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (id, expires_at),
+                UNIQUE (session_token, expires_at)
+            ) PARTITION BY RANGE (expires_at)
+        """)
+        await conn.execute(
+            f"CREATE TABLE {DEFAULT_PARTITION}_new PARTITION OF user_sessions_partitioned DEFAULT"
+        )
+        last_day = await conn.fetchval(
+            "SELECT MAX(expires_at)::date FROM user_sessions WHERE expires_at > NOW()"
+        )
+        until = date.today() + timedelta(days=SESSION_PARTITION_AHEAD_DAYS)
+        await ensure_partitions(conn, "user_sessions_partitioned", max(until, last_day or until))
+
+        moved = await conn.execute("""
+            INSERT INTO user_sessions_partitioned (id, user_id, session_token, created_at, expires_at)
+            SELECT id, user_id, session_token, created_at, expires_at
+            FROM user_sessions
+            WHERE expires_at > NOW()
+        """)
+        await conn.execute("ALTER SEQUENCE user_sessions_id_seq OWNED BY user_sessions_partitioned.id")
+        await conn.execute("DROP TABLE user_sessions")
+        await conn.execute("ALTER TABLE user_sessions_partitioned RENAME TO user_sessions")
+        await conn.execute(f"ALTER TABLE {DEFAULT_PARTITION}_new RENAME TO {DEFAULT_PARTITION}")
+        return int(moved.split()[-1])
+
+
+class SessionMaintenance:
+    def __init__(
+        self,
+        interval: float = SESSION_PURGE_INTERVAL,
+        batch_size: int = SESSION_PURGE_BATCH_SIZE,
+        max_batches: int = SESSION_PURGE_MAX_BATCHES,
+        pause: float = SESSION_PURGE_PAUSE
+    ):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.pause = pause
+        self.counters = {
+            "runs": 0,
+            "skipped_runs": 0,
+            "errors": 0,
+            "deleted_total": 0,
+            "batches_total": 0,
+            "partitions_created": 0,
+            "partitions_dropped": 0,
+        }
+        self.last_run = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _purge_batches(self, conn, table: str = "user_sessions") -> dict:
+        deleted = batches = 0
+        query = PURGE_QUERY.format(table=table)
+        while batches < self.max_batches:
+            result = await conn.execute(query, self.batch_size)
+            count = int(result.split()[-1])
+            batches += 1
+            deleted += count
+            if count < self.batch_size:
+                break
+            await asyncio.sleep(self.pause)
+        return {"deleted": deleted, "batches": batches}
+
+    async def _maintain_partitions(self, conn) -> dict:
+        # Таблицы, секционированные до появления секции по умолчанию
+        await conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF user_sessions DEFAULT"
+        )
+        dropped = await drop_expired_partitions(conn)
+        created = await ensure_partitions(conn)
+        # Секция по умолчанию не удаляется целиком - истекшие строки чистятся пачками
+        purged = await self._purge_batches(conn, DEFAULT_PARTITION)
+        self.counters["partitions_dropped"] += dropped["partitions"]
+        self.counters["partitions_created"] += created
+        return {
+            "deleted": dropped["rows"] + purged["deleted"],
+            "batches": purged["batches"],
+            "partitions_dropped": dropped["partitions"],
+            "partitions_created": created,
+        }
+
+    async def run_once(self, conn=None) -> Optional[dict]:
+        """Один проход очистки; None, если его уже выполняет другой воркер"""
+        if conn is None:
+            async with acquire() as own_conn:
+                return await self.run_once(own_conn)
+
+        if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", PURGE_LOCK_KEY):
+            self.counters["skipped_runs"] += 1
+            return None
+        try:
+            started = time.perf_counter()
+            partitioned = await is_partitioned(conn)
+            if partitioned:
+                result = await self._maintain_partitions(conn)
+            else:
+                result = await self._purge_batches(conn)
+            duration = time.perf_counter() - started
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock($1)", PURGE_LOCK_KEY)
+
+        self.counters["runs"] += 1
+        self.counters["deleted_total"] += result["deleted"]
+        self.counters["batches_total"] += result["batches"]
+        self.last_run = {
+            **result,
+            "mode": "partitioned" if partitioned else "batched",
+            "finished_at": datetime.now().isoformat(),
+            "duration_ms": round(duration * 1000, 1),
+            "rows_per_second": round(result["deleted"] / duration, 1) if duration > 0 else 0.0,
+        }
+        return self.last_run
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.counters["errors"] += 1
+                logger.exception("Ошибка очистки сессий")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Запуск фоновой очистки; первый проход - сразу (создает секции при старте)"""
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def stats(self, conn) -> dict:
+        """Размер таблицы (со всеми секциями) и счетчики очистки этого процесса"""
+        row = await conn.fetchrow(
+            """
+            SELECT COALESCE(SUM(pg_total_relation_size(t.relid)), 0) AS total_bytes,
+                   COALESCE(SUM(pg_indexes_size(t.relid)), 0) AS index_bytes,
+                   COALESCE(SUM(GREATEST(c.reltuples, 0)) FILTER (WHERE t.isleaf), 0)::bigint AS estimated_rows,
+                   COUNT(*) FILTER (WHERE t.isleaf AND t.level > 0) AS partitions
+            FROM pg_partition_tree('user_sessions') t
+            JOIN pg_class c ON c.oid = t.relid
+            """
+        )
+        expired = await conn.fetchval("SELECT COUNT(*) FROM user_sessions WHERE expires_at <= NOW()")
+        return {
+            "mode": "partitioned" if await is_partitioned(conn) else "batched",
+            "total_bytes": row["total_bytes"],
+            "index_bytes": row["index_bytes"],
+            "estimated_rows": row["estimated_rows"],
+            "expired_rows": expired,
+            "partitions": row["partitions"],
+            "interval": self.interval,
+            "batch_size": self.batch_size,
+            "max_batches": self.max_batches,
+            **self.counters,
+            "last_run": self.last_run,
+        }
+
+
+session_maintenance = SessionMaintenance()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Обслуживание таблицы user_sessions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("status", help="размер таблицы и режим")
+    subparsers.add_parser("purge", help="один проход очистки")
+    subparsers.add_parser("partition", help="перевести таблицу в секционированный режим")
+    args = parser.parse_args()
+
+    conn = await asyncpg.connect(DATABASE_URL)
+    try:
+        if args.command == "partition":
+            moved = await partition_table(conn)
+            print(f"Таблица user_sessions секционирована, перенесено сессий: {moved}")
+        elif args.command == "purge":
+            print(json.dumps(await session_maintenance.run_once(conn), ensure_ascii=False, indent=2))
+        else:
+            print(json.dumps(await session_maintenance.stats(conn), ensure_ascii=False, indent=2))
+    finally:
+        await conn.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,19 +1,4 @@
-DROP TABLE IF EXISTS event_participants CASCADE;
-DROP TABLE IF EXISTS event_contractors CASCADE;
-DROP TABLE IF EXISTS event_reports CASCADE;
-DROP TABLE IF EXISTS resource_bookings CASCADE;
-DROP TABLE IF EXISTS events CASCADE;
-DROP TABLE IF EXISTS external_contractors CASCADE;
-DROP TABLE IF EXISTS user_roles CASCADE;
-DROP TABLE IF EXISTS users CASCADE;
-DROP TABLE IF EXISTS roles CASCADE;
-DROP TABLE IF EXISTS employees CASCADE;
-DROP TABLE IF EXISTS rooms CASCADE;
-DROP TABLE IF EXISTS room_types CASCADE;
-DROP TABLE IF EXISTS event_types CASCADE;
-DROP TABLE IF EXISTS event_statuses CASCADE;
-DROP TABLE IF EXISTS age_categories CASCADE;
-DROP TABLE IF EXISTS positions CASCADE;
+-- Исходная схема базы данных
 
 -- Расширение для временных интервалов
 CREATE EXTENSION IF NOT EXISTS btree_gist;
@@ -162,7 +147,7 @@ CREATE TABLE event_participants (
 );
 
 -- Таблица сессий пользователей
-CREATE TABLE IF NOT EXISTS user_sessions (
+CREATE TABLE user_sessions (
     id SERIAL PRIMARY KEY,
     user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
     session_token TEXT NOT NULL UNIQUE,
@@ -0,0 +1,12 @@
+-- migrate: no-transaction
+-- Индексы для диапазонных выборок мероприятий и бронирований по мероприятию.
+-- CONCURRENTLY не блокирует запись, поэтому миграция выполняется вне транзакции.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_start_time_id
+    ON events (start_time, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_events_end_time
+    ON events (end_time);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_resource_bookings_event_type
+    ON resource_bookings (event_id, resource_type);
@@ -0,0 +1,42 @@
+-- Фоновые задания синхронизации внешних ресурсов и инкрементальные upsert'ы.
+
+CREATE TABLE sync_jobs (
+    id SERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'cancelled')),
+    total INT,
+    processed INT NOT NULL DEFAULT 0,
+    inserted INT NOT NULL DEFAULT 0,
+    updated INT NOT NULL DEFAULT 0,
+    skipped INT NOT NULL DEFAULT 0,
+    failed INT NOT NULL DEFAULT 0,
+    cancel_requested BOOLEAN NOT NULL DEFAULT FALSE,
+    error TEXT,
+    created_by INT REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
+-- Не более одного активного задания каждого вида, в том числе между воркерами
+CREATE UNIQUE INDEX idx_sync_jobs_active_kind
+    ON sync_jobs (kind) WHERE status IN ('queued', 'running');
+
+CREATE INDEX idx_sync_jobs_created_at ON sync_jobs (created_at DESC);
+
+-- Естественные ключи внешних ресурсов и хэш содержимого для пропуска неизменившихся записей
+ALTER TABLE external_contractors
+    ADD COLUMN content_hash TEXT,
+    ADD COLUMN synced_at TIMESTAMP;
+
+CREATE UNIQUE INDEX idx_external_contractors_natural_key
+    ON external_contractors (name, specialty);
+
+ALTER TABLE rooms
+    ADD COLUMN content_hash TEXT,
+    ADD COLUMN synced_at TIMESTAMP;
+
+CREATE UNIQUE INDEX idx_rooms_external_natural_key
+    ON rooms (name, address) WHERE is_external;
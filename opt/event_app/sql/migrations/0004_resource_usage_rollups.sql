@@ -0,0 +1,70 @@
+-- Суточные агрегаты занятости помещений и сотрудников.
+-- Поддерживаются триггером на resource_bookings: каждое бронирование
+-- раскладывается по затронутым суткам, поэтому аналитика читает
+-- по одной строке на ресурс и сутки, а не все бронирования периода.
+
+CREATE TABLE resource_usage_daily (
+    resource_type VARCHAR(10) NOT NULL,
+    resource_id INT NOT NULL,
+    day DATE NOT NULL,
+    booked_seconds BIGINT NOT NULL DEFAULT 0,
+    -- Бронирования, затрагивающие эти сутки
+    bookings INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (resource_type, resource_id, day)
+);
+
+CREATE INDEX idx_resource_usage_daily_type_day ON resource_usage_daily (resource_type, day);
+
+CREATE OR REPLACE FUNCTION resource_usage_apply(
+    p_type VARCHAR, p_id INT, p_start TIMESTAMP, p_end TIMESTAMP, p_sign INT
+) RETURNS void AS $$
+BEGIN
+    INSERT INTO resource_usage_daily (resource_type, resource_id, day, booked_seconds, bookings)
+    SELECT p_type, p_id, d::date,
+           p_sign * EXTRACT(EPOCH FROM LEAST(p_end, d + INTERVAL '1 day') - GREATEST(p_start, d))::BIGINT,
+           p_sign
+    FROM generate_series(date_trunc('day', p_start), p_end - INTERVAL '1 microsecond', INTERVAL '1 day') AS d
+    ON CONFLICT (resource_type, resource_id, day) DO UPDATE SET
+        booked_seconds = resource_usage_daily.booked_seconds + EXCLUDED.booked_seconds,
+        bookings = resource_usage_daily.bookings + EXCLUDED.bookings;
+
+    IF p_sign < 0 THEN
+        DELETE FROM resource_usage_daily
+        WHERE resource_type = p_type AND resource_id = p_id
+          AND day BETWEEN p_start::date AND p_end::date
+          AND bookings <= 0;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION resource_usage_on_booking() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM resource_usage_apply(OLD.resource_type, OLD.resource_id, OLD.start_time, OLD.end_time, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM resource_usage_apply(NEW.resource_type, NEW.resource_id, NEW.start_time, NEW.end_time, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION resource_usage_on_truncate() RETURNS trigger AS $$
+BEGIN
+    TRUNCATE resource_usage_daily;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_resource_usage_on_booking
+    AFTER INSERT OR DELETE OR UPDATE OF resource_type, resource_id, start_time, end_time
+    ON resource_bookings
+    FOR EACH ROW EXECUTE FUNCTION resource_usage_on_booking();
+
+CREATE TRIGGER trg_resource_usage_on_truncate
+    AFTER TRUNCATE ON resource_bookings
+    FOR EACH STATEMENT EXECUTE FUNCTION resource_usage_on_truncate();
+
+-- Агрегаты по уже существующим бронированиям
+SELECT resource_usage_apply(resource_type, resource_id, start_time, end_time, 1)
+FROM resource_bookings;
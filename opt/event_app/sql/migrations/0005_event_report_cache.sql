@@ -0,0 +1,56 @@
+-- Кэш отчетов о деятельности в event_reports.
+-- Запись находится по хэшу канонических параметров и удаляется триггерами,
+-- как только меняется мероприятие или бронирование, пересекающее период отчета.
+
+ALTER TABLE event_reports
+    ADD COLUMN params_hash TEXT,
+    ADD COLUMN period_start TIMESTAMP,
+    ADD COLUMN period_end TIMESTAMP,
+    ADD COLUMN row_count INT,
+    ADD COLUMN generation_ms NUMERIC(12,1),
+    ADD COLUMN hits INT NOT NULL DEFAULT 0,
+    ADD COLUMN last_hit_at TIMESTAMP;
+
+CREATE UNIQUE INDEX idx_event_reports_params ON event_reports (report_type, params_hash);
+
+CREATE INDEX idx_event_reports_period ON event_reports
+    USING gist (tsrange(period_start, period_end, '[]'))
+    WHERE params_hash IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION event_reports_invalidate(p_start TIMESTAMP, p_end TIMESTAMP) RETURNS void AS $$
+    DELETE FROM event_reports
+    WHERE params_hash IS NOT NULL
+      AND tsrange(period_start, period_end, '[]') && tsrange(p_start, p_end, '[]');
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION event_reports_on_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM event_reports_invalidate(OLD.start_time, OLD.end_time);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM event_reports_invalidate(NEW.start_time, NEW.end_time);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Название помещения входит в строки отчета за любой период
+CREATE OR REPLACE FUNCTION event_reports_on_room_rename() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM event_reports WHERE params_hash IS NOT NULL;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_event_reports_on_event
+    AFTER INSERT OR UPDATE OR DELETE ON events
+    FOR EACH ROW EXECUTE FUNCTION event_reports_on_change();
+
+CREATE TRIGGER trg_event_reports_on_booking
+    AFTER INSERT OR UPDATE OR DELETE ON resource_bookings
+    FOR EACH ROW EXECUTE FUNCTION event_reports_on_change();
+
+CREATE TRIGGER trg_event_reports_on_room_rename
+    AFTER UPDATE OF name ON rooms
+    FOR EACH STATEMENT EXECUTE FUNCTION event_reports_on_room_rename();
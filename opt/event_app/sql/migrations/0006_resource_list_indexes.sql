@@ -0,0 +1,9 @@
+-- migrate: no-transaction
+-- Индексы для постраничных списков на странице /rooms: сортировка по
+-- умолчанию отдает первую страницу без сортировки всей таблицы.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_rooms_name_id
+    ON rooms (name, id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_employees_full_name_id
+    ON employees (full_name, id);
@@ -0,0 +1,12 @@
+-- Токены сброса пароля, общие для всех воркеров.
+-- Хранится только хэш токена; индекс по сроку действия нужен периодической очистке.
+
+CREATE TABLE password_reset_tokens (
+    token_hash CHAR(64) PRIMARY KEY,
+    user_id INT NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    expires_at TIMESTAMP NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_password_reset_tokens_expires_at ON password_reset_tokens (expires_at);
+CREATE INDEX idx_password_reset_tokens_user_id ON password_reset_tokens (user_id);
@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Индекс для фоновой очистки истекших сессий: удаление пачками идет по
+-- expires_at без полного просмотра таблицы.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_user_sessions_expires_at
+    ON user_sessions (expires_at);
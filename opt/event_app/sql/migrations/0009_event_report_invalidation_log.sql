@@ -0,0 +1,45 @@
+-- Журнал сброса кэша отчетов.
+-- Отчет, построенный до изменения, не должен попасть в кэш после того, как
+-- триггер уже удалил записи за этот период. Каждый сброс записывается с
+-- номером транзакции; перед сохранением отчета проверяется, нет ли в журнале
+-- сброса по пересекающемуся периоду из транзакции, не видимой в снимке, на
+-- котором отчет строился. Триггеры по строкам отложены до фиксации, чтобы
+-- сброс и запись в журнал происходили вместе с появлением изменений.
+
+CREATE TABLE event_report_invalidations (
+    id BIGSERIAL PRIMARY KEY,
+    txid BIGINT NOT NULL DEFAULT txid_current(),
+    period_start TIMESTAMP,             -- NULL - все периоды
+    period_end TIMESTAMP,
+    invalidated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_event_report_invalidations_at ON event_report_invalidations (invalidated_at);
+
+CREATE OR REPLACE FUNCTION event_reports_invalidate(p_start TIMESTAMP, p_end TIMESTAMP) RETURNS void AS $$
+    INSERT INTO event_report_invalidations (period_start, period_end) VALUES (p_start, p_end);
+    DELETE FROM event_reports
+    WHERE params_hash IS NOT NULL
+      AND tsrange(period_start, period_end, '[]') && tsrange(p_start, p_end, '[]');
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION event_reports_on_room_rename() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO event_report_invalidations (period_start, period_end) VALUES (NULL, NULL);
+    DELETE FROM event_reports WHERE params_hash IS NOT NULL;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER trg_event_reports_on_event ON events;
+DROP TRIGGER trg_event_reports_on_booking ON resource_bookings;
+
+CREATE CONSTRAINT TRIGGER trg_event_reports_on_event
+    AFTER INSERT OR UPDATE OR DELETE ON events
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION event_reports_on_change();
+
+CREATE CONSTRAINT TRIGGER trg_event_reports_on_booking
+    AFTER INSERT OR UPDATE OR DELETE ON resource_bookings
+    DEFERRABLE INITIALLY DEFERRED
+    FOR EACH ROW EXECUTE FUNCTION event_reports_on_change();
@@ -0,0 +1,427 @@
+"""
+Фоновая синхронизация внешних ресурсов: специалистов с hh.ru и помещений с flamp.
+
+Задание записывается в таблицу sync_jobs и выполняется задачей asyncio, так что
+HTTP-запрос сразу возвращает номер задания. Записи пишутся пачками через
+INSERT ... ON CONFLICT DO UPDATE по естественному ключу; строка с тем же
+хэшем содержимого не переписывается и считается пропущенной. После каждой
+пачки сохраняется прогресс и проверяется запрос отмены. Соединение из пула
+берется только на время записи пачки, а не на все задание.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional
+
+import asyncpg
+
+from database import acquire
+
+
+logger = logging.getLogger(__name__)
+
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "500"))
+SYNC_FLUSH_INTERVAL = float(os.getenv("SYNC_FLUSH_INTERVAL", "5"))
+# Задание без отметки дольше этого срока считается брошенным (воркер остановлен)
+SYNC_JOB_STALE_SECONDS = int(os.getenv("SYNC_JOB_STALE_SECONDS", "300"))
+
+ACTIVE_STATUSES = ["queued", "running"]
+
+JOB_COLUMNS = """
+    id, kind, status, total, processed, inserted, updated, skipped, failed,
+    cancel_requested, error, created_by, created_at, started_at, heartbeat_at, finished_at
+"""
+
+
+class SyncJobConflict(Exception):
+    """Задание этого вида уже выполняется"""
+
+    def __init__(self, job_id: int):
+        super().__init__(f"Синхронизация уже выполняется (задание {job_id})")
+        self.job_id = job_id
+
+
+def content_hash(values: dict) -> str:
+    return hashlib.sha256(
+        json.dumps(values, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class SyncKind:
+    """
+    Вид синхронизации.
+
+    row превращает запись источника в словарь колонок таблицы; key - колонки
+    естественного ключа (дубли внутри пачки схлопываются по нему); upsert -
+    запрос, принимающий массивы колонок в порядке columns и хэши последним
+    параметром.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        columns: List[str],
+        key: List[str],
+        upsert: str,
+        row: Callable[[dict], dict],
+        feed: Callable[[], List[dict]],
+        fetch_many: Callable[[Iterable[str]], AsyncIterator[tuple]]
+    ):
+        self.name = name
+        self.columns = columns
+        self.key = key
+        self.upsert = upsert
+        self.row = row
+        self.feed = feed
+        self.fetch_many = fetch_many
+
+
+CONTRACTORS_UPSERT = """
+    INSERT INTO external_contractors AS c
+        (name, specialty, contact_info, rating, price_per_hour, content_hash, synced_at)
+    SELECT s.name, s.specialty, s.contact_info, COALESCE(s.rating, 0.0), s.price_per_hour, s.content_hash, NOW()
+    FROM unnest($1::text[], $2::text[], $3::text[], $4::numeric[], $5::numeric[], $6::text[])
+        AS s(name, specialty, contact_info, rating, price_per_hour, content_hash)
+    ON CONFLICT (name, specialty) DO UPDATE SET
+        contact_info = EXCLUDED.contact_info,
+        rating = EXCLUDED.rating,
+        price_per_hour = EXCLUDED.price_per_hour,
+        content_hash = EXCLUDED.content_hash,
+        synced_at = NOW()
+    WHERE c.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+    RETURNING (xmax = 0) AS inserted
+"""
+
+VENUES_UPSERT = """
+    INSERT INTO rooms AS r
+        (name, address, capacity, description, room_type_id, image_filename, external_url,
+         is_external, content_hash, synced_at)
+    SELECT s.name, s.address, s.capacity, s.description, s.room_type_id, s.image_filename, s.external_url,
+           TRUE, s.content_hash, NOW()
+    FROM unnest($1::text[], $2::text[], $3::int[], $4::text[], $5::int[], $6::text[], $7::text[], $8::text[])
+        AS s(name, address, capacity, description, room_type_id, image_filename, external_url, content_hash)
+    ON CONFLICT (name, address) WHERE is_external DO UPDATE SET
+        capacity = EXCLUDED.capacity,
+        description = EXCLUDED.description,
+        room_type_id = EXCLUDED.room_type_id,
+        image_filename = COALESCE(EXCLUDED.image_filename, r.image_filename),
+        external_url = EXCLUDED.external_url,
+        content_hash = EXCLUDED.content_hash,
+        synced_at = NOW()
+    WHERE r.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+    RETURNING (xmax = 0) AS inserted
+"""
+
+
+class InvalidItem(ValueError):
+    """Запись фида не подходит для таблицы; считается неудачной, задание продолжается"""
+
+
+def _require(row: dict, fields: Iterable[str]) -> dict:
+    missing = [field for field in fields if row[field] in (None, "")]
+    if missing:
+        raise InvalidItem(f"нет обязательных полей: {', '.join(missing)}")
+    return row
+
+
+def _number(value, cast):
+    if value in (None, ""):
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        raise InvalidItem(f"не число: {value!r}")
+
+
+def _contractor_row(item: dict) -> dict:
+    # Результат hh_parser.format_for_db или запись фида
+    return _require({
+        "name": item.get("name") or item.get("full_name"),
+        "specialty": item.get("specialty") or item.get("position"),
+        "contact_info": item.get("contact_info") or "Не указано",
+        "rating": _number(item.get("rating"), float),
+        "price_per_hour": _number(item.get("price_per_hour"), float),
+    }, ("name", "specialty"))
+
+
+def _venue_row(item: dict) -> dict:
+    # Результат flamp_parser.format_for_db или запись фида
+    external_url = item.get("external_url") or (item.get("external_data") or {}).get("source_url")
+    return _require({
+        "name": item.get("name"),
+        "address": item.get("address"),
+        "capacity": _number(item.get("capacity"), int),
+        "description": item.get("description"),
+        "room_type_id": _number(item.get("room_type_id"), int),
+        "image_filename": item.get("image_filename"),
+        "external_url": external_url,
+    }, ("name", "address", "capacity"))
+
+
+def _contractors_feed() -> List[dict]:
+    """Специалисты по умолчанию, пока не переданы адреса резюме"""
+    return [
+        {
+            "name": "Иванов Иван Иванович",
+            "specialty": "Охранник",
+            "contact_info": "https://hh.ru/resume/123",
+            "rating": 4.5,
+            "price_per_hour": 500
+        }
+    ]
+
+
+def _venues_feed() -> List[dict]:
+    """Помещения по умолчанию, пока не переданы адреса заведений"""
+    return [
+        {
+            "name": "Чердак (ночной клуб)",
+            "address": "ул. Ленина, 1",
+            "capacity": 100,
+            "description": "Ночной клуб с танцполом",
+            "room_type_id": 1,
+            "image_filename": None
+        }
+    ]
+
+
+async def _fetch_resumes(urls):
+    from parsers.hh_parser import fetch_hh_resumes, format_for_db
+    async for url, result in fetch_hh_resumes(urls):
+        yield url, format_for_db(result) if result is not None else None
+
+
+async def _fetch_venues(urls):
+    from parsers.flamp_parser import fetch_flamp_venues, format_for_db
+    async for url, result in fetch_flamp_venues(urls):
+        yield url, format_for_db(result) if result is not None else None
+
+
+SYNC_KINDS: Dict[str, SyncKind] = {
+    "hh_contractors": SyncKind(
+        name="hh_contractors",
+        columns=["name", "specialty", "contact_info", "rating", "price_per_hour"],
+        key=["name", "specialty"],
+        upsert=CONTRACTORS_UPSERT,
+        row=_contractor_row,
+        feed=_contractors_feed,
+        fetch_many=_fetch_resumes,
+    ),
+    "flamp_venues": SyncKind(
+        name="flamp_venues",
+        columns=["name", "address", "capacity", "description", "room_type_id", "image_filename", "external_url"],
+        key=["name", "address"],
+        upsert=VENUES_UPSERT,
+        row=_venue_row,
+        feed=_venues_feed,
+        fetch_many=_fetch_venues,
+    ),
+}
+
+
+async def _items(kind: SyncKind, urls: Optional[List[str]]) -> AsyncIterator[Optional[dict]]:
+    """Записи источника; None - страницу не удалось загрузить или разобрать"""
+    if not urls:
+        for item in kind.feed():
+            yield item
+        return
+    async for _, item in kind.fetch_many(urls):
+        yield item
+
+
+async def upsert_batch(conn, kind: SyncKind, items: List[dict]) -> dict:
+    """
+    Пачка строк (уже прошедших kind.row) одним запросом; возвращает число
+    добавленных, обновленных и пропущенных
+    """
+    rows = {}
+    for row in items:
+        rows[tuple(row[k] for k in kind.key)] = row
+    rows = list(rows.values())
+    columns = [[row[c] for row in rows] for c in kind.columns]
+    hashes = [content_hash(row) for row in rows]
+
+    result = await conn.fetch(kind.upsert, *columns, hashes)
+    inserted = sum(1 for r in result if r["inserted"])
+    return {
+        "inserted": inserted,
+        "updated": len(result) - inserted,
+        # Неизменившиеся строки и дубли внутри пачки
+        "skipped": len(items) - len(result),
+    }
+
+
+class SyncJobRunner:
+    def __init__(self, batch_size: int = SYNC_BATCH_SIZE, flush_interval: float = SYNC_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._cancelled = set()
+
+    async def start(
+        self,
+        conn,
+        kind: str,
+        urls: Optional[List[str]] = None,
+        user_id: Optional[int] = None
+    ) -> dict:
+        """Постановка задания; SyncJobConflict, если задание этого вида уже выполняется"""
+        if kind not in SYNC_KINDS:
+            raise ValueError(f"Неизвестный вид синхронизации: {kind}")
+        urls = list(dict.fromkeys(urls)) if urls else None
+
+        async with conn.transaction():
+            # Задания воркеров, остановленных посреди работы, иначе навсегда заняли бы вид
+            await conn.execute(
+                """
+                UPDATE sync_jobs
+                SET status = 'failed', error = 'Задание прервано', finished_at = NOW()
+                WHERE kind = $1 AND status = ANY($2::text[])
+                  AND COALESCE(heartbeat_at, created_at) < NOW() - make_interval(secs => $3)
+                """,
+                kind, ACTIVE_STATUSES, SYNC_JOB_STALE_SECONDS
+            )
+            try:
+                async with conn.transaction():
+                    job = await conn.fetchrow(
+                        f"""
+                        INSERT INTO sync_jobs (kind, total, created_by, heartbeat_at)
+                        VALUES ($1, $2, $3, NOW())
+                        RETURNING {JOB_COLUMNS}
+                        """,
+                        kind, len(urls) if urls else len(SYNC_KINDS[kind].feed()), user_id
+                    )
+            except asyncpg.UniqueViolationError:
+                active_id = await conn.fetchval(
+                    "SELECT id FROM sync_jobs WHERE kind = $1 AND status = ANY($2::text[])",
+                    kind, ACTIVE_STATUSES
+                )
+                raise SyncJobConflict(active_id)
+
+        job = dict(job)
+        self._tasks[job["id"]] = asyncio.create_task(self._run(job["id"], SYNC_KINDS[kind], urls))
+        return job
+
+    async def get(self, conn, job_id: int) -> Optional[dict]:
+        row = await conn.fetchrow(f"SELECT {JOB_COLUMNS} FROM sync_jobs WHERE id = $1", job_id)
+        return dict(row) if row else None
+
+    async def recent(self, conn, limit: int = 20) -> List[dict]:
+        rows = await conn.fetch(
+            f"SELECT {JOB_COLUMNS} FROM sync_jobs ORDER BY created_at DESC LIMIT $1", limit
+        )
+        return [dict(r) for r in rows]
+
+    async def cancel(self, conn, job_id: int) -> Optional[dict]:
+        """Запрос отмены; задание остановится после текущей записи"""
+        row = await conn.fetchrow(
+            f"""
+            UPDATE sync_jobs SET cancel_requested = TRUE
+            WHERE id = $1 AND status = ANY($2::text[])
+            RETURNING {JOB_COLUMNS}
+            """,
+            job_id, ACTIVE_STATUSES
+        )
+        if row is None:
+            return None
+        # Задание этого воркера узнает об отмене сразу, не дожидаясь записи пачки
+        self._cancelled.add(job_id)
+        return dict(row)
+
+    async def _flush(self, job_id: int, kind: SyncKind, batch: List[dict], failed: int) -> bool:
+        """Запись пачки и прогресса в одной транзакции; True, если запрошена отмена"""
+        async with acquire() as conn:
+            async with conn.transaction():
+                counts = {"inserted": 0, "updated": 0, "skipped": 0}
+                if batch:
+                    counts = await upsert_batch(conn, kind, batch)
+                cancel_requested = await conn.fetchval(
+                    """
+                    UPDATE sync_jobs SET
+                        processed = processed + $2,
+                        inserted = inserted + $3,
+                        updated = updated + $4,
+                        skipped = skipped + $5,
+                        failed = failed + $6,
+                        heartbeat_at = NOW()
+                    WHERE id = $1
+                    RETURNING cancel_requested
+                    """,
+                    job_id, len(batch) + failed,
+                    counts["inserted"], counts["updated"], counts["skipped"], failed
+                )
+        return bool(cancel_requested) or job_id in self._cancelled
+
+    async def _finish(self, job_id: int, status: str, error: Optional[str] = None):
+        async with acquire() as conn:
+            await conn.execute(
+                """
+                UPDATE sync_jobs SET status = $2, error = $3, finished_at = NOW(), heartbeat_at = NOW()
+                WHERE id = $1
+                """,
+                job_id, status, error
+            )
+
+    async def _run(self, job_id: int, kind: SyncKind, urls: Optional[List[str]]):
+        try:
+            async with acquire() as conn:
+                await conn.execute(
+                    "UPDATE sync_jobs SET status = 'running', started_at = NOW(), heartbeat_at = NOW() WHERE id = $1",
+                    job_id
+                )
+
+            batch = []
+            failed = 0
+            flushed_at = time.monotonic()
+            async for item in _items(kind, urls):
+                if job_id in self._cancelled:
+                    break
+                if item is None:
+                    failed += 1
+                else:
+                    # Одна неполная запись не должна ронять пачку и задание
+                    try:
+                        batch.append(kind.row(item))
+                    except InvalidItem as e:
+                        failed += 1
+                        logger.warning("Пропущена запись %s (задание %s): %s", kind.name, job_id, e)
+                if len(batch) >= self.batch_size or time.monotonic() - flushed_at >= self.flush_interval:
+                    if await self._flush(job_id, kind, batch, failed):
+                        break
+                    batch, failed = [], 0
+                    flushed_at = time.monotonic()
+            else:
+                if not await self._flush(job_id, kind, batch, failed):
+                    await self._finish(job_id, "succeeded")
+                    return
+
+            await self._finish(job_id, "cancelled")
+        except asyncio.CancelledError:
+            await asyncio.shield(self._finish(job_id, "failed", "Задание прервано остановкой приложения"))
+            raise
+        except Exception as e:
+            logger.exception("Ошибка синхронизации %s (задание %s)", kind.name, job_id)
+            await self._finish(job_id, "failed", str(e))
+        finally:
+            self._tasks.pop(job_id, None)
+            self._cancelled.discard(job_id)
+
+    async def shutdown(self):
+        """Остановка выполняющихся заданий перед закрытием пула"""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "running": sorted(self._tasks),
+            "batch_size": self.batch_size,
+            "flush_interval": self.flush_interval,
+        }
+
+
+sync_jobs = SyncJobRunner()